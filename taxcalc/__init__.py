@@ -7,9 +7,12 @@ from .growth import *
 from .records import *
 from .simpletaxio import *
 from .incometaxio import *
+from .household import *
+from .server import CalculatorServer, CalculatorClient
 from .utils import *
 from .decorators import *
 from .macro_elasticity import *
+from .profiling import Profiler
 from .dropq import *
 
 from ._version import get_versions
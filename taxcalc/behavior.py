@@ -10,6 +10,7 @@ import copy
 import numpy as np
 from .policy import Policy
 from .parameters import ParametersBase
+from .profiling import profiled
 
 
 class Behavior(ParametersBase):
@@ -44,6 +45,9 @@ class Behavior(ParametersBase):
     DEFAULTS_FILENAME = 'behavior.json'
     DEFAULT_NUM_YEARS = Policy.DEFAULT_NUM_YEARS
 
+    # records variables changed by the behavioral response
+    RESPONSE_VARS = ['e00200', 'e00200p', 'e00300', 'e19200', 'p23250']
+
     def __init__(self, behavior_dict=None,
                  start_year=JSON_START_YEAR,
                  num_years=DEFAULT_NUM_YEARS):
@@ -91,6 +95,7 @@ class Behavior(ParametersBase):
             return True
 
     @staticmethod
+    @profiled('Behavior.response')
     def response(calc_x, calc_y):
         """
         Modify calc_y records to account for behavioral responses that arise
@@ -171,8 +176,16 @@ class Behavior(ParametersBase):
         calc_y_behv = copy.deepcopy(calc_y)
         calc_y_behv = Behavior._update_ordinary_income(taxinc_chg, calc_y_behv)
         calc_y_behv = Behavior._update_cap_gain_income(ltcg_chg, calc_y_behv)
-        # Recalculate post-reform taxes incorporating behavioral responses
-        calc_y_behv.calc_all()
+        # Recalculate post-reform taxes incorporating behavioral responses,
+        # which requires calling only the functions that depend on the
+        # changed income sources when calc_y.mtr has called calc_all
+        mtr_called = (calc_y.behavior.BE_sub != 0.0 or
+                      calc_y.behavior.BE_inc != 0.0 or
+                      calc_y.behavior.BE_cg != 0.0)
+        if mtr_called:
+            calc_y_behv.recalc(Behavior.RESPONSE_VARS)
+        else:
+            calc_y_behv.calc_all()
         return calc_y_behv
 
     # ----- begin private methods of Behavior class -----
@@ -16,13 +16,17 @@ import json
 import re
 import copy
 import numpy as np
+import pandas as pd
 from .utils import *
 from .functions import *
 from .policy import Policy
-from .records import Records
+from .records import Records, RecordsView
 from .behavior import Behavior
 from .growth import Growth
 from .consumption import Consumption
+from .decorators import make_fused_function
+from . import profiling
+from .profiling import profiled
 # import pdb
 
 
@@ -77,6 +81,13 @@ class Calculator(object):
         "effective" marginal tax rates; default is None, which implies
         no consumption responses.
 
+    fuse_kernels: boolean
+        specifies whether or not each sequence of tax-calculating functions
+        in calc_all() is executed as a single fused function that does all
+        the calculations for one record before moving on to the next record
+        (rather than by calling each function for all the records in turn);
+        default value is false.
+
     Raises
     ------
     ValueError:
@@ -89,7 +100,7 @@ class Calculator(object):
 
     def __init__(self, policy=None, records=None, verbose=True,
                  sync_years=True, behavior=None, growth=None,
-                 consumption=None):
+                 consumption=None, fuse_kernels=False):
         if isinstance(policy, Policy):
             self.policy = policy
         else:
@@ -125,6 +136,11 @@ class Calculator(object):
                 self.consumption.set_year(next_year)
         else:
             raise ValueError('consumption must be None or Consumption object')
+        self.fuse_kernels = fuse_kernels
+        # income tax liability without the itemized deductions specified by
+        # an ID_switch, which is computed by the ComputeBenefit function and
+        # saved only while calc_all runs (keyed by ID_switch tuple)
+        self._no_ID_iitax = None
         if sync_years and self.records.current_year == Records.PUF_YEAR:
             if verbose:
                 print('You loaded data for ' +
@@ -135,93 +151,334 @@ class Calculator(object):
                     for var in self.records.IGNORED_VARS:
                         print('  ' +
                               var)
-            while self.records.current_year < self.policy.current_year:
-                next_year = self.records.current_year + 1
+            # apply growth adjustments to the blowup factors for each year
+            # and then extrapolate the records to the policy year
+            first_year = self.records.current_year + 1
+            for next_year in range(first_year, self.policy.current_year + 1):
                 if next_year >= self.growth.start_year:
                     self.growth.set_year(next_year)
                     self.growth.apply_change(self.records)
-                self.records.increment_year()
+            self.records.advance_to_year(self.policy.current_year)
             if verbose:
                 print('Instantiation of the calculator automatically ' +
                       'extrapolated your data to ' +
                       str(self.records.current_year) + '.')
         assert self.policy.current_year == self.records.current_year
 
-    def TaxInc_to_AMT(self):
-        TaxInc(self.policy, self.records)
-        SchXYZTax(self.policy, self.records)
-        GainsTax(self.policy, self.records)
-        AGIsurtax(self.policy, self.records)
-        NetInvIncTax(self.policy, self.records)
-        AMT(self.policy, self.records)
+    # fused functions shared by all Calculator objects, keyed by the
+    # sequence of tax-calculating functions (followed by the name of the
+    # variable used to choose among alternatives, if any)
+    _FUSED_FUNCTIONS = dict()
 
-    def calc_one_year(self, zero_out_calc_vars=False):
-        # calls all the functions except those in calc_all() function
-        if zero_out_calc_vars:
-            self.records.zero_out_changing_calculated_vars()
-        # pdb.set_trace()
-        EI_PayrollTax(self.policy, self.records)
-        DependentCare(self.policy, self.records)
-        Adj(self.policy, self.records)
-        if self.policy.ALD_InvInc_ec_base_code_active:
-            ALD_InvInc_ec_base_code(self)
+    def _calc_functions(self, *funcs):
+        # calls the specified iterate_jit functions in order, either one at
+        # a time or as a single fused function when fuse_kernels is true
+        if self.fuse_kernels and len(funcs) > 1:
+            fused = Calculator._FUSED_FUNCTIONS.get(funcs, None)
+            if fused is None:
+                fused = make_fused_function(funcs)
+                Calculator._FUSED_FUNCTIONS[funcs] = fused
+            fused(self.policy, self.records)
         else:
-            ALD_InvInc_ec_base_nocode(self.policy, self.records)
-        CapGains(self.policy, self.records)
-        SSBenefits(self.policy, self.records)
-        AGI(self.policy, self.records)
-        ItemDed(self.policy, self.records)
-        AdditionalMedicareTax(self.policy, self.records)
-        StdDed(self.policy, self.records)
-        # Store calculated standard deduction, calculate
-        # taxes with standard deduction, store AMT + Regular Tax
+            for func in funcs:
+                func(self.policy, self.records, return_dataframe=False)
+
+    def TaxInc_to_AMT(self):
+        self._calc_functions(TaxInc, SchXYZTax, GainsTax,
+                             AGIsurtax, NetInvIncTax, AMT)
+
+    # the first alternative has no itemized deductions and the second has
+    # no standard deduction
+    _DEDUCTION_ALTERNATIVES = [{'c04470': 0., 'c21060': 0.},
+                               {'_standard': 0.}]
+    _BEST_DEDUCTION_FUNCS = (TaxInc, SchXYZTax, GainsTax,
+                             AGIsurtax, NetInvIncTax, AMT)
+
+    def TaxInc_to_AMT_with_best_deduction(self):
+        # calculates taxes for each filing unit in a single pass with both
+        # deduction alternatives, writing only the results that imply the
+        # smaller c05800 (and the standard deduction results when tied)
+        if self.policy.AGI_surtax_trt > 0.:
+            # AGIsurtax adds to _surtax, so only the three passes below
+            # give the _surtax values this has always produced
+            self.TaxInc_to_AMT_three_passes()
+            return
+        funcs = Calculator._BEST_DEDUCTION_FUNCS
+        key = funcs + ('c05800',)
+        fused = Calculator._FUSED_FUNCTIONS.get(key, None)
+        if fused is None:
+            fused = make_fused_function(
+                funcs, alternatives=Calculator._DEDUCTION_ALTERNATIVES,
+                choose_var='c05800')
+            Calculator._FUSED_FUNCTIONS[key] = fused
+        fused(self.policy, self.records)
+
+    def TaxInc_to_AMT_three_passes(self):
+        # calculates taxes with the standard deduction, then with itemized
+        # deductions, and then with the deduction that implies the lower
+        # c05800 (the standard deduction when tied)
         std = copy.deepcopy(self.records._standard)
         item = copy.deepcopy(self.records.c04470)
         item_no_limit = copy.deepcopy(self.records.c21060)
-        self.records.c04470 = np.zeros(self.records.dim)
-        self.records.c21060 = np.zeros(self.records.dim)
+        self.records.c04470[:] = 0.
+        self.records.c21060[:] = 0.
         self.TaxInc_to_AMT()
         std_taxes = copy.deepcopy(self.records.c05800)
-        # Set standard deduction to zero, calculate taxes w/o
-        # standard deduction, and store AMT + Regular Tax
-        self.records._standard = np.zeros(self.records.dim)
-        self.records.c21060 = item_no_limit
-        self.records.c04470 = item
+        self.records._standard[:] = 0.
+        self.records.c21060[:] = item_no_limit
+        self.records.c04470[:] = item
         self.TaxInc_to_AMT()
         item_taxes = copy.deepcopy(self.records.c05800)
-        # Replace standard deduction with zero where the taxpayer
-        # would be better off itemizing
-        self.records._standard[:] = np.where(item_taxes < std_taxes,
-                                             0., std)
-        self.records.c04470[:] = np.where(item_taxes < std_taxes,
-                                          item, 0.)
-        self.records.c21060[:] = np.where(item_taxes < std_taxes,
-                                          item_no_limit, 0.)
-        # Calculate taxes with optimal itemized deduction
+        itemize = item_taxes < std_taxes
+        self.records._standard[:] = np.where(itemize, 0., std)
+        self.records.c04470[:] = np.where(itemize, item, 0.)
+        self.records.c21060[:] = np.where(itemize, item_no_limit, 0.)
         self.TaxInc_to_AMT()
-        F2441(self.policy, self.records)
-        EITC(self.policy, self.records)
-        ChildTaxCredit(self.policy, self.records)
-        AmOppCreditParts(self.policy, self.records)
-        SchR(self.policy, self.records)
-        EducationTaxCredit(self.policy, self.records)
-        NonrefundableCredits(self.policy, self.records)
-        AdditionalCTC(self.policy, self.records)
-        C1040(self.policy, self.records)
+
+    def _calc_stages(self, one_year_only=False):
+        # returns the sequence of stages called by calc_one_year (or by
+        # calc_all when one_year_only is false), where each stage is either
+        # a tuple of iterate_jit functions called by _calc_functions or a
+        # function called with this Calculator object as its argument
+        stages = [(EI_PayrollTax, DependentCare, Adj)]
+        if self.policy.ALD_InvInc_ec_base_code_active:
+            stages.append(ALD_InvInc_ec_base_code)
+        else:
+            stages.append((ALD_InvInc_ec_base_nocode,))
+        stages.append((CapGains, SSBenefits, AGI, ItemDed,
+                       AdditionalMedicareTax, StdDed))
+        # Calculate taxes with the standard deduction and with itemized
+        # deductions, keeping the results for the deduction that implies
+        # the lower regular plus AMT tax liability for each filing unit
+        stages.append(Calculator.TaxInc_to_AMT_with_best_deduction)
+        stages.append((F2441, EITC, ChildTaxCredit, AmOppCreditParts,
+                       SchR, EducationTaxCredit, NonrefundableCredits,
+                       AdditionalCTC, C1040))
         if self.policy.CTC_new_code_active:
-            CTC_new_code(self)
+            stages.append(CTC_new_code)
+        else:
+            stages.append((CTC_new_nocode,))
+        stages.append((IITAX,))
+        if not one_year_only:
+            # BenefitSurtax and BenefitLimitation do nothing when inactive
+            if self.policy.ID_BenefitSurtax_crt != 1.:
+                stages.append(BenefitSurtax)
+            if self.policy.ID_BenefitCap_rt != 1.:
+                stages.append(BenefitLimitation)
+            stages.append((FairShareTax, LumpSumTax, ExpandIncome))
+        return stages
+
+    def _calc_stage(self, stage):
+        # calls the specified stage returned by the _calc_stages method
+        if profiling.PROFILER is not None:
+            if isinstance(stage, tuple):
+                name = '+'.join(func.__name__ for func in stage)
+            else:
+                name = stage.__name__
+            profiling.PROFILER.call('stage:' + name, self._calc_stage_body,
+                                    (stage,), {})
+        else:
+            self._calc_stage_body(stage)
+
+    def _calc_stage_body(self, stage):
+        if isinstance(stage, tuple):
+            self._calc_functions(*stage)
         else:
-            CTC_new_nocode(self.policy, self.records)
-        IITAX(self.policy, self.records)
+            stage(self)
+
+    @profiled('Calculator.calc_one_year')
+    def calc_one_year(self, zero_out_calc_vars=False):
+        # calls all the functions except those in calc_all() function
+        if zero_out_calc_vars:
+            self.records.zero_out_changing_calculated_vars()
+        for stage in self._calc_stages(one_year_only=True):
+            self._calc_stage(stage)
 
+    @profiled('Calculator.calc_all')
     def calc_all(self, zero_out_calc_vars=False):
         # conducts static analysis of Calculator object for current_year
-        self.calc_one_year(zero_out_calc_vars)
-        BenefitSurtax(self)
-        BenefitLimitation(self)
-        FairShareTax(self.policy, self.records)
-        LumpSumTax(self.policy, self.records)
-        ExpandIncome(self.policy, self.records)
+        self._no_ID_iitax = dict()
+        try:
+            if zero_out_calc_vars:
+                self.records.zero_out_changing_calculated_vars()
+            for stage in self._calc_stages():
+                self._calc_stage(stage)
+        finally:
+            # the saved liabilities are stale once the records change
+            self._no_ID_iitax = None
+
+    # records variables read and written, and policy parameters used, by
+    # each stage, keyed by stage
+    _STAGE_VARIABLES = dict()
+
+    @staticmethod
+    def _stage_variables(stage):
+        # returns a (input_vars, output_vars, parameters) tuple of frozensets
+        # for the specified stage, or None when its variables are not known,
+        # where input_vars include output_vars that are also arguments
+        # because some functions add to values calculated by earlier ones
+        if stage in Calculator._STAGE_VARIABLES:
+            return Calculator._STAGE_VARIABLES[stage]
+        inputs = set()
+        outputs = set()
+        params = set()
+        if stage == Calculator.TaxInc_to_AMT_with_best_deduction:
+            funcs = Calculator._BEST_DEDUCTION_FUNCS
+            for alternative in Calculator._DEDUCTION_ALTERNATIVES:
+                inputs.update(alternative)
+                outputs.update(alternative)
+        elif isinstance(stage, tuple):
+            funcs = stage
+        else:
+            funcs = (stage,)
+        variables = (inputs, outputs, params)
+        for func in funcs:
+            if not hasattr(func, 'out_args'):
+                variables = None
+                break
+            parameters = set(getattr(func, 'parameters', []))
+            inputs.update(arg for arg in func.in_args
+                          if arg not in parameters)
+            outputs.update(func.out_args)
+            params.update(parameters)
+        if variables is not None:
+            variables = (frozenset(inputs), frozenset(outputs),
+                         frozenset(params))
+        Calculator._STAGE_VARIABLES[stage] = variables
+        return variables
+
+    def recalc(self, changed_vars, changed_params=()):
+        """
+        Recalculates the results of the calc_all method after changes in
+        the values of the records variables named in changed_vars, calling
+        only those calc_all functions that use, directly or indirectly, the
+        values of the changed variables (along with any earlier functions
+        that calculate values which those functions read and overwrite).
+        The dependencies among the functions are read from the arguments
+        and the returned variables of the iterate_jit functions.
+
+        The results are the same as those of calc_all provided calc_all was
+        called before the values were changed and the only policy changes
+        since then are changes in the current-year values of the policy
+        parameters named in changed_params.  When the dependencies of some
+        calc_all function are not known, which is the case for BenefitSurtax
+        and BenefitLimitation when they are active, calc_all is called.
+
+        Parameters
+        ----------
+        changed_vars: iterable of records variable names
+
+        changed_params: iterable of policy parameter names without the
+            leading underscore (for example, 'II_em')
+
+        Returns
+        -------
+        set of the names of the calculated records variables whose values
+        may have been changed
+        """
+        stages = self._calc_stages()
+        if not self.fuse_kernels:
+            # split each stage into single functions so that fewer
+            # functions are called
+            split_stages = list()
+            for stage in stages:
+                if isinstance(stage, tuple):
+                    split_stages.extend((func,) for func in stage)
+                else:
+                    split_stages.append(stage)
+            stages = split_stages
+        variables = [Calculator._stage_variables(stage) for stage in stages]
+        if None in variables:
+            self.calc_all()
+            return set(Records.CALCULATED_VARS)
+        # identify the earlier stages that calculate variables each stage
+        # reads and overwrites, which must be called before that stage
+        producers = list()
+        for idx, (inputs, outputs, _) in enumerate(variables):
+            producers.append(set(
+                prev for prev in range(idx)
+                if not variables[prev][1].isdisjoint(inputs & outputs)))
+        # find the stages whose input variables are changed either by
+        # changed_vars or by earlier stages that are called, or that use
+        # changed_params
+        changed_params = set(changed_params)
+        required = set(idx for idx, (_, _, params) in enumerate(variables)
+                       if not changed_params.isdisjoint(params))
+        while True:
+            changed = set(changed_vars)
+            called = list()
+            for idx, (inputs, outputs, _) in enumerate(variables):
+                if idx in required or not changed.isdisjoint(inputs):
+                    called.append(idx)
+                    changed.update(outputs)
+            missing = set()
+            for idx in called:
+                missing.update(producers[idx])
+            missing.difference_update(called)
+            if not missing:
+                break
+            required.update(missing)
+        outputs = set()
+        for idx in called:
+            self._calc_stage(stages[idx])
+            outputs.update(variables[idx][1])
+        return outputs
+
+    def sweep(self, reforms,
+              output_vars=('_iitax', '_payrolltax', '_combined')):
+        """
+        Calculates taxes for the current year under each of several policy
+        reforms of the embedded policy, sharing the embedded records among
+        all the reforms.  After calling calc_all once for the embedded
+        policy, the taxes under each reform are calculated by calling only
+        those calc_all functions that use the policy parameters changed by
+        the reform or that depend on the variables calculated by the
+        functions that are called (see the recalc method).  The embedded
+        policy and the calculated records variables are the same after
+        the sweep as after a calc_all call.
+
+        Parameters
+        ----------
+        reforms: list of reform dictionaries
+            each dictionary is suitable as the argument to the
+            Policy.implement_reform method, which is called for a copy
+            of the embedded policy.
+
+        output_vars: iterable of records variable names
+            specifies the calculated variables returned for each reform.
+
+        Returns
+        -------
+        dictionary with each output_vars name as a key and, as the value,
+        an array with one row for each reform and one column for each
+        filing unit, which contains the values of that variable.
+        """
+        output_vars = list(output_vars)
+        results = dict((var, np.zeros((len(reforms), self.records.dim)))
+                       for var in output_vars)
+        self.calc_all()
+        policy = self.policy
+        stages = self._calc_stages()
+        snapshot = self.records.snapshot(Records.CALCULATED_VARS)
+        for idx, reform in enumerate(reforms):
+            self.policy = copy.deepcopy(policy)
+            self.policy.implement_reform(copy.deepcopy(reform))
+            changed_params = [
+                name[1:] for name in policy._vals
+                if not np.array_equal(getattr(policy, name[1:]),
+                                      getattr(self.policy, name[1:]))]
+            if (self.policy.param_code != policy.param_code or
+                    self._calc_stages() != stages):
+                self.calc_all()
+                changed = Records.CALCULATED_VARS
+            else:
+                changed = self.recalc([], changed_params)
+            for var in output_vars:
+                results[var][idx] = getattr(self.records, var)
+            self.records.restore(dict((var, snapshot[var])
+                                      for var in changed))
+        self.policy = policy
+        return results
 
     def increment_year(self):
         next_year = self.policy.current_year + 1
@@ -242,10 +499,78 @@ class Calculator(object):
         if iteration < 0:
             raise ValueError('New current year must be ' +
                              'greater than current year!')
-        for _ in range(iteration):
-            self.increment_year()
+        if iteration == 0:
+            return
+        # apply growth adjustments to the blowup factors for each year and
+        # then extrapolate the records (with the same results as calling
+        # increment_year once for each year)
+        for next_year in range(self.records.current_year + 1, year + 1):
+            self.growth.set_year(next_year)
+            self.growth.apply_change(self.records)
+        self.records.advance_to_year(year)
+        self.policy.set_year(year)
+        self.behavior.set_year(year)
+        self.consumption.set_year(year)
         assert self.records.current_year == year
 
+    def iter_years(self, num_years=1, summary=None):
+        """
+        Generator that calls calc_all for each of num_years years beginning
+        with the current year and yields a (year, result) pair for each
+        year, without making a deepcopy of the Calculator object.  Instead,
+        this Calculator object is advanced from year to year in place and
+        is returned to its original year and records variable values when
+        the generator is exhausted or closed.
+
+        Parameters
+        ----------
+        num_years: integer
+            number of years (at least one) to calculate.
+
+        summary: function or None
+            when None, each result is a read-only view of the embedded
+            records, which shares its variable arrays and is valid only
+            until the next year is requested; otherwise, each result is
+            the value returned by summary(calc) for the calculated
+            Calculator object, such as a create_diagnostic_table table.
+
+        Returns
+        -------
+        generator of (year, result) tuples
+        """
+        if num_years < 1:
+            raise ValueError('num_years={} is less than one'.format(num_years))
+        last_year = self.current_year + num_years - 1
+        if last_year > self.policy.end_year:
+            msg = 'last year {} is after policy end_year {}'
+            raise ValueError(msg.format(last_year, self.policy.end_year))
+        first_year = self.current_year
+        recs = self.records
+        # save only what advancing and calculating years changes, which is
+        # much less than a deepcopy of this Calculator object
+        snapshot = recs.snapshot(recs.BLOWUP_VARS |
+                                 Records.CALCULATED_VARS)
+        s006 = recs.s006
+        blowup_factors = recs.BF.copy()
+        growth_year = self.growth.current_year
+        try:
+            for year in range(first_year, last_year + 1):
+                self.advance_to_year(year)
+                self.calc_all()
+                if summary is None:
+                    yield (year, RecordsView(self.records))
+                else:
+                    yield (year, summary(self))
+        finally:
+            recs.restore(snapshot)
+            recs.s006 = s006
+            recs.BF = blowup_factors
+            recs._current_year = first_year
+            self.policy.set_year(first_year)
+            self.behavior.set_year(first_year)
+            self.consumption.set_year(first_year)
+            self.growth.set_year(growth_year)
+
     @property
     def current_year(self):
         return self.policy.current_year
@@ -259,6 +584,7 @@ class Calculator(object):
                            'e18500', 'e19200',
                            'e26270', 'e19800']
 
+    @profiled('Calculator.mtr')
     def mtr(self, variable_str='e00200p',
             negative_finite_diff=False,
             zero_out_calculated_vars=False,
@@ -324,66 +650,158 @@ class Calculator(object):
         'e26270',  S-corporation/partnership income (also included in e02000);
         'e19800',  Charity cash contributions.
         """
-        # check validity of variable_str parameter
-        if variable_str not in Calculator.MTR_VALID_VARIABLES:
-            msg = 'mtr variable_str="{}" is not valid'
-            raise ValueError(msg.format(variable_str))
+        return self.mtrs([variable_str],
+                         negative_finite_diff=negative_finite_diff,
+                         zero_out_calculated_vars=zero_out_calculated_vars,
+                         wrt_full_compensation=wrt_full_compensation
+                         )[variable_str]
+
+    # MTR variables that are also included in another input variable,
+    # which must be changed by the same amount as the MTR variable
+    MTR_INCLUSIVE_VARIABLES = {'e00200p': 'e00200',
+                               'e00900p': 'e00900',
+                               'e00650': 'e00600',
+                               'e26270': 'e02000'}
+
+    @profiled('Calculator.mtrs')
+    def mtrs(self, variable_strs=None,
+             negative_finite_diff=False,
+             zero_out_calculated_vars=False,
+             wrt_full_compensation=True,
+             batch_size=None):
+        """
+        Calculates the marginal payroll, individual income, and combined
+        tax rates for every tax filing unit with respect to each of several
+        variables, using the same approximation as the mtr method.
+          Rather than calling calc_all twice for each variable, this method
+        calls calc_all once to compute the base level of taxes and then
+        calls the recalc method once for each batch of variables using a
+        stacked Records object (see the Records.stacked method) that
+        contains, for each variable in the batch, a copy of all the filing
+        units in which only that variable is increased by the finite_diff.
+        A batch containing just
+        one variable is handled by changing the embedded Records object in
+        place and then restoring the changed variables (see the
+        Records.snapshot and Records.restore methods).
+
+        Parameters
+        ----------
+        variable_strs: list of strings or None
+            specifies the variables with respect to which marginal tax
+            rates are computed; None implies all MTR_VALID_VARIABLES.
+
+        negative_finite_diff: boolean
+            same as in the mtr method.
+
+        zero_out_calculated_vars: boolean
+            same as in the mtr method.
+
+        wrt_full_compensation: boolean
+            same as in the mtr method.
+
+        batch_size: integer or None
+            specifies the maximum number of variables handled in one
+            calc_all call, which limits the size of the stacked Records
+            object; None implies all variables are handled in one call.
+
+        Returns
+        -------
+        dictionary with each variable string as a key and, as the value,
+        the (mtr_payrolltax, mtr_incometax, mtr_combined) tuple that the
+        mtr method returns for that variable.
+        """
+        # check validity of variable_strs and batch_size parameters
+        if variable_strs is None:
+            variable_strs = Calculator.MTR_VALID_VARIABLES
+        for variable_str in variable_strs:
+            if variable_str not in Calculator.MTR_VALID_VARIABLES:
+                msg = 'mtr variable_str="{}" is not valid'
+                raise ValueError(msg.format(variable_str))
+        variable_strs = list(variable_strs)
+        if batch_size is None:
+            batch_size = max(len(variable_strs), 1)
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError('batch_size is not a positive integer')
         # specify value for finite_diff parameter
         finite_diff = 0.01  # a one-cent difference
         if negative_finite_diff:
             finite_diff *= -1.0
-        # save records object in order to restore it after mtr computations
-        recs0 = copy.deepcopy(self.records)
-        # extract variable array(s) from embedded records object
-        variable = getattr(self.records, variable_str)
-        if variable_str == 'e00200p':
-            earnings_var = self.records.e00200
-        elif variable_str == 'e00900p':
-            seincome_var = self.records.e00900
-        elif variable_str == 'e00650':
-            divincome_var = self.records.e00600
-        elif variable_str == 'e26270':
-            schEincome_var = self.records.e02000
-        # calculate level of taxes after a marginal increase in income
-        setattr(self.records, variable_str, variable + finite_diff)
-        if variable_str == 'e00200p':
-            self.records.e00200 = earnings_var + finite_diff
-        elif variable_str == 'e00900p':
-            self.records.e00900 = seincome_var + finite_diff
-        elif variable_str == 'e00650':
-            self.records.e00600 = divincome_var + finite_diff
-        elif variable_str == 'e26270':
-            self.records.e02000 = schEincome_var + finite_diff
-        if self.consumption.has_response():
-            self.consumption.response(self.records, finite_diff)
-        self.calc_all(zero_out_calc_vars=zero_out_calculated_vars)
-        payrolltax_chng = copy.deepcopy(self.records._payrolltax)
-        incometax_chng = copy.deepcopy(self.records._iitax)
-        combined_taxes_chng = incometax_chng + payrolltax_chng
-        # calculate base level of taxes after restoring records object
-        setattr(self, 'records', recs0)
+        # calculate base level of taxes
         self.calc_all(zero_out_calc_vars=zero_out_calculated_vars)
         payrolltax_base = copy.deepcopy(self.records._payrolltax)
         incometax_base = copy.deepcopy(self.records._iitax)
+        # calculate level of taxes after a marginal increase in each variable
+        # by recalculating only what depends on the increased variables,
+        # leaving the values of all the embedded records variables unchanged
+        recs = self.records
+        dim = recs.dim
+        payrolltax_chng = dict()
+        incometax_chng = dict()
+        for start in range(0, len(variable_strs), batch_size):
+            batch = variable_strs[start:start + batch_size]
+            changed_vars = list()
+            for variable_str in batch:
+                changed_vars.append([variable_str])
+                if variable_str in Calculator.MTR_INCLUSIVE_VARIABLES:
+                    changed_vars[-1].append(
+                        Calculator.MTR_INCLUSIVE_VARIABLES[variable_str])
+            if len(batch) == 1:
+                # change the embedded records in place after saving the
+                # variables that are changed by the marginal increase or
+                # by recalc, which is much faster than a deepcopy
+                snapshot_vars = set(changed_vars[0])
+                if self.consumption.has_response():
+                    snapshot_vars.update(Consumption.RESPONSE_VARS)
+                snapshot_vars.update(Records.CALCULATED_VARS)
+                snapshot = recs.snapshot(snapshot_vars)
+            else:
+                self.records = recs.stacked(len(batch))
+            for idx, varnames in enumerate(changed_vars):
+                block = slice(idx * dim, (idx + 1) * dim)
+                for varname in varnames:
+                    getattr(self.records, varname)[block] += finite_diff
+            changed = set(var for varnames in changed_vars
+                          for var in varnames)
+            if self.consumption.has_response():
+                self.consumption.response(self.records, finite_diff)
+                changed.update(Consumption.RESPONSE_VARS)
+            self.recalc(changed)
+            for idx, variable_str in enumerate(batch):
+                block = slice(idx * dim, (idx + 1) * dim)
+                payrolltax_chng[variable_str] = \
+                    self.records._payrolltax[block].copy()
+                incometax_chng[variable_str] = \
+                    self.records._iitax[block].copy()
+            if len(batch) == 1:
+                recs.restore(snapshot)
+            else:
+                self.records = recs
         combined_taxes_base = incometax_base + payrolltax_base
-        # compute marginal changes in combined tax liability
-        payrolltax_diff = payrolltax_chng - payrolltax_base
-        incometax_diff = incometax_chng - incometax_base
-        combined_diff = combined_taxes_chng - combined_taxes_base
-        # specify optional adjustment for employer (er) OASDI+HI payroll taxes
-        if wrt_full_compensation and variable_str == 'e00200p':
-            adj = np.where(variable < self.policy.SS_Earnings_c,
-                           0.5 * (self.policy.FICA_ss_trt +
-                                  self.policy.FICA_mc_trt),
-                           0.5 * self.policy.FICA_mc_trt)
-        else:
-            adj = 0.0
-        # compute marginal tax rates
-        mtr_payrolltax = payrolltax_diff / (finite_diff * (1.0 + adj))
-        mtr_incometax = incometax_diff / (finite_diff * (1.0 + adj))
-        mtr_combined = combined_diff / (finite_diff * (1.0 + adj))
-        # return the three marginal tax rate arrays
-        return (mtr_payrolltax, mtr_incometax, mtr_combined)
+        # compute marginal tax rates for each variable
+        mtrs = dict()
+        for variable_str in variable_strs:
+            # compute marginal changes in combined tax liability
+            combined_taxes_chng = (incometax_chng[variable_str] +
+                                   payrolltax_chng[variable_str])
+            payrolltax_diff = payrolltax_chng[variable_str] - payrolltax_base
+            incometax_diff = incometax_chng[variable_str] - incometax_base
+            combined_diff = combined_taxes_chng - combined_taxes_base
+            # specify optional adjustment for employer (er) OASDI+HI
+            # payroll taxes
+            if wrt_full_compensation and variable_str == 'e00200p':
+                variable = getattr(self.records, variable_str)
+                adj = np.where(variable < self.policy.SS_Earnings_c,
+                               0.5 * (self.policy.FICA_ss_trt +
+                                      self.policy.FICA_mc_trt),
+                               0.5 * self.policy.FICA_mc_trt)
+            else:
+                adj = 0.0
+            # compute marginal tax rates
+            mtr_payrolltax = payrolltax_diff / (finite_diff * (1.0 + adj))
+            mtr_incometax = incometax_diff / (finite_diff * (1.0 + adj))
+            mtr_combined = combined_diff / (finite_diff * (1.0 + adj))
+            mtrs[variable_str] = (mtr_payrolltax, mtr_incometax, mtr_combined)
+        return mtrs
 
     def current_law_version(self):
         """
@@ -395,9 +813,42 @@ class Calculator(object):
         grow = copy.deepcopy(self.growth)
         cons = copy.deepcopy(self.consumption)
         calc = Calculator(policy=clp, records=recs, sync_years=False,
-                          behavior=behv, growth=grow, consumption=cons)
+                          behavior=behv, growth=grow, consumption=cons,
+                          fuse_kernels=self.fuse_kernels)
         return calc
 
+    @staticmethod
+    def warm_up(fuse_kernels=False):
+        """
+        Compile the tax-calculating functions used by the calc_all method
+        by calling that method for a few synthetic filing units, which
+        saves the compiled code in the on-disk cache, when a cache directory
+        has been specified (see the CACHE_DIR variable and the set_cache_dir
+        function in the decorators.py file), so that later processes using
+        the same cache directory skip most of the compilation.  This
+        method is meant to be called once when Tax-Calculator is deployed.
+
+        Parameters
+        ----------
+        fuse_kernels: boolean
+            specifies whether the fused functions used by Calculator objects
+            that are constructed with fuse_kernels=True are also compiled.
+
+        Returns
+        -------
+        nothing: void
+        """
+        wages = [1.0e4, 5.0e4, 1.0e5, 2.0e5, 1.0e6]
+        data = pd.DataFrame({'RECID': [1, 2, 3, 4, 5],
+                             'MARS': [1, 2, 3, 4, 5],
+                             'e00200': wages, 'e00200p': wages})
+        for fuse in set([False, fuse_kernels]):
+            recs = Records(data=data, blowup_factors=None, weights=None,
+                           start_year=Policy.JSON_START_YEAR)
+            calc = Calculator(policy=Policy(), records=recs,
+                              sync_years=False, fuse_kernels=fuse)
+            calc.calc_all()
+
     @staticmethod
     def read_json_param_files(reform_filename, assump_filename):
         """
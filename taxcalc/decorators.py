@@ -6,11 +6,19 @@ Implement Numba JIT decorators used to speed-up tax-calculating functions.
 # pylint --disable=locally-disabled decorators.py
 # (when importing numpy, add "--extension-pkg-whitelist=numpy" pylint option)
 
+import os
+import sys
 import ast
+import hashlib
 import inspect
+import numbers
+import textwrap
+import weakref
+import numpy as np
 import toolz
 from six import StringIO
 from .policy import Policy
+from . import profiling
 
 
 def id_wrapper(*dec_args, **dec_kwargs):  # pylint: disable=unused-argument
@@ -26,6 +34,7 @@ def id_wrapper(*dec_args, **dec_kwargs):  # pylint: disable=unused-argument
             wrapped_f function nested in wrap function.
             """
             return fnc(*args, **kwargs)
+        wrapped_f.py_func = fnc  # like the py_func attribute of numba.jit
         return wrapped_f
     return wrap
 
@@ -35,13 +44,176 @@ try:
     jit = numba.jit  # pylint: disable=invalid-name
     DO_JIT = True
 except (ImportError, AttributeError):
+    numba = None  # pylint: disable=invalid-name
     jit = id_wrapper  # pylint: disable=invalid-name
     DO_JIT = False
+# When DO_JIT is False, calc-style functions are translated into vectorized
+# functions that do their calculations on NumPy arrays containing all the
+# records (see the vectorize_calc_function function).  Setting DO_VECTORIZE
+# to False executes them instead one record at a time in a Python loop.
+DO_VECTORIZE = True
 # One way to use the Python debugger is to do these two things:
-#    (a) uncomment the two lines below item (b) in this comment, and
+#    (a) uncomment the three lines below item (b) in this comment, and
 #    (b) import pdb package and call pdb.set_trace() in calculator.py
 # jit = id_wrapper
 # DO_JIT = False
+# DO_VECTORIZE = False
+
+# Number of threads used by the apply-style loops of iterate_jit functions,
+# which are compiled as parallel loops when NUM_THREADS is greater than one.
+# Use the set_num_threads function to change this value.
+NUM_THREADS = 1
+
+
+def set_num_threads(num_threads):
+    """
+    Set the number of threads used by the record loops of iterate_jit
+    functions.  A value of one (the default) implies serial loops; a
+    larger value implies that the record loop of each iterate_jit function
+    is split across that many threads when it is called.  When the numba
+    package is not available, the loops are always serial.
+
+    Parameters
+    ----------
+    num_threads: positive integer (of any integral type except bool)
+
+    Returns
+    -------
+    nothing: void
+    """
+    global NUM_THREADS  # pylint: disable=global-statement
+    if (isinstance(num_threads, bool) or
+            not isinstance(num_threads, numbers.Integral) or
+            num_threads < 1):
+        msg = 'num_threads={} is not a positive integer'
+        raise ValueError(msg.format(num_threads))
+    num_threads = int(num_threads)
+    if DO_JIT and hasattr(numba, 'set_num_threads'):
+        # numba cannot use more threads than it launched at start-up
+        numba.set_num_threads(min(num_threads,
+                                  numba.config.NUMBA_NUM_THREADS))
+    NUM_THREADS = num_threads
+
+
+# Directory in which the source code of the generated apply-style and fused
+# functions is saved as Python modules, so that numba can cache the compiled
+# code of those functions on disk, which lets later processes skip most of
+# the compilation.  The on-disk cache is used only when a directory is
+# specified, either by the TAXCALC_CACHE_DIR environment variable or by the
+# set_cache_dir function, so importing taxcalc never writes any files.
+CACHE_DIR = os.environ.get('TAXCALC_CACHE_DIR', '')
+
+
+def set_cache_dir(cache_dir):
+    """
+    Set the directory in which the compiled code of the functions generated
+    by iterate_jit and make_fused_function is cached.  A cache_dir value of
+    None or an empty string implies no on-disk cache, so that each process
+    compiles those functions when they are first called, which is the
+    default when the TAXCALC_CACHE_DIR environment variable is not set.
+    The cache applies only to functions generated after this function is
+    called.
+
+    Parameters
+    ----------
+    cache_dir: string or None
+
+    Returns
+    -------
+    nothing: void
+    """
+    global CACHE_DIR  # pylint: disable=global-statement
+    CACHE_DIR = cache_dir if cache_dir else ''
+
+
+# text of source files keyed by file name, which is read only once
+_SOURCE_FILE_TEXT = dict()
+
+
+def _source_file_text(func):
+    """
+    Return text of the file that contains func source code, or the func
+    source code itself when that file cannot be read.
+    """
+    func = getattr(func, 'py_func', func)
+    try:
+        filename = inspect.getsourcefile(func)
+        if filename not in _SOURCE_FILE_TEXT:
+            with open(filename) as sfile:
+                _SOURCE_FILE_TEXT[filename] = sfile.read()
+        return _SOURCE_FILE_TEXT[filename]
+    except (IOError, TypeError):
+        return inspect.getsource(func)
+
+
+def _import_module_from_file(modname, path):
+    """
+    Return module named modname after importing it from the path file.
+    """
+    if modname in sys.modules:
+        return sys.modules[modname]
+    try:
+        import importlib.util  # pylint: disable=import-error
+        spec = importlib.util.spec_from_file_location(modname, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[modname] = module  # numba looks up module by name
+    except ImportError:  # Python 2.7
+        import imp  # pylint: disable=import-error
+        module = imp.load_source(modname, path)
+    return module
+
+
+def load_generated_function(source, func_name, env, depends_on=None,
+                            use_cache=False, jit_kwargs=None):
+    """
+    Return the function named func_name that is defined in the source
+    string and whose global names are those in the env dictionary.
+
+    When use_cache is True and CACHE_DIR is not empty, source is saved as
+    a module in CACHE_DIR and the function is defined by importing that
+    module, so that numba.jit can cache the function's compiled code.  The
+    module name contains a hash of source, of the source files of the
+    functions in the depends_on list, of jit_kwargs, and of the numba
+    version, so that a change in any of these implies a new module whose
+    code is compiled when it is first called.
+
+    Returns
+    -------
+    (function, is_cachable) tuple, where is_cachable is True when the
+    function can be jitted with the cache=True option
+    """
+    if use_cache and CACHE_DIR:
+        key = hashlib.sha1()
+        numba_version = str(getattr(numba, '__version__', ''))
+        texts = [source, numba_version, repr(sorted((jit_kwargs or
+                                                     {}).items()))]
+        texts += [_source_file_text(func) for func in (depends_on or [])]
+        for text in texts:
+            key.update(text.encode('utf-8'))
+        modname = 'taxcalc_{}_{}'.format(func_name, key.hexdigest())
+        path = os.path.join(CACHE_DIR, modname + '.py')
+        try:
+            if not os.path.isfile(path):
+                if not os.path.isdir(CACHE_DIR):
+                    os.makedirs(CACHE_DIR)
+                # write to a temporary file first so that another process
+                # never imports a partially written module
+                tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+                with open(tmp_path, 'w') as mfile:
+                    mfile.write(source)
+                os.rename(tmp_path, path)
+            module = _import_module_from_file(modname, path)
+        except (IOError, OSError):
+            module = None  # cache directory is not usable
+        if module is not None:
+            for name, value in env.items():
+                setattr(module, name, value)
+            return (getattr(module, func_name), True)
+    func_code = compile(source, "<string>", "exec")
+    fakeglobals = {}
+    eval(func_code, env, fakeglobals)  # pylint: disable=eval-used
+    return (fakeglobals[func_name], False)
 
 
 class GetReturnNode(ast.NodeVisitor):
@@ -58,7 +230,296 @@ class GetReturnNode(ast.NodeVisitor):
             return [node.value.id]
 
 
-def create_apply_function_string(sigout, sigin, parameters):
+def _fill_template(template, **subs):
+    """
+    Return AST of template expression after replacing each Name node whose
+    id is a key in subs with the AST node that is the key's value in subs.
+    """
+    class Substitute(ast.NodeTransformer):
+        """
+        A NodeTransformer that replaces placeholder names in a template.
+        """
+        def visit_Name(self, node):  # pylint: disable=invalid-name
+            """
+            visit_Name is used by NodeTransformer.visit method.
+            """
+            return subs.get(node.id, node)
+    return Substitute().visit(ast.parse(template, mode='eval').body)
+
+
+class VectorizeCalcFunction(ast.NodeTransformer):
+    """
+    A NodeTransformer that converts the AST of a calc-style function, which
+    does its calculations on scalar values for a single record, into the
+    AST of a function that does the same calculations on arrays containing
+    all the records.  The min and max built-in functions become np.minimum
+    and np.maximum; boolean operators become np.logical_* functions; and
+    each if statement becomes code that executes both branches and uses
+    np.where to select, record by record, the value of each variable
+    assigned in the branch taken by the scalar function.  A ValueError is
+    raised when the function contains code that cannot be vectorized.
+    """
+    PREFIX = '_vec_'
+    MATH_FUNCS = ['ceil', 'floor', 'sqrt', 'exp', 'log']
+    STATEMENTS = (ast.Assign, ast.AugAssign, ast.If, ast.Expr,
+                  ast.Return, ast.Pass)
+
+    def __init__(self, arg_names, func_globals):
+        self.arg_names = arg_names
+        self.func_globals = func_globals
+        self.helpers = dict()
+        self.num_ifs = 0
+
+    def visit_FunctionDef(self, node):  # pylint: disable=invalid-name
+        """
+        visit_FunctionDef is used by NodeTransformer.visit method.
+        """
+        returns = [n for n in ast.walk(node) if isinstance(n, ast.Return)]
+        if len(returns) != 1 or node.body[-1] is not returns[0]:
+            raise ValueError('function must end with its only return')
+        local_names = set()
+        for stmt in node.body:
+            for subnode in ast.walk(stmt):
+                if isinstance(subnode, ast.stmt):
+                    if not isinstance(subnode, self.STATEMENTS):
+                        msg = 'cannot vectorize {} statement'
+                        raise ValueError(msg.format(type(subnode).__name__))
+                if isinstance(subnode, (ast.Assign, ast.AugAssign)):
+                    if isinstance(subnode, ast.Assign):
+                        targets = subnode.targets
+                    else:
+                        targets = [subnode.target]
+                    for target in targets:
+                        for name in ast.walk(target):
+                            if isinstance(name, ast.Subscript):
+                                raise ValueError('cannot assign to item')
+                            if isinstance(name, ast.Name):
+                                local_names.add(name.id)
+        node.decorator_list = []
+        self.generic_visit(node)
+        # give each local variable a value before any if statement merges
+        # it, which is discarded for records that never assign the variable
+        inits = [ast.parse('{} = 0.'.format(name)).body[0]
+                 for name in sorted(local_names - set(self.arg_names))]
+        node.body = inits + node.body
+        return node
+
+    def visit_If(self, node):  # pylint: disable=invalid-name
+        """
+        visit_If is used by NodeTransformer.visit method.
+        """
+        self.generic_visit(node)
+        names = set()
+        for stmt in node.body + node.orelse:
+            for name in ast.walk(stmt):
+                if (isinstance(name, ast.Name) and
+                        isinstance(name.ctx, ast.Store) and
+                        not name.id.startswith(self.PREFIX)):
+                    names.add(name.id)
+        names = sorted(names)
+        idx = self.num_ifs
+        self.num_ifs += 1
+        cond = '{}cond_{}'.format(self.PREFIX, idx)
+        before = ['{}else_{}_{}'.format(self.PREFIX, idx, n) for n in names]
+        after = ['{}then_{}_{}'.format(self.PREFIX, idx, n) for n in names]
+        stmts = [ast.Assign(targets=[ast.Name(id=cond, ctx=ast.Store())],
+                            value=node.test)]
+        for name, saved in zip(names, before):
+            stmts.append(ast.parse('{} = {}'.format(saved, name)).body[0])
+        stmts.extend(node.body)
+        for name, saved, taken in zip(names, before, after):
+            stmts.extend(ast.parse('{} = {}\n{} = {}'.format(
+                taken, name, name, saved)).body)
+        stmts.extend(node.orelse)
+        for name, taken in zip(names, after):
+            stmts.append(ast.parse('{} = np.where({}, {}, {})'.format(
+                name, cond, taken, name)).body[0])
+        return [ast.copy_location(stmt, node) for stmt in stmts]
+
+    def visit_AugAssign(self, node):  # pylint: disable=invalid-name
+        """
+        visit_AugAssign is used by NodeTransformer.visit method.
+        """
+        # never update in place an array that may be a function argument
+        self.generic_visit(node)
+        if not isinstance(node.target, ast.Name):
+            raise ValueError('cannot vectorize augmented assignment')
+        value = ast.BinOp(left=ast.Name(id=node.target.id, ctx=ast.Load()),
+                          op=node.op, right=node.value)
+        assign = ast.Assign(targets=[node.target], value=value)
+        return ast.copy_location(assign, node)
+
+    def visit_Call(self, node):  # pylint: disable=invalid-name
+        """
+        visit_Call is used by NodeTransformer.visit method.
+        """
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id in ('min', 'max'):
+            if len(node.args) < 2 or node.keywords:
+                raise ValueError('cannot vectorize call to ' + node.func.id)
+            ufunc = 'np.minimum' if node.func.id == 'min' else 'np.maximum'
+            expr = node.args[0]
+            for arg in node.args[1:]:
+                expr = _fill_template(ufunc + '(_vec_a, _vec_b)',
+                                      _vec_a=expr, _vec_b=arg)
+            return ast.copy_location(expr, node)
+        if isinstance(node.func, ast.Name):
+            helper = self.func_globals.get(node.func.id, None)
+            helper = getattr(helper, 'py_func', helper)
+            if not inspect.isfunction(helper):
+                raise ValueError('cannot vectorize call to ' + node.func.id)
+            self.helpers[node.func.id] = helper
+            return node
+        if (isinstance(node.func, ast.Attribute) and
+                isinstance(node.func.value, ast.Name) and
+                node.func.value.id == 'math' and
+                node.func.attr in self.MATH_FUNCS):
+            node.func = _fill_template('np.' + node.func.attr)
+            return node
+        raise ValueError('cannot vectorize function call')
+
+    def visit_BoolOp(self, node):  # pylint: disable=invalid-name
+        """
+        visit_BoolOp is used by NodeTransformer.visit method.
+        """
+        self.generic_visit(node)
+        if isinstance(node.op, ast.And):
+            ufunc = 'np.logical_and'
+        else:
+            ufunc = 'np.logical_or'
+        expr = node.values[0]
+        for value in node.values[1:]:
+            expr = _fill_template(ufunc + '(_vec_a, _vec_b)',
+                                  _vec_a=expr, _vec_b=value)
+        return ast.copy_location(expr, node)
+
+    def visit_UnaryOp(self, node):  # pylint: disable=invalid-name
+        """
+        visit_UnaryOp is used by NodeTransformer.visit method.
+        """
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            expr = _fill_template('np.logical_not(_vec_a)',
+                                  _vec_a=node.operand)
+            return ast.copy_location(expr, node)
+        return node
+
+    def visit_IfExp(self, node):  # pylint: disable=invalid-name
+        """
+        visit_IfExp is used by NodeTransformer.visit method.
+        """
+        self.generic_visit(node)
+        expr = _fill_template('np.where(_vec_a, _vec_b, _vec_c)',
+                              _vec_a=node.test, _vec_b=node.body,
+                              _vec_c=node.orelse)
+        return ast.copy_location(expr, node)
+
+    def visit_Compare(self, node):  # pylint: disable=invalid-name
+        """
+        visit_Compare is used by NodeTransformer.visit method.
+        """
+        self.generic_visit(node)
+        for oper in node.ops:
+            if isinstance(oper, (ast.Is, ast.IsNot, ast.In, ast.NotIn)):
+                raise ValueError('cannot vectorize comparison')
+        if len(node.ops) == 1:
+            return node
+        # a < b < c is vectorized as np.logical_and(a < b, b < c)
+        left = node.left
+        expr = None
+        for oper, right in zip(node.ops, node.comparators):
+            comp = ast.Compare(left=left, ops=[oper], comparators=[right])
+            if expr is None:
+                expr = comp
+            else:
+                expr = _fill_template('np.logical_and(_vec_a, _vec_b)',
+                                      _vec_a=expr, _vec_b=comp)
+            left = right
+        return ast.copy_location(expr, node)
+
+
+def vectorize_calc_function(func):
+    """
+    Takes a calc-style function (or a function decorated by jit) and
+    returns a function that has the same arguments and return values, but
+    that operates on arrays containing all the records rather than on the
+    scalar values of a single record.  Functions called by func are
+    vectorized in the same way.
+
+    Parameters
+    ----------
+    func: the calc-style function
+
+    Returns
+    -------
+    vectorized function
+
+    Raises
+    ------
+    ValueError:
+        if func contains code that cannot be vectorized.
+    """
+    func = getattr(func, 'py_func', func)
+    arg_names = inspect.getargspec(func).args
+    tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    vectorizer = VectorizeCalcFunction(arg_names, func.__globals__)
+    tree = ast.fix_missing_locations(vectorizer.visit(tree))
+    env = dict(func.__globals__)
+    env['np'] = np
+    for name, helper in vectorizer.helpers.items():
+        env[name] = vectorize_calc_function(helper)
+    func_code = compile(tree, "<vectorized {}>".format(func.__name__), "exec")
+    fakeglobals = {}
+    eval(func_code, env, fakeglobals)  # pylint: disable=eval-used
+    return fakeglobals[func.__name__]
+
+
+def make_vectorized_apply_function(func, out_args):
+    """
+    Takes a calc-style function and creates an apply-style function that
+    has the same arguments as the function made by make_apply_function,
+    but that calls the vectorized version of the calc-style function once
+    for all the records rather than calling the calc-style function once
+    for each record.
+
+    Parameters
+    ----------
+    func: the calc-style function
+
+    out_args: list of out arguments for the apply-style function
+
+    Returns
+    -------
+    apply-style function
+
+    Raises
+    ------
+    ValueError:
+        if func contains code that cannot be vectorized.
+    """
+    vectorized_f = vectorize_calc_function(func)
+    num_out = len(out_args)
+
+    def ap_func(*args):
+        """
+        ap_func function nested in make_vectorized_apply_function function.
+        """
+        # values calculated for records in branches they do not take are
+        # discarded, so ignore floating-point errors in those calculations
+        with np.errstate(all='ignore'):
+            results = vectorized_f(*args[num_out:])
+        if num_out == 1:
+            results = (results,)
+        for out_array, result in zip(args[:num_out], results):
+            out_array[:] = result
+        if num_out == 1:
+            return args[0]
+        return args[:num_out]
+
+    return ap_func
+
+
+def create_apply_function_string(sigout, sigin, parameters, parallel=False):
     """
     Create a string for a function of the form:
 
@@ -69,6 +530,8 @@ def create_apply_function_string(sigout, sigin, parameters):
 
     where the specific args to jitted_f and the number of
     values to return is determined by sigout and sigin.
+    When parallel is True, the loop is written using prange instead
+    of range, so that it can be split across threads.
 
     Parameters
     ----------
@@ -80,6 +543,8 @@ def create_apply_function_string(sigout, sigin, parameters):
                 variables (as opposed to column records). This influences
                 how we construct the apply-style function
 
+    parallel: Bool, if True, use prange rather than range for the loop
+
     Returns
     -------
     a String representing the function
@@ -90,7 +555,8 @@ def create_apply_function_string(sigout, sigin, parameters):
     in_args = ["x_" + str(i) for i in range(len(sigout), total_len)]
 
     fstr.write("def ap_func({0}):\n".format(",".join(out_args + in_args)))
-    fstr.write("  for i in range(len(x_0)):\n")
+    loop_range = "prange" if parallel else "range"
+    fstr.write("  for i in {0}(len(x_0)):\n".format(loop_range))
     out_index = [x + "[i]" for x in out_args]
     in_index = []
     for arg, _var in zip(in_args, sigin):
@@ -101,7 +567,32 @@ def create_apply_function_string(sigout, sigin, parameters):
     return fstr.getvalue()
 
 
-def create_toplevel_function_string(args_out, args_in, pm_or_pf):
+def upcast(array):
+    """
+    Return array when it contains float64 or int64 values (or is not an
+    array); otherwise, return a float64 or int64 copy of it, which is how
+    the variables of a Records object with compact storage are passed to
+    the tax-calculating functions.
+    """
+    dtype = getattr(array, 'dtype', None)
+    if dtype is None or dtype.itemsize == 8:
+        return array
+    if dtype.kind == 'f':
+        return np.asarray(array, dtype=np.float64)
+    if dtype.kind in 'iu':
+        return np.asarray(array, dtype=np.int64)
+    return array
+
+
+def compact_storage(pf):
+    """
+    Return true if pf is a Records object whose storage is compact.
+    """
+    return getattr(pf, 'storage', 'standard') != 'standard'
+
+
+def create_toplevel_function_string(args_out, args_in, pm_or_pf,
+                                    return_dataframe=True, upcast_in=False):
     """
     Create a string for a function of the form:
 
@@ -110,6 +601,13 @@ def create_toplevel_function_string(args_out, args_in, pm_or_pf):
             header = [...]
             return DataFrame(data, columns=header)
 
+    or, when return_dataframe is False, of the form:
+
+        def hl_func(x_0, x_1, x_2, ...):
+            calc_func(...)
+
+    which leaves the results only in the (in-place updated) out arguments.
+
     Parameters
     ----------
     args_out: iterable of the out arguments
@@ -118,13 +616,32 @@ def create_toplevel_function_string(args_out, args_in, pm_or_pf):
 
     pm_or_pf: iterable of strings for object that holds each arg
 
+    return_dataframe: Bool, if True, return the out arguments in a DataFrame
+
+    upcast_in: Bool, if True, each in argument that is held by pf (and is not
+               also an out argument) is passed through the upcast function
+
     Returns
     -------
     a String representing the function
     """
+    def arg_string(ppp, attr, is_out):
+        """
+        Return string for the ppp.attr argument.
+        """
+        if upcast_in and ppp == 'pf' and not is_out and attr not in args_out:
+            return 'upcast(' + ppp + '.' + attr + ')'
+        return ppp + '.' + attr
+    is_outs = [True] * len(args_out) + [False] * len(args_in)
     fstr = StringIO()
     fstr.write("def hl_func(pm, pf")
     fstr.write("):\n")
+    if not return_dataframe:
+        fstr.write("    " + "applied_f(")
+        for ppp, attr, is_out in zip(pm_or_pf, args_out + args_in, is_outs):
+            fstr.write(arg_string(ppp, attr, is_out) + ", ")
+        fstr.write(")\n")
+        return fstr.getvalue()
     fstr.write("    from pandas import DataFrame\n")
     fstr.write("    import numpy as np\n")
     fstr.write("    outputs = \\\n")
@@ -134,8 +651,8 @@ def create_toplevel_function_string(args_out, args_in, pm_or_pf):
     outs = [m_or_f + "." + arg for m_or_f, arg in zip(pm_or_pf, args_out)]
     fstr.write("        (" + ", ".join(outs) + ") = \\\n")
     fstr.write("        " + "applied_f(")
-    for ppp, attr in zip(pm_or_pf, args_out + args_in):
-        fstr.write(ppp + "." + attr + ", ")
+    for ppp, attr, is_out in zip(pm_or_pf, args_out + args_in, is_outs):
+        fstr.write(arg_string(ppp, attr, is_out) + ", ")
     fstr.write(")\n")
     fstr.write("    header = [")
     col_headers = ["'" + out + "'" for out in args_out]
@@ -150,8 +667,136 @@ def create_toplevel_function_string(args_out, args_in, pm_or_pf):
     return fstr.getvalue()
 
 
+def create_fused_function_string(stages, parameters, parallel=False,
+                                 alternatives=None, choose_var=None):
+    """
+    Create a string for a function of the form:
+
+        def fused_func(x_0, x_1, x_2, ...):
+            for i in range(len(x_0)):
+                v_0_0 = x_0[i]
+                ...
+                v_0_1, ... = f_0(v_j_0, ..., x_k, ...)
+                ...
+                x_0[i] = v_0_1
+                ...
+
+    where f_0, f_1, ... are the calc-style functions of the stages, which
+    are called in order for each record.  The record variables are read
+    into local variables at the start of each loop iteration, the values
+    returned by each stage are kept in local variables that are used by
+    later stages, and each variable returned by any stage is written back
+    to its record array at the end of each loop iteration.
+
+    When alternatives is specified, the stages are called once for each
+    alternative, always starting from the values read from the record
+    arrays, and only the values calculated for the alternative with the
+    smallest value of the choose_var variable (the first such alternative
+    when there is a tie) are written back to the record arrays.
+
+    Parameters
+    ----------
+    stages: list of (sigout, sigin) pairs, one for each calc-style function,
+            where sigout is the list of out arguments returned by the
+            function and sigin is the list of the function's in arguments
+
+    parameters: iterable of which of the args (from all sigin) are parameter
+                variables (as opposed to column records)
+
+    parallel: Bool, if True, use prange rather than range for the loop
+
+    alternatives: None or list of dictionaries, each of which maps record
+                  variables to the numeric values they are set to before
+                  the stages are called for that alternative
+
+    choose_var: name of the variable used to choose among alternatives
+
+    Returns
+    -------
+    a String representing the function and
+    a list of the variable names that are the x_0, x_1, ... arguments
+    """
+    # pylint: disable=too-many-locals,too-many-branches
+    record_vars = []
+    param_vars = []
+    for sigout, sigin in stages:
+        for var in list(sigout) + list(sigin):
+            if var in parameters:
+                if var not in param_vars:
+                    param_vars.append(var)
+            elif var not in record_vars:
+                record_vars.append(var)
+    for alternative in alternatives or []:
+        for var in sorted(alternative):
+            if var not in record_vars:
+                record_vars.append(var)
+    arg_names = record_vars + param_vars
+    arg_of = dict((var, "x_" + str(i)) for i, var in enumerate(arg_names))
+    fstr = StringIO()
+    fstr.write("def fused_func({0}):\n".format(
+        ",".join(arg_of[var] for var in arg_names)))
+    loop_range = "prange" if parallel else "range"
+    fstr.write("  for i in {0}(len(x_0)):\n".format(loop_range))
+    # read record variables into local variables
+    local_of = dict()
+    version = dict()
+    for var in record_vars:
+        version[var] = 0
+        local_of[var] = "v_" + arg_of[var][2:] + "_0"
+        fstr.write("    " + local_of[var] + " = " + arg_of[var] + "[i]\n")
+    # call each stage using and assigning only local variables,
+    # once for each alternative
+    loaded_local_of = local_of
+    alt_local_of = []
+    written = []
+    for alternative in alternatives or [dict()]:
+        local_of = dict(loaded_local_of)
+        for var in sorted(alternative):
+            version[var] += 1
+            local_of[var] = ("v_" + arg_of[var][2:] + "_" +
+                             str(version[var]))
+            fstr.write("    {0} = {1}\n".format(
+                local_of[var], repr(float(alternative[var]))))
+            if var not in written:
+                written.append(var)
+        for idx, (sigout, sigin) in enumerate(stages):
+            in_locals = [arg_of[var] if var in parameters else local_of[var]
+                         for var in sigin]
+            for var in sigout:
+                version[var] += 1
+                local_of[var] = ("v_" + arg_of[var][2:] + "_" +
+                                 str(version[var]))
+                if var not in written:
+                    written.append(var)
+            fstr.write("    " + ",".join(local_of[var] for var in sigout))
+            fstr.write(" = f_" + str(idx) + "(" + ",".join(in_locals) + ")\n")
+        alt_local_of.append(local_of)
+    # write final values of calculated variables to record arrays
+    if len(alt_local_of) == 1:
+        for var in written:
+            fstr.write("    " + arg_of[var] + "[i] = " + local_of[var] + "\n")
+        return fstr.getvalue(), arg_names
+    fstr.write("    choice = 0\n")
+    fstr.write("    lowest = " + alt_local_of[0][choose_var] + "\n")
+    for alt, local_of in enumerate(alt_local_of[1:], 1):
+        fstr.write("    if " + local_of[choose_var] + " < lowest:\n")
+        fstr.write("      choice = " + str(alt) + "\n")
+        fstr.write("      lowest = " + local_of[choose_var] + "\n")
+    for alt, local_of in enumerate(alt_local_of):
+        if alt == 0:
+            fstr.write("    if choice == 0:\n")
+        elif alt < len(alt_local_of) - 1:
+            fstr.write("    elif choice == " + str(alt) + ":\n")
+        else:
+            fstr.write("    else:\n")
+        for var in written:
+            fstr.write("      " + arg_of[var] + "[i] = " +
+                       local_of[var] + "\n")
+    return fstr.getvalue(), arg_names
+
+
 def make_apply_function(func, out_args, in_args, parameters,
-                        do_jit=DO_JIT, **kwargs):
+                        do_jit=DO_JIT, parallel=False, **kwargs):
     """
     Takes a calc-style function and creates the necessary Python code for
     an apply-style function. Will also jit the function if desired.
@@ -168,7 +813,13 @@ def make_apply_function(func, out_args, in_args, parameters,
                 variables (as opposed to column records).  This influences
                 how we construct the apply-style function.
 
-    do_jit: Bool, if True, jit the resulting apply-style function
+    do_jit: Bool, if True, jit the resulting apply-style function;
+            if False and DO_VECTORIZE is True, the apply-style function
+            calls the vectorized calc-style function when func can be
+            vectorized (see the make_vectorized_apply_function function)
+
+    parallel: Bool, if True, split the apply-style loop across threads
+              (only when do_jit is True; otherwise the loop is serial)
 
     Returns
     -------
@@ -177,16 +828,29 @@ def make_apply_function(func, out_args, in_args, parameters,
     if do_jit:
         jitted_f = jit(**kwargs)(func)
     else:
+        if DO_VECTORIZE:
+            try:
+                return make_vectorized_apply_function(func, out_args)
+            except ValueError:
+                pass  # use the per-record loop of the calc-style function
         jitted_f = func
-    apfunc = create_apply_function_string(out_args, in_args, parameters)
-    func_code = compile(apfunc, "<string>", "exec")
-    fakeglobals = {}
-    eval(func_code,  # pylint: disable=eval-used
-         {"jitted_f": jitted_f}, fakeglobals)
+    apfunc = create_apply_function_string(out_args, in_args, parameters,
+                                          parallel=parallel)
+    if do_jit and parallel and numba is not None:
+        prange = numba.prange
+    else:
+        prange = range
+    ap_func, cachable = load_generated_function(
+        apfunc, 'ap_func', {"jitted_f": jitted_f, "prange": prange},
+        depends_on=[func], use_cache=do_jit, jit_kwargs=kwargs)
     if do_jit:
-        return jit(**kwargs)(fakeglobals['ap_func'])
+        if cachable:
+            kwargs = dict(kwargs, cache=True)
+        if parallel:
+            return jit(parallel=True, **kwargs)(ap_func)
+        return jit(**kwargs)(ap_func)
     else:
-        return fakeglobals['ap_func']
+        return ap_func
 
 
 def apply_jit(dtype_sig_out, dtype_sig_in, parameters=None, **kwargs):
@@ -228,13 +892,72 @@ def apply_jit(dtype_sig_out, dtype_sig_in, parameters=None, **kwargs):
     return make_wrapper
 
 
-def iterate_jit(parameters=None, **kwargs):
+# Names of the Policy parameters, which are read from the Policy JSON file
+# only once (rather than once for each iterate_jit function)
+_POLICY_PARAMETER_NAMES = None
+
+
+def policy_parameter_names():
+    """
+    Return frozenset containing the name of each Policy parameter both with
+    and without its leading underscore character.  The names are read from
+    the Policy JSON file when this function is first called.
+    """
+    global _POLICY_PARAMETER_NAMES  # pylint: disable=global-statement
+    if _POLICY_PARAMETER_NAMES is None:
+        dd_key_list = list(Policy.default_data(metadata=True).keys())
+        _POLICY_PARAMETER_NAMES = frozenset(
+            dd_key_list + [arg[1:] for arg in dd_key_list])
+    return _POLICY_PARAMETER_NAMES
+
+
+def _arg_sources(cache, names, pm, pf):
+    """
+    Return tuple containing, for each of the names, "pm" when it is the name
+    of an attribute of pm, "pf" when it is otherwise the name of an
+    attribute of pf, and None otherwise.  The tuple is found only when it is
+    first requested for the pm and pf objects, whose attributes are assumed
+    not to be added or deleted later, and is then saved in the cache, which
+    is a WeakKeyDictionary keyed by pf whose values are WeakKeyDictionary
+    objects keyed by pm (so the cache does not keep the objects alive).
+    """
+    try:
+        pm_cache = cache.get(pf, None)
+        if pm_cache is None:
+            pm_cache = weakref.WeakKeyDictionary()
+            cache[pf] = pm_cache
+        sources = pm_cache.get(pm, None)
+    except TypeError:
+        # pm or pf cannot be weakly referenced, so nothing is saved
+        pm_cache = None
+        sources = None
+    if sources is None:
+        sources = tuple('pm' if hasattr(pm, name) else
+                        'pf' if hasattr(pf, name) else None
+                        for name in names)
+        if pm_cache is not None:
+            pm_cache[pm] = sources
+    return sources
+
+
+def iterate_jit(parameters=None, parallel=None, **kwargs):
     """
     Make a decorator that takes in a calc-style function, create a
     function that handles the "high-level" function and the apply-style
     function.
 
     Note: perhaps a better "bigger picture" description of what this does?
+
+    The decorated function is called with (pm, pf) arguments and by default
+    returns a DataFrame containing the out arguments.  Calling it with the
+    return_dataframe=False keyword argument only updates the out arguments
+    in place and returns None, which avoids copying the out arguments.
+
+    The parallel argument specifies whether the record loop is split across
+    threads: True and False force a parallel or a serial loop, while the
+    default None implies a parallel loop only when NUM_THREADS, which is
+    set by the set_num_threads function, is greater than one.  The parallel
+    apply-style function is compiled when it is first used.
     """
     if not parameters:
         parameters = []
@@ -253,9 +976,7 @@ def iterate_jit(parameters=None, **kwargs):
         # Any name that is a parameter
         # Boolean flag is given special treatment.
         # Identify those names here
-        dd_key_list = list(Policy.default_data(metadata=True).keys())
-        allowed_parameters = dd_key_list
-        allowed_parameters += list(arg[1:] for arg in dd_key_list)
+        allowed_parameters = policy_parameter_names()
         additional_parameters = [arg for arg in in_args if
                                  arg in allowed_parameters]
         additional_parameters += parameters
@@ -269,8 +990,8 @@ def iterate_jit(parameters=None, **kwargs):
         grn = GetReturnNode()
         all_out_args = None
         for node in ast.walk(ast.parse(''.join(src))):
-            all_out_args = grn.visit(node)
-            if all_out_args:
+            if isinstance(node, ast.Return):
+                all_out_args = grn.visit(node)
                 break
         if not all_out_args:
             raise ValueError("Can't find return statement in function!")
@@ -283,32 +1004,221 @@ def iterate_jit(parameters=None, **kwargs):
                                                do_jit=DO_JIT,
                                                **kwargs_for_jit)
 
+        # Apply-style functions keyed by whether or not the loop is parallel
+        applied_funcs = {False: applied_jitted_f}
+
+        # Cache of high-level functions keyed by the pm/pf layout of args,
+        # by whether or not the function returns a DataFrame, and by
+        # whether or not the record loop is parallel
+        high_level_funcs = dict()
+
+        # Cache of the pm/pf layouts of args (see _arg_sources)
+        arg_names = all_out_args + in_args
+        arg_sources = weakref.WeakKeyDictionary()
+
         def wrapper(*args, **kwargs):
             """
             wrapper function nested in make_wrapper function nested
             in iterate_jit decorator.
             """
-            in_arrays = []
-            pm_or_pf = []
-            for farg in all_out_args + in_args:
-                if hasattr(args[0], farg):
-                    in_arrays.append(getattr(args[0], farg))
-                    pm_or_pf.append("pm")
-                elif hasattr(args[1], farg):
-                    in_arrays.append(getattr(args[1], farg))
-                    pm_or_pf.append("pf")
-            # Create the high level function
-            high_level_func = create_toplevel_function_string(all_out_args,
-                                                              list(in_args),
-                                                              pm_or_pf)
-            func_code = compile(high_level_func, "<string>", "exec")
-            fakeglobals = {}
-            eval(func_code,  # pylint: disable=eval-used
-                 {"applied_f": applied_jitted_f}, fakeglobals)
-            high_level_fn = fakeglobals['hl_func']
+            return_dataframe = kwargs.pop('return_dataframe', True)
+            sources = _arg_sources(arg_sources, arg_names, args[0], args[1])
+            if parallel is None:
+                use_parallel = NUM_THREADS > 1
+            else:
+                use_parallel = parallel
+            upcast_in = compact_storage(args[1])
+            layout = (sources, return_dataframe, use_parallel, upcast_in)
+            high_level_fn = high_level_funcs.get(layout, None)
+            if high_level_fn is None:
+                pm_or_pf = [src for src in sources if src is not None]
+                if use_parallel not in applied_funcs:
+                    applied_funcs[use_parallel] = make_apply_function(
+                        func, list(reversed(all_out_args)), in_args,
+                        parameters=all_parameters, do_jit=DO_JIT,
+                        parallel=use_parallel, **kwargs_for_jit)
+                # Create the high level function once for this layout
+                high_level_func = create_toplevel_function_string(
+                    all_out_args, list(in_args), pm_or_pf,
+                    return_dataframe=return_dataframe, upcast_in=upcast_in)
+                func_code = compile(high_level_func, "<string>", "exec")
+                fakeglobals = {}
+                eval(func_code,  # pylint: disable=eval-used
+                     {"applied_f": applied_funcs[use_parallel],
+                      "upcast": upcast}, fakeglobals)
+                high_level_fn = fakeglobals['hl_func']
+                high_level_funcs[layout] = high_level_fn
+            if profiling.PROFILER is not None:
+                return profiling.PROFILER.call(
+                    'kernel:' + func.__name__, high_level_fn, args, kwargs,
+                    dispatcher=applied_funcs[use_parallel])
             ans = high_level_fn(*args, **kwargs)
             return ans
 
+        # Record the signature of func so that make_fused_function can
+        # combine this function with other iterate_jit functions
+        wrapper.calc_func = func
+        wrapper.in_args = list(in_args)
+        wrapper.out_args = list(all_out_args)
+        wrapper.parameters = list(all_parameters)
+        wrapper.jit_kwargs = kwargs_for_jit
         return wrapper
 
     return make_wrapper
+
+
+def _call_kernels(kernels, args, alternatives, choose_var):
+    """
+    Call the kernels one after the other for all the records, which has the
+    same results as the fused function made by make_fused_function with the
+    same alternatives and choose_var values.
+    """
+    if not alternatives:
+        for kernel in kernels:
+            kernel(*args, return_dataframe=False)
+        return
+
+    def array(var):
+        """
+        Return the array for var, which is an attribute of args[0] or args[1].
+        """
+        if hasattr(args[0], var):
+            return getattr(args[0], var)
+        return getattr(args[1], var)
+    written = list()
+    for alternative in alternatives:
+        written.extend(var for var in sorted(alternative)
+                       if var not in written)
+    for kernel in kernels:
+        written.extend(var for var in kernel.out_args if var not in written)
+    initial = dict((var, array(var).copy()) for var in written)
+    results = list()
+    for alternative in alternatives:
+        for var in written:
+            array(var)[:] = initial[var]
+        for var, value in alternative.items():
+            array(var)[:] = value
+        for kernel in kernels:
+            kernel(*args, return_dataframe=False)
+        results.append(dict((var, array(var).copy()) for var in written))
+    choice = np.zeros(len(array(choose_var)), dtype=np.int64)
+    lowest = results[0][choose_var]
+    for alt, result in enumerate(results[1:], 1):
+        lower = result[choose_var] < lowest
+        choice[lower] = alt
+        lowest = np.where(lower, result[choose_var], lowest)
+    for var in written:
+        values = array(var)
+        values[:] = results[0][var]
+        for alt, result in enumerate(results[1:], 1):
+            values[:] = np.where(choice == alt, result[var], values)
+
+
+def make_fused_function(kernels, do_jit=DO_JIT, parallel=None,
+                        alternatives=None, choose_var=None):
+    """
+    Takes a list of functions decorated by iterate_jit and creates a
+    single function that calls all of them, in list order, for one record
+    before moving on to the next record.  Values calculated by one of the
+    functions are passed to the later functions as local variables rather
+    than being read back from the record arrays, and each out argument is
+    written to its record array once per record.
+
+    When alternatives is specified, the functions are called for each
+    record once for each alternative and only the results of the
+    alternative with the smallest value of choose_var are written to the
+    record arrays (see the create_fused_function_string function).
+
+    Parameters
+    ----------
+    kernels: list of functions decorated by iterate_jit
+
+    do_jit: Bool, if True, jit the resulting fused function; otherwise,
+            the kernels are called one after the other for all the records
+
+    parallel: Bool or None, specifies whether or not the record loop is
+              split across threads; None implies a parallel loop only when
+              NUM_THREADS is greater than one
+
+    alternatives: None or list of dictionaries, each of which maps record
+                  variables to the numeric values they are set to before
+                  the kernels are called for that alternative
+
+    choose_var: name of the variable used to choose among alternatives
+
+    Returns
+    -------
+    fused function that is called with (pm, pf) arguments like each of
+    the kernels when called with return_dataframe=False
+    """
+    stages = [(kernel.out_args, kernel.in_args) for kernel in kernels]
+    out_args = set()
+    for kernel in kernels:
+        out_args.update(kernel.out_args)
+    parameters = set()
+    for kernel in kernels:
+        parameters.update(kernel.parameters)
+    fused_funcs = dict()
+    arg_sources = weakref.WeakKeyDictionary()
+
+    def make_loop_function(use_parallel):
+        """
+        make_loop_function nested in make_fused_function function.
+        """
+        fused_src, arg_names = create_fused_function_string(
+            stages, parameters, parallel=use_parallel,
+            alternatives=alternatives, choose_var=choose_var)
+        env = dict()
+        for idx, kernel in enumerate(kernels):
+            if do_jit:
+                env['f_' + str(idx)] = jit(**kernel.jit_kwargs)(
+                    kernel.calc_func)
+            else:
+                env['f_' + str(idx)] = kernel.calc_func
+        if do_jit and use_parallel and numba is not None:
+            env['prange'] = numba.prange
+        else:
+            env['prange'] = range
+        jit_kwargs = dict()
+        for kernel in kernels:
+            jit_kwargs.update(kernel.jit_kwargs)
+        if use_parallel:
+            jit_kwargs['parallel'] = True
+        fused_func, cachable = load_generated_function(
+            fused_src, 'fused_func', env,
+            depends_on=[kernel.calc_func for kernel in kernels],
+            use_cache=do_jit, jit_kwargs=jit_kwargs)
+        if do_jit:
+            if cachable:
+                jit_kwargs['cache'] = True
+            return (jit(**jit_kwargs)(fused_func), arg_names)
+        return (fused_func, arg_names)
+
+    def fused_wrapper(*args):
+        """
+        fused_wrapper function nested in make_fused_function function.
+        """
+        if not do_jit:
+            _call_kernels(kernels, args, alternatives, choose_var)
+            return
+        if parallel is None:
+            use_parallel = NUM_THREADS > 1
+        else:
+            use_parallel = parallel
+        if use_parallel not in fused_funcs:
+            fused_funcs[use_parallel] = make_loop_function(use_parallel)
+        fused_f, arg_names = fused_funcs[use_parallel]
+        upcast_in = compact_storage(args[1])
+        sources = _arg_sources(arg_sources, arg_names, args[0], args[1])
+        arrays = []
+        for farg, source in zip(arg_names, sources):
+            if source == 'pm':
+                arrays.append(getattr(args[0], farg))
+            elif upcast_in and farg not in out_args:
+                arrays.append(upcast(getattr(args[1], farg)))
+            else:
+                arrays.append(getattr(args[1], farg))
+        fused_f(*arrays)
+
+    fused_wrapper.kernels = tuple(kernels)
+    return fused_wrapper
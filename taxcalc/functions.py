@@ -13,7 +13,6 @@ Tax-Calculator functions that calculate payroll and individual income taxes.
 
 
 import math
-import copy
 import numpy as np
 from .decorators import iterate_jit, jit
 
@@ -207,9 +206,7 @@ def ALD_InvInc_ec_base_code(calc):
     code = calc.policy.param_code['ALD_InvInc_ec_base_code']
     visible = {'min': np.minimum, 'max': np.maximum,
                'where': np.where, 'equal': np.equal}
-    variables = ['e00300', 'e00600', 'e00650', 'e01100', 'e01200',
-                 'p22250', 'p23250', '_sep']
-    for var in variables:
+    for var in ALD_InvInc_ec_base_code.in_args:
         visible[var] = getattr(calc.records, var)
     visible['cpi'] = calc.policy.cpi_for_param_code('ALD_InvInc_ec_base_code')
     visible['returned_value'] = calc.records.invinc_ec_base
@@ -218,6 +215,13 @@ def ALD_InvInc_ec_base_code(calc):
     calc.records.invinc_ec_base = visible['returned_value']
 
 
+# records variables used and calculated by ALD_InvInc_ec_base_code,
+# named like the attributes of functions decorated by iterate_jit
+ALD_InvInc_ec_base_code.in_args = ['e00300', 'e00600', 'e00650', 'e01100',
+                                   'e01200', 'p22250', 'p23250', '_sep']
+ALD_InvInc_ec_base_code.out_args = ['invinc_ec_base']
+
+
 @iterate_jit(nopython=True)
 def CapGains(p23250, p22250, _sep, ALD_StudentLoan_hc,
              ALD_InvInc_ec_rt, invinc_ec_base,
@@ -1266,8 +1270,7 @@ def CTC_new_code(calc):
     code = calc.policy.param_code['CTC_new_code']
     visible = {'min': np.minimum, 'max': np.maximum,
                'where': np.where, 'equal': np.equal}
-    variables = ['n24', 'c00100', 'nu05', 'MARS', 'ptax_oasdi', 'c09200']
-    for var in variables:
+    for var in CTC_new_code.in_args:
         visible[var] = getattr(calc.records, var)
     visible['cpi'] = calc.policy.cpi_for_param_code('CTC_new_code')
     visible['returned_value'] = calc.records.ctc_new
@@ -1276,6 +1279,12 @@ def CTC_new_code(calc):
     calc.records.ctc_new = visible['returned_value']
 
 
+# records variables used and calculated by CTC_new_code
+CTC_new_code.in_args = ['n24', 'c00100', 'nu05', 'MARS', 'ptax_oasdi',
+                        'c09200']
+CTC_new_code.out_args = ['ctc_new']
+
+
 @iterate_jit(nopython=True)
 def IITAX(c59660, c11070, c10960, personal_credit, ctc_new,
           c09200, _payrolltax,
@@ -1325,32 +1334,48 @@ def Taxes(income, MARS, tbrk_base,
             rate8 * max(0., income - brk7))
 
 
+# names of the itemized-deduction haircut parameters in ID_switch order
+ID_HAIRCUT_PARAMETERS = ['ID_Medical_hc', 'ID_StateLocalTax_hc',
+                         'ID_RealEstate_hc', 'ID_Casualty_hc',
+                         'ID_Miscellaneous_hc', 'ID_InterestPaid_hc',
+                         'ID_Charity_hc']
+
+
 def ComputeBenefit(calc, ID_switch):
     """
     Calculates the value of the benefits accrued from itemizing.
     """
     # compute income tax liability with no itemized deductions allowed for
-    # the types of itemized deductions covered under the BenefitSurtax
-    no_ID_calc = copy.deepcopy(calc)
-    if ID_switch[0]:
-        no_ID_calc.policy.ID_Medical_hc = 1.
-    if ID_switch[1]:
-        no_ID_calc.policy.ID_StateLocalTax_hc = 1.
-    if ID_switch[2]:
-        no_ID_calc.policy.ID_RealEstate_hc = 1.
-    if ID_switch[3]:
-        no_ID_calc.policy.ID_Casualty_hc = 1.
-    if ID_switch[4]:
-        no_ID_calc.policy.ID_Miscellaneous_hc = 1.
-    if ID_switch[5]:
-        no_ID_calc.policy.ID_InterestPaid_hc = 1.
-    if ID_switch[6]:
-        no_ID_calc.policy.ID_Charity_hc = 1.
-    no_ID_calc.calc_one_year()
+    # the types of itemized deductions covered under the BenefitSurtax,
+    # which is computed only once by each calc_all call for each ID_switch
+    # (so BenefitSurtax and BenefitLimitation can share it) and every time
+    # this is called outside calc_all
     # pylint: disable=protected-access
+    key = tuple(bool(switch) for switch in ID_switch)
+    saved = calc._no_ID_iitax
+    no_ID_iitax = None if saved is None else saved.get(key, None)
+    if no_ID_iitax is None:
+        # call calc_one_year for calc itself with temporarily changed
+        # haircut parameters and then restore the calculated variables,
+        # rather than calling it for a deepcopy of calc
+        haircuts = [param for param, switch in zip(ID_HAIRCUT_PARAMETERS, key)
+                    if switch]
+        saved_haircuts = [getattr(calc.policy, param) for param in haircuts]
+        snapshot = calc.records.snapshot(calc.records.CALCULATED_VARS)
+        for param in haircuts:
+            setattr(calc.policy, param, 1.)
+        try:
+            calc.calc_one_year()
+            no_ID_iitax = calc.records._iitax.copy()
+        finally:
+            for param, value in zip(haircuts, saved_haircuts):
+                setattr(calc.policy, param, value)
+            calc.records.restore(snapshot)
+        if saved is not None:
+            saved[key] = no_ID_iitax
     benefit = np.where(
-        no_ID_calc.records._iitax - calc.records._iitax > 0.,
-        no_ID_calc.records._iitax - calc.records._iitax, 0.)
+        no_ID_iitax - calc.records._iitax > 0.,
+        no_ID_iitax - calc.records._iitax, 0.)
     return benefit
 
 
@@ -0,0 +1,145 @@
+"""
+Tax-Calculator low-latency calculations for a few tax filing units.
+"""
+# CODING-STYLE CHECKS:
+# pep8 --ignore=E402 household.py
+# pylint --disable=locally-disabled household.py
+# (when importing numpy, add "--extension-pkg-whitelist=numpy" pylint option)
+
+import six
+import numpy as np
+from .policy import Policy
+from .records import Records
+from .calculate import Calculator
+
+
+class HouseholdCalculator(object):
+    """
+    Constructor for the household calculator class, which calculates the
+    taxes of one (or a few) tax filing units many times without the cost
+    of constructing a Records object from a DataFrame or a new Calculator
+    object for each calculation.  The policy parameters, the Calculator
+    object and the compiled tax-calculating functions are all reused by
+    each call of the calculate method, which does not use Pandas.
+
+    Parameters
+    ----------
+    policy: Policy class object or None
+        specifies the policy used in the calculations; default value is
+        None, which implies current-law policy.
+
+    exact_calculations: boolean
+        specifies whether or not exact tax calculations are done without
+        any smoothing of "stair-step" provisions in income tax law;
+        default value is false.
+
+    Raises
+    ------
+    ValueError:
+        if policy is neither None nor a Policy object.
+
+    Returns
+    -------
+    class instance: HouseholdCalculator
+    """
+
+    # default output variables returned by the calculate method
+    DEFAULT_OUTPUT_VARS = ('c00100', '_standard', 'c04470', 'c04800',
+                           'c05800', 'c07100', 'c09600', '_eitc',
+                           '_iitax', '_payrolltax', '_combined')
+
+    # total variables that are the sum of taxpayer and spouse variables
+    SPLIT_VARS = {'e00200': ('e00200p', 'e00200s'),
+                  'e00900': ('e00900p', 'e00900s'),
+                  'e02100': ('e02100p', 'e02100s')}
+
+    def __init__(self, policy=None, exact_calculations=False):
+        if policy is None:
+            policy = Policy()
+        elif not isinstance(policy, Policy):
+            raise ValueError('policy must be None or a Policy object')
+        self.exact_calculations = exact_calculations
+        records = Records.zeros(1, start_year=policy.current_year,
+                                exact_calculations=exact_calculations)
+        self.calc = Calculator(policy=policy, records=records,
+                               verbose=False, sync_years=False)
+
+    def calculate(self, inputs, year=None,
+                  output_vars=DEFAULT_OUTPUT_VARS):
+        """
+        Calculate taxes for the tax filing units described by inputs.
+
+        Parameters
+        ----------
+        inputs: dictionary or numpy structured array
+            maps each specified Records.USABLE_READ_VARS name to either a
+            number (for a single filing unit) or a sequence of numbers (one
+            for each filing unit); all unspecified input variables are zero,
+            except that a total variable such as e00200 is the sum of its
+            taxpayer and spouse variables when it is not specified, and its
+            taxpayer variable (e00200p) equals the total when neither of
+            them is specified.
+
+        year: integer or None
+            calendar year of the policy used in the calculations; default
+            value is None, which implies the policy's current year.
+
+        output_vars: iterable of Records variable names
+
+        Returns
+        -------
+        dictionary with each output_vars name as a key and, as the value,
+        an array containing the value of that variable for each filing unit
+
+        Raises
+        ------
+        ValueError:
+            if inputs contain names that are not USABLE_READ_VARS, do not
+            contain MARS, do not contain the same number of values for
+            each variable, or contain a total variable that is not the sum
+            of its specified taxpayer and spouse variables.
+        """
+        if isinstance(inputs, np.ndarray) and inputs.dtype.names:
+            inputs = dict((name, inputs[name]) for name in inputs.dtype.names)
+        unknown = set(inputs) - Records.USABLE_READ_VARS
+        if unknown:
+            msg = 'inputs contain unknown variables: {}'
+            raise ValueError(msg.format(sorted(unknown)))
+        if 'MARS' not in inputs:
+            raise ValueError('inputs do not contain MARS variable')
+        values = dict((name, np.atleast_1d(value))
+                      for name, value in six.iteritems(inputs))
+        dims = set(len(value) for value in values.values())
+        if len(dims) > 1:
+            raise ValueError('inputs have different numbers of values')
+        dim = dims.pop() if dims else 1
+        recs = self.calc.records
+        if year is None:
+            year = self.calc.policy.current_year
+        if recs.dim != dim:
+            recs = Records.zeros(dim, start_year=year,
+                                 exact_calculations=self.exact_calculations)
+            self.calc.records = recs
+        else:
+            for varname in Records.USABLE_READ_VARS:
+                getattr(recs, varname).fill(0)
+            recs.zero_out_changing_calculated_vars()
+            recs.set_current_year(year)
+        for name, value in six.iteritems(values):
+            getattr(recs, name)[:] = value
+        for total, parts in six.iteritems(HouseholdCalculator.SPLIT_VARS):
+            parts_sum = getattr(recs, parts[0]) + getattr(recs, parts[1])
+            if total not in values:
+                getattr(recs, total)[:] = parts_sum
+            elif parts[0] not in values and parts[1] not in values:
+                getattr(recs, parts[0])[:] = getattr(recs, total)
+            elif not np.allclose(getattr(recs, total), parts_sum,
+                                 rtol=0.0, atol=0.001):
+                msg = ('expression "{0} == {0}p + {0}s" is not true for '
+                       'every filing unit')
+                raise ValueError(msg.format(total))
+        recs.set_mars_derived_vars()
+        if year != self.calc.policy.current_year:
+            self.calc.policy.set_year(year)
+        self.calc.calc_all()
+        return dict((var, np.copy(getattr(recs, var))) for var in output_vars)
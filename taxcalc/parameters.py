@@ -3,6 +3,7 @@ Tax-Calculator abstract base parameters class.
 """
 import os
 import json
+import pkgutil
 import numpy as np
 from abc import ABCMeta
 from collections import OrderedDict
@@ -221,10 +222,8 @@ class ParametersBase(object):
             with open(path) as pfile:
                 params_dict = json.load(pfile, object_pairs_hook=OrderedDict)
         else:
-            from pkg_resources import resource_stream, Requirement
-            path_in_egg = os.path.join('taxcalc', cls.DEFAULTS_FILENAME)
-            buf = resource_stream(Requirement.parse('taxcalc'), path_in_egg)
-            as_bytes = buf.read()
+            # read the file from the installed (possibly zipped) package
+            as_bytes = pkgutil.get_data('taxcalc', cls.DEFAULTS_FILENAME)
             as_string = as_bytes.decode("utf-8")
             params_dict = json.loads(as_string, object_pairs_hook=OrderedDict)
         return params_dict
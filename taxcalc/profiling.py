@@ -0,0 +1,177 @@
+"""
+Tax-Calculator opt-in profiling of calculations.
+"""
+# CODING-STYLE CHECKS:
+# pep8 --ignore=E402 profiling.py
+# pylint --disable=locally-disabled profiling.py
+
+import json
+import time
+import functools
+from collections import OrderedDict
+try:
+    import tracemalloc  # pylint: disable=import-error
+    TRACEMALLOC_AVAILABLE = True
+except ImportError:  # Python 2.7 has no tracemalloc module
+    TRACEMALLOC_AVAILABLE = False
+
+
+# Profiler object that is recording timings, or None when profiling is
+# disabled, in which case the instrumented code does nothing but check
+# whether or not this value is None.  Use the Profiler.enable and
+# Profiler.disable methods (or a with statement) to change this value.
+PROFILER = None
+
+
+class Profiler(object):
+    """
+    Constructor for the profiler class, which records, for each instrumented
+    section of Tax-Calculator code that is executed while the profiler is
+    enabled, the number of calls, the total wall time, the wall time of the
+    calls that compiled numba code, and the net number of bytes allocated.
+
+    The instrumented sections are the Calculator calc_all, calc_one_year,
+    mtr and mtrs methods, each stage of calc_all (see the
+    Calculator._calc_stages method), the Behavior.response method, and each
+    iterate_jit function, whose section names begin with 'Calculator.',
+    'stage:', 'Behavior.' and 'kernel:' respectively.  Sections can be
+    nested, so the time of a stage includes the time of its kernels.
+
+    Parameters
+    ----------
+    track_memory: boolean
+        specifies whether or not the net bytes allocated by each section
+        are recorded using the tracemalloc module, which slows down the
+        calculations and requires Python 3.4 or later; default value is
+        false.
+
+    Raises
+    ------
+    ValueError:
+        if track_memory is true and the tracemalloc module is unavailable.
+
+    Returns
+    -------
+    class instance: Profiler
+
+    Notes
+    -----
+    Typical usage is:
+        prof = Profiler()
+        with prof:
+            calc.calc_all()
+        print(prof.to_json())
+    """
+
+    def __init__(self, track_memory=False):
+        if track_memory and not TRACEMALLOC_AVAILABLE:
+            raise ValueError('track_memory requires the tracemalloc module')
+        self.track_memory = track_memory
+        self._stats = OrderedDict()
+        self._started_tracing = False
+
+    def enable(self):
+        """
+        Make this profiler record the instrumented sections until disable
+        is called (replacing any other enabled profiler).
+        """
+        global PROFILER  # pylint: disable=global-statement
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        PROFILER = self
+
+    def disable(self):
+        """
+        Stop recording the instrumented sections.
+        """
+        global PROFILER  # pylint: disable=global-statement
+        if PROFILER is self:
+            PROFILER = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def reset(self):
+        """
+        Discard all recorded statistics.
+        """
+        self._stats = OrderedDict()
+
+    def call(self, name, func, args, kwargs, dispatcher=None):
+        """
+        Call func(*args, **kwargs) and record its statistics under name.
+        When dispatcher is a numba-compiled function, a call that adds a
+        compiled signature to it is also counted as compile time.
+        """
+        num_sigs = len(getattr(dispatcher, 'signatures', ()))
+        tracing = self.track_memory and tracemalloc.is_tracing()
+        if tracing:
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.time() - start
+            stats = self._stats.get(name, None)
+            if stats is None:
+                stats = OrderedDict([('calls', 0), ('seconds', 0.),
+                                     ('compile_seconds', 0.),
+                                     ('net_bytes', 0)])
+                self._stats[name] = stats
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            if len(getattr(dispatcher, 'signatures', ())) > num_sigs:
+                stats['compile_seconds'] += seconds
+            if tracing:
+                stats['net_bytes'] += (tracemalloc.get_traced_memory()[0] -
+                                       start_bytes)
+
+    def report(self):
+        """
+        Return dictionary containing, for each section name, a dictionary
+        with the 'calls', 'seconds', 'compile_seconds' and 'net_bytes'
+        statistics of that section in the order the sections were first
+        called.
+        """
+        return OrderedDict((name, OrderedDict(stats))
+                           for name, stats in self._stats.items())
+
+    def to_json(self, filename=None):
+        """
+        Return report as a JSON string, which is also written to the file
+        with the specified filename when filename is not None.
+        """
+        text = json.dumps(self.report(), indent=2)
+        if filename is not None:
+            with open(filename, 'w') as jfile:
+                jfile.write(text)
+        return text
+
+
+def profiled(name):
+    """
+    Make a decorator that records the calls of the decorated function under
+    the specified section name when a Profiler is enabled.
+    """
+    def make_wrapper(func):
+        """
+        make_wrapper function nested in profiled function.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            """
+            wrapper function nested in make_wrapper function.
+            """
+            if PROFILER is None:
+                return func(*args, **kwargs)
+            return PROFILER.call(name, func, args, kwargs)
+        return wrapper
+    return make_wrapper
@@ -8,10 +8,16 @@ Tax-Calculator tax-filing-unit Records class.
 
 
 import os
+import copy
+import json
+import shutil
+import hashlib
+import tempfile
+import pkgutil
 import six
 import numpy as np
 import pandas as pd
-from pkg_resources import resource_stream, Requirement, DistributionNotFound
+from . import decorators
 
 
 PUFCSV_YEAR = 2009
@@ -24,7 +30,8 @@ class Records(object):
     Parameters
     ----------
     data: string or Pandas DataFrame
-        string describes CSV file in which records data reside;
+        string describes CSV file in which records data reside, or
+        describes directory written by the write_columnar_data method;
         DataFrame already contains records data;
         default value is the string 'puf.csv'
         For details on how to use your own data with the Tax-Calculator,
@@ -59,6 +66,22 @@ class Records(object):
               look at the test_Calculator_using_nonstd_input()
               function in the taxcalc/tests/test_calculate.py file.
 
+    blowup_mapping: dictionary or None
+        maps each variable changed by Stage 1 blowup to the name of its
+        blowup factor, or to a (factor for nonnegative values, factor for
+        negative values) tuple, as in the BLOWUP_MAPPING table;
+        default value is None, which implies the BLOWUP_MAPPING table.
+
+    storage: string
+        specifies how the variables are stored, which is one of the
+        STORAGE_MODES; 'compact' uses int8 or int16 values for the small
+        categorical and flag variables whose values fit in those dtypes,
+        and 'compact32' also uses float32
+        values for the input dollar amounts, which substantially reduces
+        the memory used by large samples; the variables are converted to
+        float64 or int64 values when passed to the tax-calculating
+        functions; default value is 'standard'.
+
     Raises
     ------
     ValueError:
@@ -91,6 +114,14 @@ class Records(object):
     WEIGHTS_PATH = os.path.join(CUR_PATH, WEIGHTS_FILENAME)
     BLOWUP_FACTORS_FILENAME = 'StageIFactors.csv'
     BLOWUP_FACTORS_PATH = os.path.join(CUR_PATH, BLOWUP_FACTORS_FILENAME)
+    # name of file that lists the variables in a columnar data directory
+    COLUMNAR_INDEX_FILENAME = 'columns.json'
+    # specifies whether or not the parsed contents of CSV files are cached
+    # (see the _cached_csv method), and the version of the cache format,
+    # which must be incremented whenever the parsing of CSV files changes
+    USE_CSV_CACHE = True
+    CSV_CACHE_VERSION = 2
+    CSV_CACHE_DIRNAME = '.taxcalc_cache'
 
     # specify set of input variables used in Tax-Calculator calculations:
     USABLE_READ_VARS = set([
@@ -172,18 +203,103 @@ class Records(object):
     CHANGING_CALCULATED_VARS = (CALCULATED_VARS - INTEGER_CALCULATED_VARS -
                                 set(['ID_Casualty_frt_in_pufcsv_year']))
 
+    # specify Stage 1 blowup table, which maps each input variable that is
+    # changed by blowup to the name of the blowup factor that multiplies
+    # it, or to a (factor for nonnegative values, factor for negative
+    # values) tuple when the factor depends on the sign of the value; a
+    # table with the same format can be passed to the Records constructor:
+    BLOWUP_MAPPING = {
+        'e00200': 'AWAGE', 'e00200p': 'AWAGE', 'e00200s': 'AWAGE',
+        'e00300': 'AINTS', 'e00400': 'AINTS',
+        'e00600': 'ADIVS', 'e00650': 'ADIVS',
+        'e00700': 'ATXPY', 'e00800': 'ATXPY',
+        'e00900': ('ASCHCI', 'ASCHCL'), 'e00900p': ('ASCHCI', 'ASCHCL'),
+        'e00900s': ('ASCHCI', 'ASCHCL'),
+        'e01100': 'ACGNS', 'e01200': 'ACGNS',
+        'e01400': 'ATXPY', 'e01500': 'ATXPY', 'e01700': 'ATXPY',
+        'e02000': ('ASCHEI', 'ASCHEL'),
+        'e02100': 'ASCHF', 'e02100p': 'ASCHF', 'e02100s': 'ASCHF',
+        'e02300': 'AUCOMP', 'e02400': 'ASOCSEC',
+        'e03150': 'ATXPY', 'e03210': 'ATXPY', 'e03220': 'ATXPY',
+        'e03230': 'ATXPY', 'e03240': 'AGDPN', 'e03270': 'ACPIM',
+        'e03290': 'ACPIM', 'e03300': 'ATXPY', 'e03400': 'ATXPY',
+        'e03500': 'ATXPY',
+        'e07240': 'ATXPY', 'e07260': 'ATXPY',
+        'e07300': 'ABOOK', 'e07400': 'ABOOK',
+        'p08000': 'ATXPY', 'e09700': 'ATXPY', 'e09800': 'ATXPY',
+        'e09900': 'ATXPY', 'e11200': 'ATXPY',
+        # ITEMIZED DEDUCTIONS
+        'e17500': 'ACPIM', 'e18400': 'ATXPY', 'e18500': 'ATXPY',
+        'e19200': 'AIPD', 'e19800': 'ATXPY', 'e20100': 'ATXPY',
+        'e20400': 'ATXPY', 'e20500': 'ATXPY',
+        # CAPITAL GAINS
+        'p22250': 'ACGNS', 'p23250': 'ACGNS',
+        'e24515': 'ACGNS', 'e24518': 'ACGNS',
+        # SCHEDULE E
+        'p25470': 'ASCHEI', 'e26270': 'ASCHEI', 'e27200': 'ASCHEI',
+        # MISCELLANOUS SCHEDULES
+        'e07600': 'ATXPY', 'e32800': 'ATXPY', 'e58990': 'ATXPY',
+        'e62900': 'ATXPY', 'e87530': 'ATXPY', 'p87521': 'ATXPY',
+        'cmbtp': 'ATXPY'}
+
+    # specify set of input variables that are changed by Stage 1 blowup:
+    BLOWUP_VARS = set(BLOWUP_MAPPING)
+
+    # specify blowup factors used by Stage 1 blowup:
+    BLOWUP_FACTORS = ['AWAGE', 'AINTS', 'ADIVS', 'ATXPY', 'ASCHCI', 'ASCHCL',
+                      'ACGNS', 'ASCHEI', 'ASCHEL', 'ASCHF', 'AUCOMP',
+                      'ASOCSEC', 'ACPIM', 'AGDPN', 'ABOOK', 'AIPD']
+
+    # specify order of the variables whose values are the rows of the two
+    # contiguous 2D blocks (one float64 and one int64) that back all the
+    # USABLE_READ_VARS and CALCULATED_VARS arrays, with the float64
+    # CHANGING_CALCULATED_VARS being the leading rows of the float64 block
+    # so that they can be zeroed in a single operation, and with the
+    # BLOWUP_VARS having a single factor followed by those having
+    # sign-dependent factors being consecutive rows so that each kind of
+    # blowup is a single operation:
+    _SIGNED_BLOWUP_VARS = set(var for var, factor in BLOWUP_MAPPING.items()
+                              if isinstance(factor, tuple))
+    FLOAT_BLOCK_VARS = (
+        sorted(CHANGING_CALCULATED_VARS) +
+        sorted(CALCULATED_VARS - INTEGER_CALCULATED_VARS -
+               CHANGING_CALCULATED_VARS) +
+        sorted(BLOWUP_VARS - _SIGNED_BLOWUP_VARS) +
+        sorted(_SIGNED_BLOWUP_VARS) +
+        sorted(USABLE_READ_VARS - INTEGER_READ_VARS - BLOWUP_VARS))
+    INT_BLOCK_VARS = sorted(INTEGER_CALCULATED_VARS | INTEGER_READ_VARS)
+
+    # specify storage modes of the variable blocks: 'standard' stores all
+    # variables as float64 or int64 values; 'compact' stores each integer
+    # variable in COMPACT_INT_DTYPES using that smaller dtype when all its
+    # values fit in that dtype (and as int64 values otherwise); and
+    # 'compact32' also stores the float input variables other than s006 as
+    # float32 values (the calculated variables are always float64 values):
+    STORAGE_MODES = ('standard', 'compact', 'compact32')
+    COMPACT_INT_DTYPES = {
+        'DSI': 'int8', 'EIC': 'int8', 'f2441': 'int8', 'f6251': 'int8',
+        'n24': 'int8', 'XTOT': 'int8', 'MARS': 'int8', 'MIDR': 'int8',
+        'filer': 'int8', 'blind_head': 'int8', 'blind_spouse': 'int8',
+        'nu13': 'int8', 'elderly_dependent': 'int8',
+        'FLPDYR': 'int16', 'age_head': 'int16', 'age_spouse': 'int16',
+        '_num': 'int8', '_sep': 'int8', '_exact': 'int8'}
+    _STORAGE_LAYOUTS = dict()
+
     def __init__(self,
                  data='puf.csv',
                  exact_calculations=False,
                  blowup_factors=BLOWUP_FACTORS_PATH,
                  weights=WEIGHTS_PATH,
-                 start_year=PUFCSV_YEAR):
+                 start_year=PUFCSV_YEAR,
+                 blowup_mapping=None,
+                 storage='standard'):
         """
         Records class constructor
         """
         # pylint: disable=too-many-arguments
         # read specified data
-        self._read_data(data, exact_calculations)
+        self._read_data(data, exact_calculations, storage)
+        self._set_blowup_mapping(blowup_mapping)
         # check that three sets of split-earnings variables have valid values
         msg = 'expression "{0} == {0}p + {0}s" is not true for every record'
         if not np.allclose(self.e00200, (self.e00200p + self.e00200s),
@@ -204,6 +320,10 @@ class Records(object):
         # read extrapolation blowup factors and sample weights
         self.BF = None
         self._read_blowup(blowup_factors)
+        missing = set(self.BLOWUP_FACTORS) - set(self.BF.columns)
+        if not self.BF.empty and missing:
+            msg = 'blowup factors are missing factors: {}'
+            raise ValueError(msg.format(sorted(missing)))
         self.WT = None
         self._read_weights(weights)
         # weights must be same size as tax record data
@@ -246,6 +366,111 @@ class Records(object):
         if wt_colname in self.WT.columns:
             self.s006 = self.WT[wt_colname] * 0.01
 
+    def advance_to_year(self, year):
+        """
+        Sets current year to specified year, which must be no earlier than
+        the current year, doing variable blowup and reweighting for the new
+        current year.  The variables are blown up for each intervening
+        year in turn, so the results are identical to those of calling the
+        increment_year method once for each year (whereas blowing them up
+        once by the cumulative product of each blowup factor over the years
+        would round differently), but the weights are set only once.
+        """
+        if year < self.current_year:
+            msg = 'year {} passed to advance_to_year() is before {}'
+            raise ValueError(msg.format(year, self.current_year))
+        if year == self.current_year:
+            return
+        first_year = self.current_year + 1
+        self._current_year = year
+        # apply Stage 1 Extrapolation blowup factors for each year
+        for blowup_year in range(first_year, year + 1):
+            self._blowup(blowup_year)
+        # specify Stage 2 Extrapolation sample weights for the last year
+        # in [first_year, year] range that has them (as increment_year does)
+        for wt_year in range(year, first_year - 1, -1):
+            wt_colname = 'WT{}'.format(wt_year)
+            if wt_colname in self.WT.columns:
+                self.s006 = self.WT[wt_colname] * 0.01
+                break
+
+    def extrapolation_base(self):
+        """
+        Return (current_year, snapshot) tuple containing a copy of all the
+        BLOWUP_VARS for the current year, which can be passed to the
+        extrapolate_from method in order to move to any later year.
+        """
+        return (self.current_year, self.snapshot(self.BLOWUP_VARS))
+
+    def extrapolate_from(self, base, year):
+        """
+        Set the BLOWUP_VARS to their values in the specified year, which can
+        be before or after the current year but must be no earlier than the
+        year of the base returned by the extrapolation_base method.  The
+        variables are restored from the base and then blown up for each year
+        after the base year in turn, so the results are identical to those
+        of calling increment_year for each of those years.
+        """
+        base_year, snapshot = base
+        if year < base_year:
+            msg = 'year {} passed to extrapolate_from() is before {}'
+            raise ValueError(msg.format(year, base_year))
+        self.restore(snapshot)
+        self._current_year = base_year
+        wt_colname = 'WT{}'.format(base_year)
+        if wt_colname in self.WT.columns:
+            self.s006 = self.WT[wt_colname] * 0.01
+        self.advance_to_year(year)
+
+    @staticmethod
+    def write_columnar_data(data, dirname):
+        """
+        Write the USABLE_READ_VARS in data, which is either a string naming
+        a CSV file or a Pandas DataFrame, to the directory named dirname
+        as one binary NumPy .npy file for each block of standard storage
+        (see the _create_blocks method), in which the rows of the variables
+        that are not read are all zeros.  Passing dirname as the data
+        argument of the Records constructor with standard storage then
+        memory-maps those files copy-on-write as the blocks, so loading
+        copies no data, reads from disk only the pages that are used, and
+        shares unchanged pages among processes that load the same files;
+        other storage modes copy the mapped rows into their blocks.
+        """
+        if isinstance(data, six.string_types):
+            data = Records._read_csv(data)
+        elif not isinstance(data, pd.DataFrame):
+            msg = 'data is neither a string nor a Pandas DataFrame'
+            raise ValueError(msg)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        varnames = [name for name in data.columns.values
+                    if name in Records.USABLE_READ_VARS]
+        block_vars, block_row = Records._storage_layout('standard')
+        for key, names in six.iteritems(block_vars):
+            path = os.path.join(dirname, key + '.npy')
+            shape = (len(names), len(data))
+            if shape[0] * shape[1] == 0:
+                np.save(path, np.zeros(shape, dtype=key))
+                continue
+            # the new file is sparse, so the rows of unread variables take
+            # no disk space
+            block = np.lib.format.open_memmap(path, mode='w+', dtype=key,
+                                              shape=shape)
+            for varname in varnames:
+                if block_row[varname][0] == key:
+                    block[block_row[varname][1]] = data[varname].values
+            block.flush()
+            del block
+        ignored = [name for name in data.columns.values
+                   if name not in Records.USABLE_READ_VARS]
+        with open(os.path.join(dirname,
+                               Records.COLUMNAR_INDEX_FILENAME), 'w') as jfile:
+            json.dump({'dim': len(data),
+                       'read_vars': [str(name) for name in varnames],
+                       'ignored_vars': [str(name) for name in ignored],
+                       'blocks': block_vars},
+                      jfile)
+
     def set_current_year(self, new_current_year):
         """
         Sets current year to specified value and updates FLPDYR variable.
@@ -259,103 +484,86 @@ class Records(object):
     def _blowup(self, year):
         """
         Applies blowup factors (BF) to variables for specified calendar year.
+        The variables in each group of the blowup plan (see
+        _set_blowup_mapping) are blown up by a single operation on their
+        rows of a block.
         """
-        # pylint: disable=too-many-statements
-        # pylint: disable=too-many-locals
-        AWAGE = self.BF.AWAGE[year]
-        AINTS = self.BF.AINTS[year]
-        ADIVS = self.BF.ADIVS[year]
-        ATXPY = self.BF.ATXPY[year]
-        ASCHCI = self.BF.ASCHCI[year]
-        ASCHCL = self.BF.ASCHCL[year]
-        ACGNS = self.BF.ACGNS[year]
-        ASCHEI = self.BF.ASCHEI[year]
-        ASCHEL = self.BF.ASCHEL[year]
-        ASCHF = self.BF.ASCHF[year]
-        AUCOMP = self.BF.AUCOMP[year]
-        ASOCSEC = self.BF.ASOCSEC[year]
-        ACPIM = self.BF.ACPIM[year]
-        AGDPN = self.BF.AGDPN[year]
-        ABOOK = self.BF.ABOOK[year]
-        AIPD = self.BF.AIPD[year]
-        self.e00200 *= AWAGE
-        self.e00200p *= AWAGE
-        self.e00200s *= AWAGE
-        self.e00300 *= AINTS
-        self.e00400 *= AINTS
-        self.e00600 *= ADIVS
-        self.e00650 *= ADIVS
-        self.e00700 *= ATXPY
-        self.e00800 *= ATXPY
-        self.e00900[:] = np.where(self.e00900 >= 0,
-                                  self.e00900 * ASCHCI,
-                                  self.e00900 * ASCHCL)
-        self.e00900s[:] = np.where(self.e00900s >= 0,
-                                   self.e00900s * ASCHCI,
-                                   self.e00900s * ASCHCL)
-        self.e00900p[:] = np.where(self.e00900p >= 0,
-                                   self.e00900p * ASCHCI,
-                                   self.e00900p * ASCHCL)
-        self.e01100 *= ACGNS
-        self.e01200 *= ACGNS
-        self.e01400 *= ATXPY
-        self.e01500 *= ATXPY
-        self.e01700 *= ATXPY
-        self.e02000[:] = np.where(self.e02000 >= 0,
-                                  self.e02000 * ASCHEI,
-                                  self.e02000 * ASCHEL)
-        self.e02100 *= ASCHF
-        self.e02100p *= ASCHF
-        self.e02100s *= ASCHF
-        self.e02300 *= AUCOMP
-        self.e02400 *= ASOCSEC
-        self.e03150 *= ATXPY
-        self.e03210 *= ATXPY
-        self.e03220 *= ATXPY
-        self.e03230 *= ATXPY
-        self.e03270 *= ACPIM
-        self.e03240 *= AGDPN
-        self.e03290 *= ACPIM
-        self.e03300 *= ATXPY
-        self.e03400 *= ATXPY
-        self.e03500 *= ATXPY
-        self.e07240 *= ATXPY
-        self.e07260 *= ATXPY
-        self.e07300 *= ABOOK
-        self.e07400 *= ABOOK
-        self.p08000 *= ATXPY
-        self.e09700 *= ATXPY
-        self.e09800 *= ATXPY
-        self.e09900 *= ATXPY
-        self.e11200 *= ATXPY
-        # ITEMIZED DEDUCTIONS
-        self.e17500 *= ACPIM
-        self.e18400 *= ATXPY
-        self.e18500 *= ATXPY
-        self.e19200 *= AIPD
-        self.e19800 *= ATXPY
-        self.e20100 *= ATXPY
-        self.e20400 *= ATXPY
-        self.e20500 *= ATXPY
-        # CAPITAL GAINS
-        self.p22250 *= ACGNS
-        self.p23250 *= ACGNS
-        self.e24515 *= ACGNS
-        self.e24518 *= ACGNS
-        # SCHEDULE E
-        self.p25470 *= ASCHEI
-        self.e26270 *= ASCHEI
-        self.e27200 *= ASCHEI
-        # MISCELLANOUS SCHEDULES
-        self.e07600 *= ATXPY
-        self.e32800 *= ATXPY
-        self.e58990 *= ATXPY
-        self.e62900 *= ATXPY
-        self.e87530 *= ATXPY
-        self.p87521 *= ATXPY
-        self.cmbtp *= ATXPY
+        factors = dict((name, self.BF[name][year])
+                       for name in self.BLOWUP_FACTORS)
+        for key, rows, names, pos_names, neg_names in self._blowup_plan:
+            block = self._blocks[key]
+            pos = np.array([factors[name] for name in pos_names])
+            if neg_names is None:
+                block[rows] *= pos[:, np.newaxis]
+            else:
+                neg = np.array([factors[name] for name in neg_names])
+                values = block[rows]
+                block[rows] = values * np.where(values >= 0,
+                                                pos[:, np.newaxis],
+                                                neg[:, np.newaxis])
+            # blow up variables that are no longer rows of the block
+            for idx, name in enumerate(names):
+                var = getattr(self, name)
+                if var is self._block_views[name]:
+                    continue
+                if neg_names is None:
+                    var *= pos[idx]
+                else:
+                    var[:] = np.where(var >= 0, var * pos[idx],
+                                      var * neg[idx])
 
-    def _read_data(self, data, exact_calcs):
+    def _set_blowup_mapping(self, blowup_mapping):
+        """
+        Specify the Stage 1 blowup table (where None implies the default
+        BLOWUP_MAPPING table) and make from it the blowup plan used by the
+        _blowup method, which contains a group of variables having a single
+        factor and a group of variables having sign-dependent factors for
+        each block that contains variables changed by blowup.
+        """
+        if blowup_mapping is None:
+            blowup_mapping = Records.BLOWUP_MAPPING
+        elif not isinstance(blowup_mapping, dict):
+            msg = 'blowup_mapping is not None or a dictionary'
+            raise ValueError(msg)
+        float_vars = Records.USABLE_READ_VARS - Records.INTEGER_READ_VARS
+        unknown = set(blowup_mapping) - float_vars
+        if unknown:
+            msg = 'blowup_mapping contains invalid variables: {}'
+            raise ValueError(msg.format(sorted(unknown)))
+        factor_names = set()
+        groups = dict()
+        for name, factor in six.iteritems(blowup_mapping):
+            key, row = self._block_row[name]
+            if isinstance(factor, six.string_types):
+                item = (row, name, factor, None)
+                factor_names.add(factor)
+            elif (isinstance(factor, (tuple, list)) and len(factor) == 2 and
+                  all(isinstance(f, six.string_types) for f in factor)):
+                item = (row, name, factor[0], factor[1])
+                factor_names.update(factor)
+            else:
+                msg = 'blowup_mapping value for {} is invalid: {}'
+                raise ValueError(msg.format(name, factor))
+            groups.setdefault((key, item[3] is not None), []).append(item)
+        self._blowup_plan = list()
+        for (key, _), group in sorted(groups.items()):
+            group.sort()
+            rows = [item[0] for item in group]
+            if rows == list(range(rows[0], rows[-1] + 1)):
+                rows = slice(rows[0], rows[-1] + 1)
+            else:
+                rows = np.array(rows)
+            names = [item[1] for item in group]
+            pos_names = [item[2] for item in group]
+            neg_names = None
+            if group[0][3] is not None:
+                neg_names = [item[3] for item in group]
+            self._blowup_plan.append((key, rows, names,
+                                      pos_names, neg_names))
+        self.BLOWUP_VARS = set(blowup_mapping)
+        self.BLOWUP_FACTORS = sorted(factor_names)
+
+    def _read_data(self, data, exact_calcs, storage):
         """
         Read Records data from file or use specified DataFrame as data.
         Specifies _exact array depending on boolean value of exact_calcs.
@@ -364,49 +572,118 @@ class Records(object):
         if isinstance(data, pd.DataFrame):
             taxdf = data
         elif isinstance(data, six.string_types):
-            if data.endswith('gz'):
-                taxdf = pd.read_csv(data, compression='gzip')
+            if os.path.isdir(data):
+                taxdf = None
             else:
-                taxdf = pd.read_csv(data)
+                taxdf = Records._cached_csv(
+                    data, '.columns', Records._read_csv,
+                    Records.write_columnar_data, None)
+                if taxdf is None:
+                    # the columnar data cache of the CSV file is current
+                    data = Records._csv_cache_path(data, '.columns')
         else:
             msg = 'data is neither a string nor a Pandas DataFrame'
             raise ValueError(msg)
+        if taxdf is None:
+            READ_VARS = self._read_columnar_data(data, storage)
+        else:
+            READ_VARS = self._read_dataframe_data(taxdf, storage)
+        self._create_unread_vars(READ_VARS, exact_calcs)
+
+    def _read_dataframe_data(self, taxdf, storage):
+        """
+        Create Records variables from the columns of the taxdf DataFrame
+        and return the set of their names.
+        """
         self.dim = len(taxdf)
         self.index = taxdf.index
-        # create class variables using taxdf column names
-        READ_VARS = set()
+        # convert taxdf columns and copy them into the rows of the blocks
+        columns = dict()
         self.IGNORED_VARS = set()
         for varname in list(taxdf.columns.values):
-            if varname in Records.USABLE_READ_VARS:
-                READ_VARS.add(varname)
-                if varname in Records.INTEGER_READ_VARS:
-                    setattr(self, varname,
-                            taxdf[varname].astype(np.int64).values)
-                else:
-                    setattr(self, varname,
-                            taxdf[varname].astype(np.float64).values)
+            if varname in Records.INTEGER_READ_VARS:
+                columns[varname] = taxdf[varname].astype(np.int64).values
+            elif varname in Records.USABLE_READ_VARS:
+                columns[varname] = taxdf[varname].astype(np.float64).values
             else:
                 self.IGNORED_VARS.add(varname)
-        # check that MUST_READ_VARS are all present in taxdf
+        self._create_blocks(storage, Records._wide_int_vars(storage,
+                                                            columns))
+        for varname, values in six.iteritems(columns):
+            getattr(self, varname)[:] = values
+        return set(columns)
+
+    def _read_columnar_data(self, dirname, storage):
+        """
+        Create Records variables by memory-mapping copy-on-write the block
+        files in the dirname directory written by the write_columnar_data
+        method, so changes to the variables (such as blowup) are never
+        written back to the files.  With standard storage the mapped files
+        are the blocks (see the _create_blocks method); otherwise, or when
+        the files were written with a different block layout, the rows of
+        the read variables are copied into new blocks.  Return the set of
+        names of the created variables.
+        """
+        path = os.path.join(dirname, Records.COLUMNAR_INDEX_FILENAME)
+        if not os.path.isfile(path):
+            msg = 'columnar data directory {} has no {} file'
+            raise ValueError(msg.format(dirname,
+                                        Records.COLUMNAR_INDEX_FILENAME))
+        with open(path, 'r') as jfile:
+            index = json.load(jfile)
+        self.dim = index['dim']
+        self.index = pd.RangeIndex(self.dim)
+        self.IGNORED_VARS = set(index['ignored_vars'])
+        mapped = dict()
+        for key, names in six.iteritems(index['blocks']):
+            mmap_mode = 'c' if names and self.dim else None
+            mapped[key] = np.load(os.path.join(dirname, key + '.npy'),
+                                  mmap_mode=mmap_mode).view(np.ndarray)
+        block_vars = Records._storage_layout('standard')[0]
+        if storage == 'standard' and index['blocks'] == block_vars:
+            self._create_blocks(storage, blocks=mapped)
+        else:
+            columns = dict()
+            for key, names in six.iteritems(index['blocks']):
+                for row, varname in enumerate(names):
+                    if varname in index['read_vars']:
+                        columns[varname] = mapped[key][row]
+            self._create_blocks(storage, Records._wide_int_vars(storage,
+                                                                columns))
+            for varname, values in six.iteritems(columns):
+                getattr(self, varname)[:] = values
+        return set(index['read_vars'])
+
+    @staticmethod
+    def _wide_int_vars(storage, columns):
+        """
+        Return frozenset of names of the COMPACT_INT_DTYPES variables whose
+        values in the columns dictionary do not fit in their compact dtype,
+        which are therefore stored as int64 values even when storage is
+        compact.
+        """
+        wide = set()
+        if storage != 'standard':
+            for varname, values in six.iteritems(columns):
+                dtype = Records.COMPACT_INT_DTYPES.get(varname, None)
+                if dtype is not None and len(values) > 0:
+                    info = np.iinfo(dtype)
+                    if values.min() < info.min or values.max() > info.max:
+                        wide.add(varname)
+        return frozenset(wide)
+
+    def _create_unread_vars(self, READ_VARS, exact_calcs):
+        """
+        Create the Records variables whose names are not in READ_VARS.
+        Specifies _exact array depending on boolean value of exact_calcs.
+        """
+        # check that MUST_READ_VARS are all present in data
         if not Records.MUST_READ_VARS.issubset(READ_VARS):
             msg = 'Records data missing one or more MUST_READ_VARS'
             raise ValueError(msg)
-        # create other class variables that are set to all zeros
-        UNREAD_VARS = Records.USABLE_READ_VARS - READ_VARS
-        ZEROED_VARS = Records.CALCULATED_VARS | UNREAD_VARS
-        INT_VARS = Records.INTEGER_READ_VARS | Records.INTEGER_CALCULATED_VARS
-        for varname in ZEROED_VARS:
-            if varname in INT_VARS:
-                setattr(self, varname,
-                        np.zeros(self.dim, dtype=np.int64))
-            else:
-                setattr(self, varname,
-                        np.zeros(self.dim, dtype=np.float64))
+        # other class variables are block rows that are already all zeros
         # create variables derived from MARS, which is in MUST_READ_VARS
-        self._num[:] = np.where(self.MARS == 2,
-                                2, 1)
-        self._sep[:] = np.where(np.logical_or(self.MARS == 3, self.MARS == 6),
-                                2, 1)
+        self.set_mars_derived_vars()
         # specify value of _exact array
         self._exact[:] = np.where(exact_calcs is True, 1, 0)
         # specify value of ID_Casualty_frt_in_pufcsv_year array
@@ -423,22 +700,391 @@ class Records(object):
         """
         try:
             # grab vname data from EGG distribution
-            path_in_egg = os.path.join('taxcalc', fpath)
-            vname_fname = resource_stream(
-                Requirement.parse('taxcalc'), path_in_egg)
-            vname_dict = pd.read_csv(vname_fname, **kwargs)
-        except (DistributionNotFound, IOError):
+            vname_bytes = pkgutil.get_data('taxcalc', fpath)
+        except (IOError, OSError):
+            vname_bytes = None
+        if vname_bytes is None:
             msg = 'could not read {} file from EGG'
             raise ValueError(msg.format(vname))
-        return vname_dict
+        cache_dir = Records._csv_cache_dir(None)
+        if cache_dir is None:
+            return pd.read_csv(six.BytesIO(vname_bytes), **kwargs)
+        signature = {'source': 'egg:' + fpath, 'size': len(vname_bytes),
+                     'mtime': None, 'kwargs': repr(sorted(kwargs.items()))}
+        cache_path = os.path.join(cache_dir, 'egg-' + fpath + '.pkl')
+        return Records._cached_parse(
+            cache_path, signature,
+            lambda: hashlib.sha256(vname_bytes).hexdigest(),
+            lambda: pd.read_csv(six.BytesIO(vname_bytes), **kwargs),
+            Records._write_pickle, pd.read_pickle)
+
+    @staticmethod
+    def _read_csv(path, **kwargs):
+        """
+        Read CSV file with specified path, which may be gzip compressed.
+        """
+        if path.endswith('gz'):
+            return pd.read_csv(path, compression='gzip', **kwargs)
+        return pd.read_csv(path, **kwargs)
+
+    @staticmethod
+    def _write_pickle(pdf, path):
+        """
+        Write specified DataFrame to pickle file with specified path.
+        """
+        pdf.to_pickle(path)
+
+    @staticmethod
+    def _csv_cache_dir(path):
+        """
+        Return name of directory containing the cached contents of the CSV
+        file with specified path (or of the CSV files in the EGG when path
+        is None), which is the CSV_CACHE_DIRNAME subdirectory of the CSV
+        file's directory when that directory is writable and otherwise a
+        subdirectory of the decorators.CACHE_DIR directory.  Return None if
+        caching is disabled or neither directory is usable.
+        """
+        if not Records.USE_CSV_CACHE:
+            return None
+        if path is not None:
+            csv_dir = os.path.dirname(os.path.abspath(path))
+            if os.access(csv_dir, os.W_OK):
+                return os.path.join(csv_dir, Records.CSV_CACHE_DIRNAME)
+        if decorators.CACHE_DIR:
+            return os.path.join(decorators.CACHE_DIR, 'data')
+        return None
+
+    @staticmethod
+    def _csv_cache_path(path, suffix):
+        """
+        Return name of the cache of the CSV file with specified path, or
+        None if caching is disabled or impossible.
+        """
+        cache_dir = Records._csv_cache_dir(path)
+        if cache_dir is None:
+            return None
+        abspath = os.path.abspath(path)
+        path_hash = hashlib.sha1(abspath.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(cache_dir, '{}-{}{}'.format(
+            os.path.basename(abspath), path_hash, suffix))
+
+    @staticmethod
+    def _cached_csv(path, suffix, parse, write, load):
+        """
+        Return DataFrame containing the contents of the CSV file with
+        specified path, which is returned by parse(path) when there is no
+        current cache of the file and otherwise by load(cache_path), where
+        the cache is written by write(pdf, cache_path).  When load is None,
+        return None if the cache is current (so that the caller reads
+        the cache, whose name is returned by the _csv_cache_path method).
+        """
+        cache_path = Records._csv_cache_path(path, suffix)
+        if cache_path is None:
+            return parse(path)
+        stat = os.stat(path)
+        signature = {'source': os.path.abspath(path), 'size': stat.st_size,
+                     'mtime': stat.st_mtime, 'kwargs': None}
+
+        def content_hash():
+            """
+            Return SHA-256 hash of the CSV file contents.
+            """
+            sha = hashlib.sha256()
+            with open(path, 'rb') as csvfile:
+                for chunk in iter(lambda: csvfile.read(1 << 20), b''):
+                    sha.update(chunk)
+            return sha.hexdigest()
+        return Records._cached_parse(cache_path, signature, content_hash,
+                                     lambda: parse(path), write, load)
+
+    @staticmethod
+    def _cached_parse(cache_path, signature, content_hash, parse, write,
+                      load):
+        """
+        Return DataFrame returned by parse() or by load(cache_path) when the
+        cache at cache_path is current, that is, when its CSV_CACHE_VERSION,
+        Pandas version and signature are the same as now, except that a
+        different (non-None) mtime is allowed when the content_hash() is
+        the same as when the cache was written.  When the cache is not
+        current, parse() is called and write(pdf, cache_path) updates the
+        cache, which is not used if it cannot be written.  When load is
+        None, return None if the cache is current.
+        """
+        # pylint: disable=too-many-arguments
+        signature = dict(signature, version=Records.CSV_CACHE_VERSION,
+                         pandas=pd.__version__)
+        meta_path = cache_path + '.json'
+        meta = None
+        if os.path.exists(meta_path) and os.path.exists(cache_path):
+            try:
+                with open(meta_path, 'r') as jfile:
+                    meta = json.load(jfile)
+            except (IOError, OSError, ValueError):
+                meta = None
+        if meta is not None:
+            sha = meta.pop('sha256', None)
+            current = meta == signature
+            if not current and signature['mtime'] is not None:
+                # a touched but unchanged file has the same contents hash
+                meta['mtime'] = signature['mtime']
+                current = meta == signature and sha == content_hash()
+                if current:
+                    Records._write_cache_meta(meta_path, signature, sha)
+            elif current and signature['mtime'] is None:
+                current = sha == content_hash()
+            if current:
+                if load is None:
+                    return None
+                return load(cache_path)
+        pdf = parse()
+        tmp_path = None
+        try:
+            cache_dir = os.path.dirname(cache_path)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            # write the cache under a temporary name and then rename it, so
+            # that other processes never see a partly written cache
+            tmp_path = tempfile.mkdtemp(dir=cache_dir)
+            tmp_cache = os.path.join(tmp_path, 'cache')
+            write(pdf, tmp_cache)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            if os.path.isdir(cache_path):
+                shutil.rmtree(cache_path)
+            elif os.path.exists(cache_path):
+                os.remove(cache_path)
+            os.rename(tmp_cache, cache_path)
+            Records._write_cache_meta(meta_path, signature, content_hash())
+        except (IOError, OSError):
+            pass  # use the parsed CSV file without caching it
+        finally:
+            if tmp_path is not None:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        return pdf
+
+    @staticmethod
+    def _write_cache_meta(meta_path, signature, sha):
+        """
+        Write the signature and contents hash of a CSV file cache.
+        """
+        with open(meta_path, 'w') as jfile:
+            json.dump(dict(signature, sha256=sha), jfile)
+
+    def set_mars_derived_vars(self):
+        """
+        Set the _num and _sep variables, which are derived from MARS.
+        """
+        self._num[:] = np.where(self.MARS == 2,
+                                2, 1)
+        self._sep[:] = np.where(np.logical_or(self.MARS == 3, self.MARS == 6),
+                                2, 1)
+
+    @classmethod
+    def zeros(cls, dim, start_year=PUFCSV_YEAR, exact_calculations=False):
+        """
+        Return Records object containing dim filing units whose variables
+        are all zero, without reading any data, blowup factors or weights
+        (so that extrapolation to another year is not possible), which is
+        much faster than calling the Records constructor.  After setting
+        the input variables, call the set_mars_derived_vars method.
+        """
+        recs = cls.__new__(cls)
+        recs.dim = dim
+        recs.index = np.arange(dim)
+        recs.IGNORED_VARS = set()
+        recs._create_blocks()
+        recs._set_blowup_mapping(None)
+        recs._exact.fill(1 if exact_calculations is True else 0)
+        recs.ID_Casualty_frt_in_pufcsv_year.fill(0.10)
+        recs.BF = pd.DataFrame({'nothing': []})
+        recs.WT = pd.DataFrame({'nothing': []})
+        recs.set_current_year(start_year)
+        return recs
 
     def zero_out_changing_calculated_vars(self):
         """
         Set all CHANGING_CALCULATED_VARS to zero.
         """
+        num = len(Records.CHANGING_CALCULATED_VARS)
+        self._blocks['float64'][:num].fill(0.)
         for varname in Records.CHANGING_CALCULATED_VARS:
             var = getattr(self, varname)
-            var.fill(0.)
+            if var is not self._block_views[varname]:
+                var.fill(0.)
+
+    def snapshot(self, varnames):
+        """
+        Return dictionary containing a copy of each variable array named
+        in varnames, which can be passed to the restore method in order to
+        undo later changes to those variables without having to make a
+        deepcopy of the whole Records object.  The variables that are rows
+        of the same block are copied together in a single operation.
+        """
+        snapshot = dict()
+        attached = set(self._attached_vars())
+        for key in self._blocks:
+            names = [name for name in varnames if name in attached and
+                     self._block_row[name][0] == key]
+            if names:
+                rows = [self._block_row[name][1] for name in names]
+                values = self._blocks[key][rows]
+                for idx, name in enumerate(names):
+                    snapshot[name] = values[idx]
+        for name in varnames:
+            if name not in snapshot:
+                snapshot[name] = np.copy(getattr(self, name))
+        return snapshot
+
+    def restore(self, snapshot):
+        """
+        Set each variable in the snapshot dictionary returned by the
+        snapshot method back to the values saved in that dictionary.
+        """
+        for name, values in six.iteritems(snapshot):
+            var = getattr(self, name)
+            if isinstance(var, np.ndarray) and var.shape == values.shape:
+                var[:] = values
+            else:
+                setattr(self, name, np.copy(values))
+
+    def stacked(self, num_copies):
+        """
+        Return new Records object that contains num_copies copies of the
+        filing units in this Records object, with the k-th copy of all the
+        filing units being the k-th block of dim consecutive filing units.
+        Every per-filing-unit array is a new array in the returned object,
+        while all other attributes are shared with this Records object.
+        """
+        if not isinstance(num_copies, int) or num_copies < 1:
+            msg = 'num_copies is not a positive integer'
+            raise ValueError(msg)
+        recs = copy.copy(self)
+        attached = self._attached_vars()
+        recs._blocks = dict((key, np.tile(block, (1, num_copies)))
+                            for key, block in six.iteritems(self._blocks))
+        recs._attach_block_views(attached)
+        attached = set(attached)
+        for name, value in six.iteritems(self.__dict__):
+            if name in attached:
+                continue
+            if isinstance(value, (np.ndarray, pd.Series)):
+                if len(value) == self.dim:
+                    setattr(recs, name, np.tile(np.asarray(value),
+                                                num_copies))
+        if not self.WT.empty and len(self.WT) == self.dim:
+            recs.WT = pd.concat([self.WT] * num_copies, ignore_index=True)
+        recs.index = pd.RangeIndex(self.dim * num_copies)
+        recs.dim = self.dim * num_copies
+        return recs
+
+    def column_blocks(self):
+        """
+        Return dictionary containing the contiguous 2D arrays, keyed by the
+        name of their dtype, whose rows are the variables, so that all the
+        variables can be copied or shared in a few operations.  With
+        'standard' storage, the 'float64' and 'int64' arrays have the
+        FLOAT_BLOCK_VARS and INT_BLOCK_VARS variables as their rows.
+        Rows of variables that have been replaced by assigning a new array
+        to them (see the _attached_vars method) are no longer used.
+        """
+        return dict(self._blocks)
+
+    def __getstate__(self):
+        """
+        Return the state used by pickle and the copy module, which contains
+        the blocks instead of the variable arrays that are block rows.
+        """
+        state = self.__dict__.copy()
+        attached = self._attached_vars()
+        for name in attached:
+            del state[name]
+        del state['_block_views']
+        state['_attached_block_vars'] = attached
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restore state returned by __getstate__, making the variables that
+        were block rows views of the rows of the restored blocks.
+        """
+        state = dict(state)
+        attached = state.pop('_attached_block_vars')
+        self.__dict__.update(state)
+        self._attach_block_views(attached)
+
+    @staticmethod
+    def _storage_layout(storage, wide_vars=frozenset()):
+        """
+        Return (dictionary containing the list of variables in each block
+        keyed by dtype name, dictionary containing the (dtype name, row)
+        location of each variable) tuple for the specified storage mode,
+        in which the variables in the wide_vars frozenset are stored as
+        int64 values.
+        """
+        if storage not in Records.STORAGE_MODES:
+            msg = 'storage {} is not one of {}'
+            raise ValueError(msg.format(storage, Records.STORAGE_MODES))
+        layout = Records._STORAGE_LAYOUTS.get((storage, wide_vars), None)
+        if layout is None:
+            block_vars = dict()
+            for name in Records.FLOAT_BLOCK_VARS:
+                key = 'float64'
+                if (storage == 'compact32' and name != 's006' and
+                        name in Records.USABLE_READ_VARS):
+                    key = 'float32'
+                block_vars.setdefault(key, []).append(name)
+            for name in Records.INT_BLOCK_VARS:
+                key = 'int64'
+                if storage != 'standard' and name not in wide_vars:
+                    key = Records.COMPACT_INT_DTYPES.get(name, 'int64')
+                block_vars.setdefault(key, []).append(name)
+            block_row = dict()
+            for key, names in six.iteritems(block_vars):
+                for row, name in enumerate(names):
+                    block_row[name] = (key, row)
+            layout = (block_vars, block_row)
+            Records._STORAGE_LAYOUTS[(storage, wide_vars)] = layout
+        return layout
+
+    def _create_blocks(self, storage='standard', wide_vars=frozenset(),
+                       blocks=None):
+        """
+        Create an all-zero block for each dtype used by the storage mode
+        (with the wide_vars stored as int64 values), with one row for each
+        variable stored with that dtype, and make each variable a view of
+        its row.  When blocks is not None, it is the dictionary of blocks
+        to use instead, which must have that layout.
+        """
+        block_vars, self._block_row = Records._storage_layout(storage,
+                                                              wide_vars)
+        self.storage = storage
+        if blocks is None:
+            blocks = dict((key, np.zeros((len(names), self.dim),
+                                         dtype=key))
+                          for key, names in six.iteritems(block_vars))
+        self._blocks = blocks
+        self._attach_block_views(self._block_row.keys())
+
+    def _attach_block_views(self, varnames):
+        """
+        Record the view of its row in the blocks for every block variable
+        (including those that have been replaced) and make each variable
+        in varnames that view.
+        """
+        self._block_views = dict()
+        for name, (key, row) in six.iteritems(self._block_row):
+            self._block_views[name] = self._blocks[key][row]
+        for name in varnames:
+            setattr(self, name, self._block_views[name])
+
+    def _attached_vars(self):
+        """
+        Return list of names of the variables that are still views of their
+        block rows, that is, those that have not been replaced by assigning
+        a new array to them.
+        """
+        return [name for name, view in six.iteritems(self._block_views)
+                if self.__dict__.get(name) is view]
 
     def _read_weights(self, weights):
         """
@@ -454,7 +1100,9 @@ class Records(object):
             WT = weights
         elif isinstance(weights, six.string_types):
             if os.path.isfile(weights):
-                WT = pd.read_csv(weights)
+                WT = Records._cached_csv(weights, '.wt.pkl', Records._read_csv,
+                                         Records._write_pickle,
+                                         pd.read_pickle)
             else:
                 WT = Records._read_egg_csv('weights',
                                            Records.WEIGHTS_FILENAME)
@@ -477,7 +1125,10 @@ class Records(object):
             BF = blowup_factors
         elif isinstance(blowup_factors, six.string_types):
             if os.path.isfile(blowup_factors):
-                BF = pd.read_csv(blowup_factors, index_col='YEAR')
+                BF = Records._cached_csv(
+                    blowup_factors, '.bf.pkl',
+                    lambda path: Records._read_csv(path, index_col='YEAR'),
+                    Records._write_pickle, pd.read_pickle)
             else:
                 BF = Records._read_egg_csv('blowup_factors',
                                            Records.BLOWUP_FACTORS_FILENAME,
@@ -536,3 +1187,36 @@ class Records(object):
         self.BF.APOPSNR[year] = 1.0
         self.BF.AIPD[year] = 1.0
         self._blowup(year)
+
+
+class RecordsView(object):
+    """
+    Read-only view of a Records object, whose numpy array attributes are
+    returned as non-writeable views that share the Records object's arrays
+    rather than copying them, so every view reflects later changes to the
+    Records object.
+
+    Parameters
+    ----------
+    records: Records class object
+
+    Returns
+    -------
+    class instance: RecordsView
+    """
+
+    def __init__(self, records):
+        if not isinstance(records, Records):
+            raise ValueError('records is not a Records object')
+        object.__setattr__(self, '_records', records)
+        object.__setattr__(self, 'current_year', records.current_year)
+
+    def __getattr__(self, name):
+        value = getattr(self._records, name)
+        if isinstance(value, np.ndarray):
+            value = value.view()
+            value.flags.writeable = False
+        return value
+
+    def __setattr__(self, name, value):
+        raise AttributeError('RecordsView object is read-only')
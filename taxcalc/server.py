@@ -0,0 +1,320 @@
+"""
+Tax-Calculator long-running calculation server and its client.
+"""
+# CODING-STYLE CHECKS:
+# pep8 --ignore=E402 server.py
+# pylint --disable=locally-disabled server.py
+# (when importing numpy, add "--extension-pkg-whitelist=numpy" pylint option)
+
+import os
+import copy
+import json
+import six
+from six.moves import BaseHTTPServer  # pylint: disable=import-error
+from six.moves.urllib.request import urlopen  # pylint: disable=import-error
+from six.moves.urllib.error import HTTPError  # pylint: disable=import-error
+import pandas as pd
+from .policy import Policy
+from .records import Records
+from .behavior import Behavior
+from .consumption import Consumption
+from .growth import Growth
+from .calculate import Calculator
+from .utils import (STATS_COLUMNS, create_diagnostic_table,
+                    create_difference_table)
+
+
+class CalculatorServer(object):
+    """
+    Constructor for the calculation server class, which reads the records
+    data, compiles the tax-calculating functions and calculates current-law
+    results once, and then keeps all of them in memory while it answers
+    any number of policy reform requests, either by calls of its calculate
+    method or by HTTP requests sent by a CalculatorClient object (see the
+    serve method).
+
+    Parameters
+    ----------
+    data, weights and blowup_factors: as for the Records constructor
+
+    fuse_kernels: boolean
+        as for the Calculator constructor; default value is false.
+
+    Returns
+    -------
+    class instance: CalculatorServer
+
+    Notes
+    -----
+    The requests share one Records object, so they are answered one at a
+    time.  Behavioral responses are not supported.
+    """
+
+    def __init__(self, data='puf.csv',
+                 weights=Records.WEIGHTS_PATH,
+                 blowup_factors=Records.BLOWUP_FACTORS_PATH,
+                 fuse_kernels=False):
+        # read parameters and data once, saving what is needed to return
+        # the records to their start-year state after each request
+        self._policy = Policy()
+        self._behavior = Behavior()
+        self._consumption = Consumption()
+        self._growth = Growth()
+        self.fuse_kernels = fuse_kernels
+        self.records = Records(data=data, weights=weights,
+                               blowup_factors=blowup_factors)
+        self._data_base = self.records.extrapolation_base()
+        calc = Calculator(policy=copy.deepcopy(self._policy),
+                          records=self.records, verbose=False,
+                          growth=copy.deepcopy(self._growth),
+                          fuse_kernels=fuse_kernels)
+        self._base = self.records.extrapolation_base()
+        self._blowup_factors = self.records.BF.copy()
+        self.start_year = calc.current_year
+        self.end_year = calc.policy.end_year
+        # current-law results keyed by (year, econ-assumption text) and
+        # calculated for the start year, which also compiles the kernels
+        self._baseline = dict()
+        self._baseline_results(self.start_year, None)
+
+    def calculate(self, reform=None, assump=None, year=None, num_years=1,
+                  groupby='weighted_deciles'):
+        """
+        Calculate the results of a policy reform for one or more years.
+
+        Parameters
+        ----------
+        reform: string or None
+            JSON policy reform text in the format of the reform file read
+            by the Calculator.read_json_param_files method; None implies
+            current-law policy.
+
+        assump: string or None
+            JSON economic assumption text in the format of the assumption
+            file read by the Calculator.read_json_param_files method; None
+            implies default assumptions.
+
+        year: integer or None
+            first calendar year of results; None implies the start year.
+
+        num_years: integer
+            number of years of results.
+
+        groupby: string
+            as for the create_difference_table function.
+
+        Returns
+        -------
+        dictionary with each year as key and, as the value, a dictionary
+        containing the reform's 'diagnostic' table and its 'difference'
+        table relative to current-law policy, each a Pandas DataFrame.
+
+        Raises
+        ------
+        ValueError:
+            if the reform or assumption text is invalid, if the years are
+            not in the [start_year, end_year] range, or if the assumptions
+            imply behavioral responses.
+        """
+        if year is None:
+            year = self.start_year
+        last_year = year + num_years - 1
+        if (num_years < 1 or year < self.start_year or
+                last_year > self.end_year):
+            msg = 'years {}-{} are not in [{},{}] range'
+            raise ValueError(msg.format(year, last_year,
+                                        self.start_year, self.end_year))
+        if reform is None:
+            policy_dict = dict()
+        else:
+            policy_dict = Calculator.read_json_policy_reform_text(reform)
+        output = dict()
+        # current-law results are calculated before the reform results
+        # because both use the shared records
+        base_results = dict((cyr, self._baseline_results(cyr, assump)[0])
+                            for cyr in range(year, last_year + 1))
+        try:
+            calc = self._calculator(policy_dict, assump)
+            for cyr in range(year, last_year + 1):
+                calc.advance_to_year(cyr)
+                if calc.behavior.has_response():
+                    raise ValueError('CalculatorServer does not support '
+                                     'behavioral responses')
+                calc.calc_all()
+                output[cyr] = {
+                    'diagnostic': create_diagnostic_table(calc),
+                    'difference': create_difference_table(
+                        base_results[cyr], calc.records, groupby)}
+        finally:
+            self._restore_records()
+        return output
+
+    def serve(self, host='127.0.0.1', port=8000):
+        """
+        Answer HTTP requests sent by CalculatorClient objects to the
+        specified host and port until interrupted.
+        """
+        httpd = self.http_server(host, port)
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
+
+    def http_server(self, host='127.0.0.1', port=8000):
+        """
+        Return HTTP server object whose serve_forever method answers the
+        requests sent by CalculatorClient objects to the specified host and
+        port (where a port of zero implies an unused port, whose value is
+        the second element of the server_address attribute of the returned
+        object).
+        """
+        server = self
+
+        class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            """
+            Handler of JSON requests POSTed by CalculatorClient objects.
+            """
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                """
+                Reply to a request with the results or an error message.
+                """
+                length = int(self.headers['Content-Length'])
+                try:
+                    request = json.loads(self.rfile.read(length).decode())
+                    output = server.calculate(**request)
+                    reply = dict()
+                    for year, tables in six.iteritems(output):
+                        reply[str(year)] = dict(
+                            (name, json.loads(table.to_json(orient='split')))
+                            for name, table in six.iteritems(tables))
+                    status = 200
+                except (ValueError, TypeError) as err:
+                    reply = {'error': str(err)}
+                    status = 400
+                except Exception as err:  # pylint: disable=broad-except
+                    # reply rather than drop the connection
+                    reply = {'error': '{}: {}'.format(type(err).__name__,
+                                                      err)}
+                    status = 500
+                body = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        return BaseHTTPServer.HTTPServer((host, port), RequestHandler)
+
+    # ----- begin private methods of CalculatorServer class -----
+
+    def _calculator(self, policy_dict, assump):
+        """
+        Return Calculator object for the start year that uses the shared
+        records and copies of the preloaded parameter objects.  When the
+        assumptions change growth, the records are extrapolated again from
+        the data year to the start year, because growth can change the
+        blowup factors of the years up to the start year.
+        """
+        policy = copy.deepcopy(self._policy)
+        policy.implement_reform(policy_dict)
+        behavior = copy.deepcopy(self._behavior)
+        consumption = copy.deepcopy(self._consumption)
+        growth = copy.deepcopy(self._growth)
+        grow_dict = dict()
+        if assump is not None:
+            (behv_dict, cons_dict,
+             grow_dict) = Calculator.read_json_econ_assump_text(assump)
+            behavior.update_behavior(behv_dict)
+            consumption.update_consumption(cons_dict)
+            growth.update_growth(grow_dict)
+        if grow_dict:
+            # as the Calculator constructor does for newly read records
+            self.records.extrapolate_from(self._data_base,
+                                          self._data_base[0])
+        return Calculator(policy=policy, records=self.records,
+                          verbose=False, sync_years=bool(grow_dict),
+                          behavior=behavior, consumption=consumption,
+                          growth=growth, fuse_kernels=self.fuse_kernels)
+
+    def _baseline_results(self, year, assump):
+        """
+        Return (results, diagnostic table) tuple for current-law policy in
+        the specified year, which is calculated only when first requested.
+        """
+        key = (year, assump)
+        if key not in self._baseline:
+            calc = self._calculator(dict(), assump)
+            try:
+                calc.advance_to_year(year)
+                calc.calc_all()
+                saved = calc.records.snapshot(STATS_COLUMNS)
+                saved['current_year'] = year
+                self._baseline[key] = (SavedResults(saved),
+                                       create_diagnostic_table(calc))
+            finally:
+                self._restore_records()
+        return self._baseline[key]
+
+    def _restore_records(self):
+        """
+        Return the shared records to their start-year state, in which all
+        the calculated variables are zero (as some are accumulated by the
+        calc_all method).
+        """
+        self.records.BF = self._blowup_factors.copy()
+        self.records.extrapolate_from(self._base, self.start_year)
+        self.records.zero_out_changing_calculated_vars()
+
+
+class SavedResults(object):
+    """
+    Object whose attributes are the values in the specified dictionary of
+    arrays (and current_year), which can be passed to the
+    create_difference_table function in place of a Records object.
+    """
+
+    def __init__(self, arrays):
+        self.__dict__.update(arrays)
+
+
+class CalculatorClient(object):
+    """
+    Constructor for the client class of a CalculatorServer that is
+    answering HTTP requests at the specified host and port.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8000):
+        self.url = 'http://{}:{}/'.format(host, port)
+
+    def calculate(self, reform=None, assump=None, year=None, num_years=1,
+                  groupby='weighted_deciles'):
+        """
+        Return the same dictionary of tables as the calculate method of the
+        CalculatorServer, except that the years are strings.  The reform
+        and assump arguments can be JSON text or the names of JSON files.
+
+        Raises
+        ------
+        ValueError:
+            if the server replies with an error message.
+        """
+        request = {'year': year, 'num_years': num_years, 'groupby': groupby}
+        for name, text in [('reform', reform), ('assump', assump)]:
+            if text is not None and os.path.isfile(text):
+                with open(text, 'r') as jfile:
+                    text = jfile.read()
+            request[name] = text
+        try:
+            reply = urlopen(self.url, json.dumps(request).encode())
+        except HTTPError as err:
+            reply = err
+        output = json.loads(reply.read().decode())
+        if 'error' in output:
+            raise ValueError(output['error'])
+        return dict((yr, dict((name, pd.DataFrame(**table))
+                              for name, table in six.iteritems(tables)))
+                    for yr, tables in six.iteritems(output))
@@ -6,10 +6,13 @@ import copy
 import pytest
 import numpy as np
 import pandas as pd
+import taxcalc
 from taxcalc import Policy, Records, Calculator, Behavior, Consumption
+from taxcalc import set_cache_dir
 from taxcalc import create_distribution_table
 from taxcalc import create_difference_table
 from taxcalc import create_diagnostic_table
+from taxcalc.functions import ItemDed, StdDed, BenefitSurtax
 
 
 IRATES = {1991: 0.015, 1992: 0.020, 1993: 0.022, 1994: 0.020, 1995: 0.021,
@@ -179,6 +182,55 @@ def test_Calculator_advance_to_year(records_2009):
         calc.advance_to_year(2015)
 
 
+def test_Calculator_advance_to_year_equals_increment_year(puf_1991,
+                                                          weights_1991):
+    # jumping to a year must give results identical to stepping to it
+    calcs = list()
+    for jump in [False, True]:
+        recs = Records(data=puf_1991, weights=weights_1991)
+        calc = Calculator(policy=Policy(), records=recs, verbose=False)
+        if jump:
+            calc.advance_to_year(2015)
+        else:
+            calc.increment_year()
+            calc.increment_year()
+        calc.calc_all()
+        calcs.append(calc)
+    step, jump = calcs
+    for varname in Records.CALCULATED_VARS | Records.BLOWUP_VARS:
+        assert np.array_equal(getattr(step.records, varname),
+                              getattr(jump.records, varname))
+
+
+def test_Calculator_iter_years(records_2009):
+    calc = Calculator(policy=Policy(), records=records_2009)
+    e00200 = calc.records.e00200.copy()
+    BF_AWAGE = calc.records.BF.AWAGE.copy()
+    calc2 = copy.deepcopy(calc)
+    years = list()
+    for year, view in calc.iter_years(3):
+        if year > 2013:
+            calc2.increment_year()
+        calc2.calc_all()
+        assert view.current_year == year
+        assert np.allclose(view._iitax, calc2.records._iitax)
+        with pytest.raises(ValueError):
+            view._iitax[0] = 1.
+        with pytest.raises(AttributeError):
+            view.e00200 = e00200
+        years.append(year)
+    assert years == [2013, 2014, 2015]
+    assert calc.current_year == 2013
+    assert calc.records.current_year == 2013
+    assert np.array_equal(calc.records.e00200, e00200)
+    assert np.array_equal(calc.records.BF.AWAGE, BF_AWAGE)
+    tables = [table for _, table in
+              calc.iter_years(2, summary=create_diagnostic_table)]
+    assert len(tables) == 2
+    with pytest.raises(ValueError):
+        next(calc.iter_years(0))
+
+
 def test_make_Calculator_user_mods_with_cpi_flags(policyfile, puf_1991):
     with open(policyfile.name) as pfile:
         policy = json.load(pfile)
@@ -279,6 +331,23 @@ def test_Calculator_mtr(records_2009):
     assert type(mtr_combined) == np.ndarray
 
 
+def test_Calculator_mtrs(records_2009):
+    calc = Calculator(policy=Policy(), records=records_2009)
+    variables = ['e00200p', 'e00650', 'e19800', 'e26270']
+    mtrs = calc.mtrs(variable_strs=variables, batch_size=3)
+    assert sorted(mtrs.keys()) == sorted(variables)
+    for var in variables:
+        expected = calc.mtr(variable_str=var)
+        for actual_mtr, expected_mtr in zip(mtrs[var], expected):
+            assert np.allclose(actual_mtr, expected_mtr)
+    assert np.allclose(calc.records.e00200p, records_2009.e00200p)
+    assert len(calc.mtrs()) == len(Calculator.MTR_VALID_VARIABLES)
+    with pytest.raises(ValueError):
+        calc.mtrs(variable_strs=['e00200p', 'bad_income_type'])
+    with pytest.raises(ValueError):
+        calc.mtrs(variable_strs=variables, batch_size=0)
+
+
 def test_Calculator_mtr_when_PT_rates_differ():
     reform = {2013: {'_II_rt1': [0.40],
                      '_II_rt2': [0.40],
@@ -404,6 +473,217 @@ def test_ID_HC_vs_BS(puf_1991, weights_1991):
                        bs_calc.records._iitax)
 
 
+def test_ComputeBenefit_shared_by_surtax_and_limitation(records_2009):
+    reform = {2013: {'_ID_BenefitSurtax_crt': [0.02],
+                     '_ID_BenefitCap_rt': [0.1],
+                     '_ID_Charity_hc': [0.2]}}
+    policy = Policy()
+    policy.implement_reform(reform)
+    calc = Calculator(policy=policy, records=records_2009)
+    calc_one_year = calc.calc_one_year
+    calls = list()
+
+    def counting_calc_one_year(*args, **kwargs):
+        calls.append(args)
+        calc_one_year(*args, **kwargs)
+    calc.calc_one_year = counting_calc_one_year
+    calc.calc_all()
+    assert len(calls) == 1  # one no-itemizing calculation for both
+    assert calc.policy.ID_Charity_hc == 0.2
+    iitax = calc.records._iitax.copy()
+    c04470 = calc.records.c04470.copy()
+    calc.calc_all()
+    assert np.allclose(calc.records._iitax, iitax)
+    assert np.allclose(calc.records.c04470, c04470)
+
+
+def test_ComputeBenefit_not_reused_after_calc_all(records_2009):
+    reform = {2013: {'_ID_BenefitSurtax_crt': [0.0],
+                     '_ID_BenefitSurtax_trt': [1.0]}}
+    policy = Policy()
+    policy.implement_reform(reform)
+    calc = Calculator(policy=policy, records=records_2009)
+    calc.calc_all()
+    calc.increment_year()
+    calc.records.e00200 *= 2.
+    calc.calc_one_year()
+    BenefitSurtax(calc)
+    expected = Calculator(policy=copy.deepcopy(calc.policy),
+                          records=copy.deepcopy(calc.records),
+                          sync_years=False)
+    expected.calc_one_year()
+    BenefitSurtax(expected)
+    assert np.any(expected.records._surtax > 0.)
+    assert np.array_equal(calc.records._iitax, expected.records._iitax)
+
+
+def test_Calculator_with_fused_kernels(puf_1991, weights_1991):
+    # check that fused calc_all() results equal the unfused results
+    reform = {2013: {'_II_em': [4000], '_AMT_em_pe': [50000]}}
+    results = list()
+    for fuse in [False, True]:
+        policy = Policy()
+        policy.implement_reform(reform)
+        recs = Records(data=puf_1991, weights=weights_1991, start_year=2009)
+        calc = Calculator(policy=policy, records=recs, fuse_kernels=fuse)
+        calc.increment_year()
+        calc.calc_all()
+        results.append(calc)
+    unfused, fused = results
+    assert fused.fuse_kernels
+    assert fused.current_law_version().fuse_kernels
+    for varname in Records.CALCULATED_VARS:
+        assert np.array_equal(getattr(unfused.records, varname),
+                              getattr(fused.records, varname))
+
+
+@pytest.mark.parametrize("fuse_kernels", [False, True])
+def test_Calculator_with_compact_storage(puf_1991, weights_1991,
+                                         fuse_kernels):
+    # check that compact storage gives the same (or, when dollar amounts
+    # are stored as float32 values, almost the same) results as standard
+    results = dict()
+    for storage in Records.STORAGE_MODES:
+        recs = Records(data=puf_1991, weights=weights_1991, start_year=2009,
+                       storage=storage)
+        calc = Calculator(policy=Policy(), records=recs,
+                          fuse_kernels=fuse_kernels)
+        calc.calc_all()
+        results[storage] = calc.records
+    for varname in Records.CALCULATED_VARS:
+        standard = getattr(results['standard'], varname)
+        assert np.array_equal(getattr(results['compact'], varname), standard)
+        if varname not in Records.INTEGER_CALCULATED_VARS:
+            assert (getattr(results['compact32'], varname).dtype ==
+                    standard.dtype)
+    assert np.allclose(results['compact32']._combined.sum(),
+                       results['standard']._combined.sum(), rtol=1e-5)
+
+
+def test_Calculator_chooses_best_deduction(records_2009):
+    calc = Calculator(policy=Policy(), records=records_2009)
+    calc.calc_all()
+    recs = calc.records
+    assert np.all(np.logical_or(recs._standard == 0., recs.c04470 == 0.))
+    assert np.any(recs.c04470 > 0.)
+    # compare with taxes calculated using each deduction alone
+    taxes = dict()
+    for deduction in ['standard', 'itemized']:
+        alt = copy.deepcopy(calc)
+        # restore the deductions calculated before the choice was made
+        ItemDed(alt.policy, alt.records)
+        StdDed(alt.policy, alt.records)
+        if deduction == 'standard':
+            alt.records.c04470[:] = 0.
+            alt.records.c21060[:] = 0.
+        else:
+            alt.records._standard[:] = 0.
+        alt.TaxInc_to_AMT()
+        taxes[deduction] = alt.records.c05800
+    assert np.allclose(recs.c05800, np.minimum(taxes['standard'],
+                                               taxes['itemized']))
+
+
+@pytest.mark.parametrize("fuse_kernels", [False, True])
+@pytest.mark.parametrize("reform", [
+    {},
+    {2013: {'_AGI_surtax_trt': [0.05], '_AGI_surtax_thd': [[100000] * 6]}}
+])
+def test_best_deduction_equals_three_passes(puf_1991, weights_1991,
+                                            monkeypatch, reform,
+                                            fuse_kernels):
+    # check that the single-pass deduction choice gives exactly the same
+    # results as calculating taxes with the standard deduction, then with
+    # itemized deductions, and then with the chosen deduction
+    results = list()
+    for single_pass in [True, False]:
+        if not single_pass:
+            monkeypatch.setattr(Calculator,
+                                'TaxInc_to_AMT_with_best_deduction',
+                                Calculator.TaxInc_to_AMT_three_passes)
+        policy = Policy()
+        policy.implement_reform(reform)
+        recs = Records(data=puf_1991, weights=weights_1991, start_year=2009)
+        calc = Calculator(policy=policy, records=recs,
+                          fuse_kernels=fuse_kernels)
+        for _ in range(2):
+            calc.increment_year()
+            calc.calc_all()
+        results.append(calc)
+    single, three = results
+    assert np.any(single.records.c04470 > 0.)
+    for varname in Records.CALCULATED_VARS:
+        assert np.array_equal(getattr(single.records, varname),
+                              getattr(three.records, varname))
+
+
+@pytest.mark.parametrize("fuse_kernels", [False, True])
+def test_Calculator_recalc(records_2009, fuse_kernels):
+    calc = Calculator(policy=Policy(), records=records_2009,
+                      fuse_kernels=fuse_kernels)
+    calc.calc_all()
+    for changed_vars in [['e00200', 'e00200p'], ['p23250'], ['e87530']]:
+        full_calc = copy.deepcopy(calc)
+        for clc in [calc, full_calc]:
+            for var in changed_vars:
+                getattr(clc.records, var)[::2] += 100.
+        full_calc.calc_all()
+        calc.recalc(changed_vars)
+        for var in Records.CALCULATED_VARS:
+            assert np.allclose(getattr(calc.records, var),
+                               getattr(full_calc.records, var))
+
+
+def test_Calculator_recalc_when_benefit_surtax_active(records_2009):
+    policy = Policy()
+    policy.implement_reform({2013: {'_ID_BenefitSurtax_crt': [0.02]}})
+    calc = Calculator(policy=policy, records=records_2009)
+    calc.calc_all()
+    full_calc = copy.deepcopy(calc)
+    for clc in [calc, full_calc]:
+        clc.records.e19800 += 500.
+    full_calc.calc_all()
+    calc.recalc(['e19800'])
+    assert np.allclose(calc.records._iitax, full_calc.records._iitax)
+
+
+def test_Calculator_sweep(records_2009):
+    calc = Calculator(policy=Policy(), records=records_2009)
+    reforms = [{2013: {'_II_em': [4000.]}},
+               {2013: {'_EITC_rt': [[0.1, 0.34, 0.4, 0.45]]}},
+               {2013: {'_ID_BenefitSurtax_crt': [0.02]}},
+               {2013: {'_FICA_ss_trt': [0.1], '_II_rt7': [0.45]}}]
+    results = calc.sweep(reforms, output_vars=['_iitax', '_payrolltax'])
+    assert results['_iitax'].shape == (len(reforms), calc.records.dim)
+    for idx, reform in enumerate(reforms):
+        policy = Policy()
+        policy.implement_reform(reform)
+        reform_calc = Calculator(policy=policy,
+                                 records=copy.deepcopy(calc.records),
+                                 sync_years=False)
+        reform_calc.calc_all()
+        for var in ['_iitax', '_payrolltax']:
+            assert np.allclose(results[var][idx],
+                               getattr(reform_calc.records, var))
+    # the embedded policy and calculated records variables are unchanged
+    base_calc = Calculator(policy=Policy(),
+                           records=copy.deepcopy(calc.records),
+                           sync_years=False)
+    base_calc.calc_all()
+    assert calc.policy.II_em == base_calc.policy.II_em
+    assert np.allclose(calc.records._iitax, base_calc.records._iitax)
+    assert np.allclose(calc.records.c04800, base_calc.records.c04800)
+
+
+def test_Calculator_warm_up(tmpdir):
+    old_cache_dir = taxcalc.decorators.CACHE_DIR
+    try:
+        set_cache_dir(str(tmpdir))
+        Calculator.warm_up(fuse_kernels=True)
+    finally:
+        set_cache_dir(old_cache_dir)
+
+
 def test_Calculator_using_nonstd_input(rawinputfile):
     # check Calculator handling of raw, non-standard input data with no aging
     policy = Policy()
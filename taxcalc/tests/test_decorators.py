@@ -1,9 +1,16 @@
+import os
 import sys
+import gc
+import math
+import inspect
+import weakref
 import pytest
 from six.moves import reload_module
 import numpy as np
 from pandas import DataFrame
+import taxcalc
 from taxcalc.decorators import *
+from taxcalc.decorators import _arg_sources
 from pandas.util.testing import assert_frame_equal
 
 
@@ -25,6 +32,16 @@ def test_create_apply_function_string_with_params():
     assert ans == exp
 
 
+def test_create_apply_function_string_parallel():
+    ans = create_apply_function_string(['a', 'b', 'c'], ['d', 'e'], ['d'],
+                                       parallel=True)
+    exp = ("def ap_func(x_0,x_1,x_2,x_3,x_4):\n"
+           "  for i in prange(len(x_0)):\n"
+           "    x_0[i],x_1[i],x_2[i] = jitted_f(x_3,x_4[i])\n"
+           "  return x_0,x_1,x_2\n")
+    assert ans == exp
+
+
 def test_create_toplevel_function_string_mult_outputs():
     ans = create_toplevel_function_string(['a', 'b'], ['d', 'e'],
                                           ['pm', 'pm', 'pf', 'pm'])
@@ -59,6 +76,15 @@ def test_create_toplevel_function_string():
     assert ans == exp
 
 
+def test_create_toplevel_function_string_no_dataframe():
+    ans = create_toplevel_function_string(['a', 'b'], ['d', 'e'],
+                                          ['pm', 'pm', 'pf', 'pm'],
+                                          return_dataframe=False)
+    exp = ("def hl_func(pm, pf):\n"
+           "    applied_f(pm.a, pm.b, pf.d, pm.e, )\n")
+    assert ans == exp
+
+
 def some_calc(x, y, z):
     a = x + y
     b = x + y + z
@@ -184,6 +210,367 @@ def test_ret_everything_iterate_jit():
     assert_frame_equal(ans, exp)
 
 
+@iterate_jit(nopython=True)
+def Magic_calc_cached(x, y, z):
+    a = x + y
+    b = x + y + z
+    return (a, b)
+
+
+def test_iterate_jit_caches_high_level_function(monkeypatch):
+    import taxcalc.decorators
+    calls = []
+    real_create = taxcalc.decorators.create_toplevel_function_string
+
+    def counting_create(*args, **kwargs):
+        calls.append(args)
+        return real_create(*args, **kwargs)
+    monkeypatch.setattr(taxcalc.decorators,
+                        'create_toplevel_function_string', counting_create)
+    pm = Foo()
+    pf = Foo()
+    pm.a = np.ones((5,))
+    pm.b = np.ones((5,))
+    pf.x = np.ones((5,))
+    pf.y = np.ones((5,))
+    pf.z = np.ones((5,))
+    exp = DataFrame(data=[[2.0, 3.0]] * 5, columns=["a", "b"])
+    for _ in range(3):
+        assert_frame_equal(Magic_calc_cached(pm, pf), exp)
+    assert len(calls) == 1
+    # a different pm/pf layout requires one more high-level function
+    assert_frame_equal(Magic_calc_cached(pf, pm), exp)
+    assert_frame_equal(Magic_calc_cached(pf, pm), exp)
+    assert len(calls) == 2
+
+
+def test_iterate_jit_no_dataframe():
+    pm = Foo()
+    pf = Foo()
+    pm.a = np.ones((5,))
+    pm.b = np.ones((5,))
+    pf.x = np.ones((5,))
+    pf.y = np.ones((5,))
+    pf.z = np.ones((5,))
+    ans = Magic_calc2(pm, pf, return_dataframe=False)
+    assert ans is None
+    assert np.allclose(pm.a, [2.0] * 5)
+    assert np.allclose(pm.b, [3.0] * 5)
+
+
+@iterate_jit(parameters=['w'], parallel=True, nopython=True)
+def Magic_calc_parallel(w, x, y, z):
+    a = x + y
+    b = w[0] + x + y + z
+    return (a, b)
+
+
+def test_iterate_jit_parallel():
+    pm = Foo()
+    pf = Foo()
+    pm.w = np.array([2.0])
+    pf.x = np.arange(1000, dtype=np.float64)
+    pf.y = np.ones((1000,))
+    pf.z = np.ones((1000,))
+    pf.a = np.zeros((1000,))
+    pf.b = np.zeros((1000,))
+    Magic_calc_parallel(pm, pf, return_dataframe=False)
+    assert np.allclose(pf.a, pf.x + 1.0)
+    assert np.allclose(pf.b, pf.x + 4.0)
+
+
+def test_set_num_threads():
+    import taxcalc.decorators
+    pm = Foo()
+    pf = Foo()
+    pf.x = np.arange(1000, dtype=np.float64)
+    pf.y = np.ones((1000,))
+    pf.z = np.ones((1000,))
+    pf.a = np.zeros((1000,))
+    pf.b = np.zeros((1000,))
+    try:
+        taxcalc.decorators.set_num_threads(2)
+        assert taxcalc.decorators.NUM_THREADS == 2
+        Magic_calc2(pm, pf, return_dataframe=False)
+        assert np.allclose(pf.a, pf.x + 1.0)
+        assert np.allclose(pf.b, pf.x + 2.0)
+    finally:
+        taxcalc.decorators.set_num_threads(1)
+    assert taxcalc.decorators.NUM_THREADS == 1
+    with pytest.raises(ValueError):
+        taxcalc.decorators.set_num_threads(0)
+    with pytest.raises(ValueError):
+        taxcalc.decorators.set_num_threads(1.5)
+    with pytest.raises(ValueError):
+        taxcalc.decorators.set_num_threads(True)
+    # other integral types, such as numpy integers, are accepted
+    try:
+        taxcalc.decorators.set_num_threads(np.int64(2))
+        assert taxcalc.decorators.NUM_THREADS == 2
+        assert type(taxcalc.decorators.NUM_THREADS) is int
+    finally:
+        taxcalc.decorators.set_num_threads(1)
+
+
+def test_create_fused_function_string():
+    stages = [(['a', 'b'], ['x', 'y']), (['x'], ['a', 'w'])]
+    ans, args = create_fused_function_string(stages, ['w'])
+    exp = ("def fused_func(x_0,x_1,x_2,x_3,x_4):\n"
+           "  for i in range(len(x_0)):\n"
+           "    v_0_0 = x_0[i]\n"
+           "    v_1_0 = x_1[i]\n"
+           "    v_2_0 = x_2[i]\n"
+           "    v_3_0 = x_3[i]\n"
+           "    v_0_1,v_1_1 = f_0(v_2_0,v_3_0)\n"
+           "    v_2_1 = f_1(v_0_1,x_4)\n"
+           "    x_0[i] = v_0_1\n"
+           "    x_1[i] = v_1_1\n"
+           "    x_2[i] = v_2_1\n")
+    assert ans == exp
+    assert args == ['a', 'b', 'x', 'y', 'w']
+
+
+@iterate_jit(parameters=['w'], nopython=True)
+def Magic_calc_fused(w, a, b):
+    x = a * w + b
+    return x
+
+
+def test_make_fused_function():
+    def make_data():
+        pm = Foo()
+        pf = Foo()
+        pm.w = 3.0
+        pf.x = np.arange(5.0)
+        pf.y = np.ones((5,))
+        pf.z = np.full((5,), 2.0)
+        pf.a = np.zeros((5,))
+        pf.b = np.zeros((5,))
+        return pm, pf
+    pm1, pf1 = make_data()
+    Magic_calc2(pm1, pf1, return_dataframe=False)
+    Magic_calc_fused(pm1, pf1, return_dataframe=False)
+    pm2, pf2 = make_data()
+    fused = make_fused_function([Magic_calc2, Magic_calc_fused])
+    assert fused.kernels == (Magic_calc2, Magic_calc_fused)
+    fused(pm2, pf2)
+    for name in ['a', 'b', 'x', 'y', 'z']:
+        assert np.array_equal(getattr(pf1, name), getattr(pf2, name))
+    assert np.array_equal(pf2.x, (np.arange(5.0) + 1.0) * 3.0 +
+                          np.arange(5.0) + 3.0)
+
+
+def test_arg_sources():
+    cache = weakref.WeakKeyDictionary()
+    pm = Foo()
+    pf = Foo()
+    pm.w = 3.0
+    pf.x = np.arange(5.0)
+    sources = _arg_sources(cache, ['w', 'x', 'y'], pm, pf)
+    assert sources == ('pm', 'pf', None)
+    assert _arg_sources(cache, ['w', 'x', 'y'], pm, pf) is sources
+    assert _arg_sources(cache, ['w', 'x', 'y'], pf, pm) == ('pf', 'pm', None)
+    # the cache does not keep the objects alive
+    del pf
+    gc.collect()
+    assert len(cache) == 1
+    # objects that cannot be weakly referenced are not cached
+    assert _arg_sources(cache, ['x'], pm, {'x': 1}) == (None,)
+    assert len(cache) == 1
+
+
+@jit(nopython=True)
+def helper_calc_vec(x, w):
+    if x > w:
+        return_value = x - w
+    else:
+        return_value = 0.
+    return return_value
+
+
+def Magic_calc_vec(w, x, y, z):
+    a = max(x, y, 0.)
+    if x > 2. and not y == 1.:
+        b = math.ceil(x / w)
+    elif z < 3. or x == y:
+        b = min(x, z)
+        a += helper_calc_vec(x, w)
+    else:
+        b = z if y > 2. else -z
+    c = 1 < x <= 3
+    return (a, b, c)
+
+
+def test_vectorize_calc_function():
+    pm = Foo()
+    pf = Foo()
+    pm.w = 1.5
+    pf.x = np.array([0., 1., 2., 3., 4., 1.])
+    pf.y = np.array([1., 1., 3., 1., 2., 0.])
+    pf.z = np.array([4., 2., 5., 6., 3., 0.])
+    vec_f = vectorize_calc_function(Magic_calc_vec)
+    ans = vec_f(pm.w, pf.x, pf.y, pf.z)
+    for idx in range(len(pf.x)):
+        exp = Magic_calc_vec(pm.w, pf.x[idx], pf.y[idx], pf.z[idx])
+        assert (ans[0][idx], ans[1][idx], ans[2][idx]) == exp
+    # the argument arrays are not changed by augmented assignments
+    assert np.array_equal(pf.x, np.array([0., 1., 2., 3., 4., 1.]))
+
+
+def unvectorizable_function(x, y):
+    a = 0.
+    for _ in range(3):
+        a += x
+    return a
+
+
+def test_vectorize_calc_function_raises():
+    with pytest.raises(ValueError):
+        vectorize_calc_function(unvectorizable_function)
+    with pytest.raises(ValueError):
+        vectorize_calc_function(unjittable_function1)
+
+
+def test_make_apply_function_without_jit():
+    for func, out_args in [(Magic_calc_vec, ['a', 'b', 'c']),
+                           (unvectorizable_function, ['b'])]:
+        in_args = inspect.getargspec(func).args
+        arrays = dict(a=np.zeros(4), b=np.zeros(4), c=np.zeros(4),
+                      x=np.arange(4.), y=np.ones(4), z=np.full(4, 4.))
+        arrays['w'] = 1.5
+        ap_func = make_apply_function(func, out_args, in_args,
+                                      parameters=['w'], do_jit=False)
+        ap_func(*[arrays[arg] for arg in out_args + in_args])
+        for idx in range(4):
+            scalars = [arrays[arg] if arg == 'w' else arrays[arg][idx]
+                       for arg in in_args]
+            exp = func(*scalars)
+            if len(out_args) == 1:
+                exp = (exp,)
+            for arg, val in zip(out_args, exp):
+                assert arrays[arg][idx] == val
+
+
+def test_create_fused_function_string_with_alternatives():
+    stages = [(['a'], ['x', 'y'])]
+    ans, args = create_fused_function_string(stages, [],
+                                             alternatives=[{'y': 0},
+                                                           {'x': 0}],
+                                             choose_var='a')
+    exp = ("def fused_func(x_0,x_1,x_2):\n"
+           "  for i in range(len(x_0)):\n"
+           "    v_0_0 = x_0[i]\n"
+           "    v_1_0 = x_1[i]\n"
+           "    v_2_0 = x_2[i]\n"
+           "    v_2_1 = 0.0\n"
+           "    v_0_1 = f_0(v_1_0,v_2_1)\n"
+           "    v_1_1 = 0.0\n"
+           "    v_0_2 = f_0(v_1_1,v_2_0)\n"
+           "    choice = 0\n"
+           "    lowest = v_0_1\n"
+           "    if v_0_2 < lowest:\n"
+           "      choice = 1\n"
+           "      lowest = v_0_2\n"
+           "    if choice == 0:\n"
+           "      x_2[i] = v_2_1\n"
+           "      x_0[i] = v_0_1\n"
+           "      x_1[i] = v_1_0\n"
+           "    else:\n"
+           "      x_2[i] = v_2_0\n"
+           "      x_0[i] = v_0_2\n"
+           "      x_1[i] = v_1_1\n")
+    assert ans == exp
+    assert args == ['a', 'x', 'y']
+
+
+@iterate_jit(nopython=True)
+def Magic_calc_choice(x, y, a):
+    a = max(x - 2. * y, 0.) + y
+    return a
+
+
+def test_make_fused_function_with_alternatives():
+    results = list()
+    for do_jit in [True, False]:
+        pf = Foo()
+        pf.x = np.array([1., 4., 10., 3.])
+        pf.y = np.array([2., 1., 4., 3.])
+        pf.a = np.zeros(4)
+        fused = make_fused_function([Magic_calc_choice], do_jit=do_jit,
+                                    alternatives=[{'y': 0}, {'x': 0}],
+                                    choose_var='a')
+        fused(Foo(), pf)
+        results.append(pf)
+    for pf in results:
+        # the alternative with the smaller a is chosen, the first when tied
+        assert np.array_equal(pf.a, [1., 1., 4., 3.])
+        assert np.array_equal(pf.x, [1., 0., 0., 3.])
+        assert np.array_equal(pf.y, [0., 1., 4., 0.])
+
+
+def test_load_generated_function_with_cache(tmpdir):
+    source = "def gen_func(x):\n  return x + offset\n"
+    old_cache_dir = taxcalc.decorators.CACHE_DIR
+    try:
+        set_cache_dir(str(tmpdir))
+        func, cachable = load_generated_function(source, 'gen_func',
+                                                 {'offset': 2},
+                                                 depends_on=[Magic_calc2],
+                                                 use_cache=True)
+        assert cachable
+        assert func(1) == 3
+        modules = [name for name in os.listdir(str(tmpdir))
+                   if name.startswith('taxcalc_gen_func_')]
+        assert len(modules) == 1
+        # the same source and dependencies imply the same cached module
+        func2, _ = load_generated_function(source, 'gen_func',
+                                           {'offset': 2},
+                                           depends_on=[Magic_calc2],
+                                           use_cache=True)
+        assert func2 is func
+        assert len(os.listdir(str(tmpdir))) == 1
+        set_cache_dir(None)
+        func, cachable = load_generated_function(source, 'gen_func',
+                                                 {'offset': 2},
+                                                 use_cache=True)
+        assert not cachable
+        assert func(1) == 3
+    finally:
+        set_cache_dir(old_cache_dir)
+
+
+def test_make_apply_function_with_cache(tmpdir):
+    old_cache_dir = taxcalc.decorators.CACHE_DIR
+    try:
+        set_cache_dir(str(tmpdir))
+        # do_jit=True uses the cache even when numba is not installed
+        ap_func = make_apply_function(Magic_calc2.calc_func, ['a', 'b'],
+                                      ['x', 'y', 'z'], parameters=[],
+                                      do_jit=True, nopython=True)
+        arrays = [np.zeros(5), np.zeros(5), np.ones(5), np.ones(5),
+                  np.ones(5)]
+        ap_func(*arrays)
+        assert np.array_equal(arrays[0], np.full(5, 2.0))
+        assert np.array_equal(arrays[1], np.full(5, 3.0))
+        assert any(name.startswith('taxcalc_ap_func_')
+                   for name in os.listdir(str(tmpdir)))
+    finally:
+        set_cache_dir(old_cache_dir)
+
+
+def test_policy_parameter_names_read_once(monkeypatch):
+    names = policy_parameter_names()
+    assert 'II_em' in names and '_II_em' in names
+
+    def no_default_data(*args, **kwargs):
+        raise AssertionError('policy JSON file read again')
+    monkeypatch.setattr(taxcalc.decorators.Policy, 'default_data',
+                        no_default_data)
+    assert policy_parameter_names() is names
+    decorated = iterate_jit(nopython=True)(Magic_calc_cached.calc_func)
+    assert decorated.out_args == ['a', 'b']
+
+
 @iterate_jit(nopython=True)
 def Magic_calc3(x, y, z):
     a = x + y
@@ -320,6 +707,20 @@ def test_force_no_numba():
     exp = DataFrame(data=[[2.0, 4.0]] * 5,
                     columns=["a", "b"])
     assert_frame_equal(ans, exp)
-    # Restore numba module
+    # Restore numba module and the decorators that were loaded with it
     if nmba:
         sys.modules['numba'] = nmba
+    reload_module(taxcalc.decorators)
+
+
+def test_upcast():
+    arr = np.arange(3, dtype=np.int8)
+    assert upcast(arr).dtype == np.int64
+    assert upcast(arr.astype(np.float32)).dtype == np.float64
+    arr = np.arange(3, dtype=np.float64)
+    assert upcast(arr) is arr
+    assert upcast(2) == 2
+    pf = Foo()
+    assert not compact_storage(pf)
+    pf.storage = 'compact'
+    assert compact_storage(pf)
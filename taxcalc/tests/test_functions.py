@@ -13,8 +13,12 @@ from io import StringIO
 import tempfile
 import six
 import pytest
+import numpy as np
 import pandas as pd
-from taxcalc import IncomeTaxIO, Records  # pylint: disable=import-error
+# pylint: disable=import-error
+from taxcalc import IncomeTaxIO, Records, Policy, Calculator
+from taxcalc import functions
+from taxcalc.decorators import make_vectorized_apply_function
 
 
 # for fixture args, pylint: disable=redefined-outer-name
@@ -166,6 +170,32 @@ def test_function_args_usage(tests_path):
         raise ValueError(msg)
 
 
+def test_vectorized_functions(puf_1991, weights_1991):
+    """
+    Checks that the vectorized version of each iterate_jit function in
+    functions.py produces the same results as the record-by-record version.
+    """
+    recs = Records(data=puf_1991, weights=weights_1991, start_year=2009)
+    calc = Calculator(policy=Policy(), records=recs, verbose=False)
+    calc.calc_all()
+    for fname in dir(functions):
+        func = getattr(functions, fname)
+        if not hasattr(func, 'calc_func'):
+            continue  # because func is not an iterate_jit function
+        args = list()
+        for arg in func.out_args + func.in_args:
+            if hasattr(calc.policy, arg):
+                args.append(getattr(calc.policy, arg))
+            else:
+                args.append(getattr(calc.records, arg).copy())
+        expect = func(calc.policy, calc.records)
+        ap_func = make_vectorized_apply_function(func.calc_func,
+                                                 func.out_args)
+        ap_func(*args)
+        for idx, out in enumerate(func.out_args):
+            assert np.array_equal(args[idx], expect[out].values), fname
+
+
 @pytest.yield_fixture
 def reformfile1():
     """
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from taxcalc import Policy, Records, Calculator, HouseholdCalculator
+
+
+def test_household_calculator_matches_calculator():
+    inputs = {'MARS': [1, 2, 4], 'XTOT': [1, 4, 2], 'EIC': [0, 2, 1],
+              'n24': [0, 2, 1], 'e00200p': [30000., 80000., 20000.],
+              'e00200s': [0., 40000., 0.], 'e00300': [100., 2000., 0.],
+              'e18500': [0., 9000., 0.], 'e19200': [0., 12000., 0.]}
+    hhc = HouseholdCalculator()
+    out = hhc.calculate(inputs, year=2015)
+    # compare with a Calculator using a DataFrame-based Records object
+    data = dict(inputs)
+    data['RECID'] = [1, 2, 3]
+    data['e00200'] = np.add(inputs['e00200p'], inputs['e00200s'])
+    recs = Records(data=pd.DataFrame(data), blowup_factors=None,
+                   weights=None, start_year=2015)
+    policy = Policy()
+    policy.set_year(2015)
+    calc = Calculator(policy=policy, records=recs, sync_years=False)
+    calc.calc_all()
+    for var in HouseholdCalculator.DEFAULT_OUTPUT_VARS:
+        assert np.allclose(out[var], getattr(calc.records, var))
+    # a second call for one filing unit reuses the same Calculator object
+    single = dict((name, values[1]) for name, values in inputs.items())
+    out1 = hhc.calculate(single, year=2015, output_vars=['_iitax'])
+    assert list(out1.keys()) == ['_iitax']
+    assert np.allclose(out1['_iitax'], out['_iitax'][1])
+    out2 = hhc.calculate(single, year=2015, output_vars=['_iitax'])
+    assert np.allclose(out2['_iitax'], out1['_iitax'])
+
+
+def test_household_calculator_split_vars():
+    hhc = HouseholdCalculator()
+    parts = {'MARS': [1, 2], 'e00200p': [50000., 60000.],
+             'e00900p': [10000., 0.], 'e00900s': [0., 5000.]}
+    out = hhc.calculate(parts, year=2015)
+    # a total without its parts is the taxpayer part
+    total = {'MARS': [1, 2], 'e00200': [50000., 60000.],
+             'e00900p': [10000., 0.], 'e00900s': [0., 5000.]}
+    out_total = hhc.calculate(total, year=2015)
+    assert out['_payrolltax'][0] > 0.
+    for var in HouseholdCalculator.DEFAULT_OUTPUT_VARS:
+        assert np.allclose(out_total[var], out[var])
+    # a total that is consistent with its parts is accepted
+    both = dict(parts, e00900=[10000., 5000.])
+    out_both = hhc.calculate(both, year=2015)
+    assert np.allclose(out_both['_iitax'], out['_iitax'])
+    # a total that is not the sum of its parts is an error
+    with pytest.raises(ValueError):
+        hhc.calculate(dict(parts, e00200=[50000., 80000.]), year=2015)
+    with pytest.raises(ValueError):
+        hhc.calculate(dict(parts, e00900=[10000., 0.]), year=2015)
+
+
+def test_household_calculator_errors():
+    hhc = HouseholdCalculator()
+    with pytest.raises(ValueError):
+        HouseholdCalculator(policy=dict())
+    with pytest.raises(ValueError):
+        hhc.calculate({'MARS': 1, 'no_such_var': 1.})
+    with pytest.raises(ValueError):
+        hhc.calculate({'e00200p': 1.})
+    with pytest.raises(ValueError):
+        hhc.calculate({'MARS': [1, 2], 'e00200p': [1.]})
@@ -0,0 +1,47 @@
+import os
+import json
+import tempfile
+import pytest
+from taxcalc import Policy, Records, Calculator, Profiler
+from taxcalc import profiling
+
+
+def test_profiler_records_sections(records_2009):
+    calc = Calculator(policy=Policy(), records=records_2009)
+    assert profiling.PROFILER is None
+    prof = Profiler()
+    with prof:
+        assert profiling.PROFILER is prof
+        calc.calc_all()
+        calc.calc_all()
+    assert profiling.PROFILER is None
+    report = prof.report()
+    assert report['Calculator.calc_all']['calls'] == 2
+    assert report['kernel:EITC']['calls'] == 2
+    assert 'stage:TaxInc_to_AMT_with_best_deduction' in report
+    for stats in report.values():
+        assert stats['seconds'] >= stats['compile_seconds'] >= 0.
+    # nothing is recorded when the profiler is disabled
+    calc.calc_all()
+    assert prof.report()['Calculator.calc_all']['calls'] == 2
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as jfile:
+        filename = jfile.name
+    try:
+        text = prof.to_json(filename)
+        with open(filename) as jfile:
+            assert json.load(jfile) == json.loads(text)
+    finally:
+        os.remove(filename)
+    prof.reset()
+    assert prof.report() == dict()
+
+
+@pytest.mark.skipif(not profiling.TRACEMALLOC_AVAILABLE,
+                    reason='requires tracemalloc module')
+def test_profiler_tracks_memory(records_2009):
+    calc = Calculator(policy=Policy(), records=records_2009)
+    with Profiler(track_memory=True) as prof:
+        calc.mtr()
+    report = prof.report()
+    assert report['Calculator.mtr']['calls'] == 1
+    assert 'net_bytes' in report['Calculator.mtr']
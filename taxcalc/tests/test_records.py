@@ -1,4 +1,8 @@
 import os
+import copy
+import pickle
+import shutil
+import tempfile
 import numpy as np
 from numpy.testing import assert_array_equal
 import pandas as pd
@@ -85,6 +89,16 @@ def test_read_data(csv):
         Records(data=df)
 
 
+def test_read_egg_csv():
+    bfactors = Records._read_egg_csv('blowup_factors',
+                                     Records.BLOWUP_FACTORS_FILENAME,
+                                     index_col='YEAR')
+    assert isinstance(bfactors, pd.DataFrame)
+    assert 'AGDPN' in bfactors.columns
+    with pytest.raises(ValueError):
+        Records._read_egg_csv('nothing', 'no_such_file.csv')
+
+
 def test_blowup(puf_1991, weights_1991):
     pol1 = Policy()
     assert pol1.current_year == Policy.JSON_START_YEAR
@@ -103,6 +117,228 @@ def test_blowup(puf_1991, weights_1991):
     assert calc2.records.current_year == Policy.JSON_START_YEAR
 
 
+def test_blowup_mapping(puf_1991, weights_1991):
+    rec1 = Records(data=puf_1991, weights=weights_1991, start_year=2009)
+    factors = rec1.BF.loc[2010]
+    e00200 = np.copy(rec1.e00200)
+    e00900 = np.copy(rec1.e00900)
+    rec1.e00300 = rec1.e00300 + 1.  # no longer a row of the block
+    e00300 = np.copy(rec1.e00300)
+    rec1.increment_year()
+    assert np.allclose(rec1.e00200, e00200 * factors['AWAGE'])
+    assert np.allclose(rec1.e00300, e00300 * factors['AINTS'])
+    assert np.allclose(rec1.e00900,
+                       np.where(e00900 >= 0, e00900 * factors['ASCHCI'],
+                                e00900 * factors['ASCHCL']))
+    # user-supplied mapping that blows up only two variables
+    mapping = {'e00200': 'ACPIU', 'e00900': ('AWAGE', 'ACPIM')}
+    rec2 = Records(data=puf_1991, weights=weights_1991, start_year=2009,
+                   blowup_mapping=mapping)
+    assert rec2.BLOWUP_VARS == set(mapping)
+    factors = rec2.BF.loc[2010]
+    e00200 = np.copy(rec2.e00200)
+    e00300 = np.copy(rec2.e00300)
+    e00900 = np.copy(rec2.e00900)
+    rec2.increment_year()
+    assert np.allclose(rec2.e00200, e00200 * factors['ACPIU'])
+    assert np.allclose(rec2.e00900,
+                       np.where(e00900 >= 0, e00900 * factors['AWAGE'],
+                                e00900 * factors['ACPIM']))
+    assert np.array_equal(rec2.e00300, e00300)
+    for bad_mapping in [list(), {'MARS': 'AWAGE'}, {'e00200': 1.0},
+                        {'e00200': 'NOSUCHFACTOR'}]:
+        with pytest.raises(ValueError):
+            Records(data=puf_1991, weights=weights_1991,
+                    blowup_mapping=bad_mapping)
+
+
+def test_snapshot_and_restore(puf_1991, weights_1991):
+    recs = Records(data=puf_1991, weights=weights_1991, start_year=2009)
+    e00200 = np.copy(recs.e00200)
+    snapshot = recs.snapshot(['e00200', '_iitax'])
+    recs.e00200 += 1.
+    recs._iitax.fill(9.)
+    recs.restore(snapshot)
+    assert np.array_equal(recs.e00200, e00200)
+    assert np.all(recs._iitax == 0.)
+
+
+def test_advance_to_year_and_extrapolate_from(puf_1991, weights_1991):
+    rec1 = Records(data=puf_1991, weights=weights_1991)
+    rec2 = Records(data=puf_1991, weights=weights_1991)
+    base = rec2.extrapolation_base()
+    for _ in range(2016 - Records.PUF_YEAR):
+        rec1.increment_year()
+    rec2.advance_to_year(2016)
+    assert rec2.current_year == 2016
+    for varname in Records.BLOWUP_VARS:
+        assert np.array_equal(getattr(rec1, varname), getattr(rec2, varname))
+    assert np.array_equal(rec1.s006, rec2.s006)
+    with pytest.raises(ValueError):
+        rec2.advance_to_year(2015)
+    # move back to 2013 without computing values for intervening years
+    rec3 = Records(data=puf_1991, weights=weights_1991)
+    rec3.advance_to_year(2013)
+    rec2.extrapolate_from(base, 2013)
+    assert rec2.current_year == 2013
+    for varname in Records.BLOWUP_VARS:
+        assert np.array_equal(getattr(rec3, varname), getattr(rec2, varname))
+    assert np.array_equal(rec3.s006, rec2.s006)
+    with pytest.raises(ValueError):
+        rec2.extrapolate_from(base, Records.PUF_YEAR - 1)
+
+
+def test_columnar_data(puf_1991, weights_1991):
+    dirname = tempfile.mkdtemp()
+    try:
+        Records.write_columnar_data(puf_1991, dirname)
+        rec1 = Records(data=puf_1991, weights=weights_1991)
+        rec2 = Records(data=dirname, weights=weights_1991)
+        assert rec2.dim == rec1.dim
+        assert rec2.IGNORED_VARS == rec1.IGNORED_VARS
+        for varname in Records.USABLE_READ_VARS:
+            var1 = getattr(rec1, varname)
+            var2 = getattr(rec2, varname)
+            assert var2.dtype == var1.dtype
+            assert np.allclose(var2, var1)
+        # the mapped files are the blocks of standard storage
+        blocks = rec2.column_blocks()
+        assert isinstance(blocks['float64'].base, np.memmap)
+        assert isinstance(blocks['int64'].base, np.memmap)
+        assert set(rec2._attached_vars()) == set(rec1._attached_vars())
+        # blowup changes the variables but not the columnar data files
+        e00200 = rec2.e00200.copy()
+        rec2.increment_year()
+        rec3 = Records(data=dirname, weights=weights_1991)
+        assert np.array_equal(rec3.e00200, e00200)
+        # other storage modes copy the mapped rows into their blocks
+        rec4 = Records(data=dirname, weights=weights_1991, storage='compact')
+        assert not isinstance(rec4.column_blocks()['float64'].base,
+                              np.memmap)
+        for varname in Records.USABLE_READ_VARS:
+            assert np.array_equal(getattr(rec4, varname),
+                                  getattr(rec1, varname))
+        emptydir = os.path.join(dirname, 'empty')
+        os.mkdir(emptydir)
+        with pytest.raises(ValueError):
+            Records(data=emptydir)
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_csv_cache(puf_1991, weights_1991):
+    dirname = tempfile.mkdtemp()
+    try:
+        data_path = os.path.join(dirname, 'puf.csv')
+        weights_path = os.path.join(dirname, 'weights.csv')
+        puf_1991.to_csv(data_path, index=False)
+        weights_1991.to_csv(weights_path, index=False)
+        rec1 = Records(data=data_path, weights=weights_path)
+        cache_dir = os.path.join(dirname, Records.CSV_CACHE_DIRNAME)
+        assert len(os.listdir(cache_dir)) == 4  # two caches with metadata
+        rec2 = Records(data=data_path, weights=weights_path)
+        assert np.allclose(rec2.e00200, rec1.e00200)
+        assert np.allclose(rec2.WT.values, rec1.WT.values)
+        # the blocks are the memory-mapped columnar cache
+        assert set(rec2._attached_vars()) == set(rec1._attached_vars())
+        assert isinstance(rec2.column_blocks()['float64'].base, np.memmap)
+        # a changed CSV file invalidates its cache
+        puf_1991.iloc[:10].to_csv(data_path, index=False)
+        rec3 = Records(data=data_path, weights=weights_path)
+        assert rec3.dim == 10
+        # an unchanged but touched CSV file reuses its cache
+        os.utime(data_path, None)
+        rec4 = Records(data=data_path, weights=weights_path)
+        assert rec4.dim == 10
+        assert len(os.listdir(cache_dir)) == 4
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_stacked(puf_1991, weights_1991):
+    recs = Records(data=puf_1991, weights=weights_1991, start_year=2009)
+    stacked = recs.stacked(3)
+    assert stacked.dim == 3 * recs.dim
+    assert len(stacked.WT) == 3 * len(recs.WT)
+    assert np.array_equal(stacked.e00200[recs.dim:2 * recs.dim], recs.e00200)
+    stacked.e00200[:recs.dim] += 1.
+    assert np.array_equal(stacked.e00200[recs.dim:2 * recs.dim], recs.e00200)
+    with pytest.raises(ValueError):
+        recs.stacked(0)
+
+
+def test_column_blocks(puf_1991, weights_1991):
+    recs = Records(data=puf_1991, weights=weights_1991, start_year=2009)
+    blocks = recs.column_blocks()
+    assert blocks['float64'].shape == (len(Records.FLOAT_BLOCK_VARS),
+                                       recs.dim)
+    assert blocks['int64'].shape == (len(Records.INT_BLOCK_VARS), recs.dim)
+    assert np.shares_memory(recs.e00200, blocks['float64'])
+    assert np.shares_memory(recs.MARS, blocks['int64'])
+    assert recs.e00200.flags['C_CONTIGUOUS']
+    # bulk zeroing also zeros a variable that has been replaced
+    recs.c00100.fill(1.)
+    recs.c04800 = np.ones(recs.dim)
+    recs.zero_out_changing_calculated_vars()
+    assert np.all(recs.c00100 == 0.)
+    assert np.all(recs.c04800 == 0.)
+    # snapshot copies block rows and replaced variables
+    snap = recs.snapshot(['e00200', 'MARS', 'c04800'])
+    recs.e00200 += 1.
+    recs.c04800 += 1.
+    recs.restore(snap)
+    assert np.array_equal(snap['e00200'], recs.e00200)
+    assert np.all(recs.c04800 == 0.)
+    # copies have their own blocks whose rows are their variables
+    for rcopy in [copy.deepcopy(recs),
+                  pickle.loads(pickle.dumps(recs, protocol=2))]:
+        assert np.array_equal(rcopy.e00200, recs.e00200)
+        assert np.shares_memory(rcopy.e00200,
+                                rcopy.column_blocks()['float64'])
+        assert not np.shares_memory(rcopy.e00200, blocks['float64'])
+        rcopy.e00200 += 1.
+        assert not np.array_equal(rcopy.e00200, recs.e00200)
+        rcopy.c04800 += 1.
+        rcopy.zero_out_changing_calculated_vars()
+        assert np.all(rcopy.c04800 == 0.)
+    stacked = recs.stacked(2)
+    assert np.shares_memory(stacked.e00200,
+                            stacked.column_blocks()['float64'])
+    stacked.zero_out_changing_calculated_vars()
+    assert not np.shares_memory(stacked.e00200, blocks['float64'])
+
+
+def test_compact_storage(puf_1991, weights_1991):
+    rec1 = Records(data=puf_1991, weights=weights_1991, start_year=2009)
+    rec2 = Records(data=puf_1991, weights=weights_1991, start_year=2009,
+                   storage='compact32')
+    assert rec2.storage == 'compact32'
+    assert rec2.MARS.dtype == np.int8
+    assert rec2.age_head.dtype == np.int16
+    assert rec2.RECID.dtype == np.int64
+    assert rec2.e00200.dtype == np.float32
+    assert rec2.c00100.dtype == np.float64
+    nbytes1 = sum(blk.nbytes for blk in rec1.column_blocks().values())
+    nbytes2 = sum(blk.nbytes for blk in rec2.column_blocks().values())
+    assert nbytes2 < nbytes1
+    for varname in Records.INTEGER_READ_VARS:
+        assert np.array_equal(getattr(rec1, varname), getattr(rec2, varname))
+    assert np.allclose(rec1.e00200, rec2.e00200, rtol=1e-6)
+    rec2.increment_year()
+    assert rec2.e00200.dtype == np.float32
+    rcopy = rec2.stacked(2)
+    assert rcopy.MARS.dtype == np.int8
+    with pytest.raises(ValueError):
+        Records(data=puf_1991, weights=weights_1991, storage='tiny')
+    # a variable whose values do not fit in its compact dtype is int64
+    wide_data = puf_1991.copy()
+    wide_data['XTOT'] = 1000
+    rec3 = Records(data=wide_data, weights=weights_1991, storage='compact')
+    assert rec3.XTOT.dtype == np.int64
+    assert np.all(rec3.XTOT == 1000)
+    assert rec3.MARS.dtype == np.int8
+
+
 def test_for_duplicate_names():
     varnames = set()
     for varname in Records.USABLE_READ_VARS:
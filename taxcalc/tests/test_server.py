@@ -0,0 +1,99 @@
+import threading
+import numpy as np
+import pytest
+from taxcalc import CalculatorServer, CalculatorClient
+from taxcalc import Policy, Records, Calculator, Growth
+from taxcalc import create_diagnostic_table
+
+
+REFORM = """
+{
+  "policy": {
+    "_II_em": {"2014": [5000]} // raise personal exemption amount
+  }
+}
+"""
+
+
+GROWTH_ASSUMP = """
+{
+  "behavior": {},
+  "consumption": {},
+  "growth": {"_factor_adjustment": {"2013": [0.02]}}
+}
+"""
+
+
+@pytest.fixture(scope='module')
+def server(puf_1991, weights_1991):
+    return CalculatorServer(data=puf_1991, weights=weights_1991)
+
+
+def test_server_calculate(server):
+    output = server.calculate(REFORM, year=2013, num_years=2)
+    assert sorted(output.keys()) == [2013, 2014]
+    # reform does not change 2013 taxes but lowers 2014 taxes
+    diff13 = output[2013]['difference']
+    diff14 = output[2014]['difference']
+    assert np.allclose(diff13['tax_cut'].values.astype(float), 0.)
+    assert diff14['tax_cut'].values.astype(float).sum() > 0.
+    # the shared records are returned to their start-year state
+    assert server.records.current_year == server.start_year
+    assert np.all(server.records._combined == 0.)
+    assert np.all(server.records._surtax == 0.)
+    again = server.calculate(REFORM, year=2014)
+    assert np.allclose(again[2014]['diagnostic'].values,
+                       output[2014]['diagnostic'].values)
+    with pytest.raises(ValueError):
+        server.calculate(REFORM, year=2012)
+    with pytest.raises(ValueError):
+        server.calculate('{"policy": {"_II_em": {"2014": [}}}')
+
+
+def test_server_calculate_with_growth(server, puf_1991, weights_1991):
+    # growth assumptions change the extrapolation of the records to the
+    # start year, as they do for a newly created Calculator
+    output = server.calculate(assump=GROWTH_ASSUMP, year=2014)
+    growth = Growth()
+    growth.update_growth({2013: {'_factor_adjustment': [0.02]}})
+    calc = Calculator(policy=Policy(), growth=growth, verbose=False,
+                      records=Records(data=puf_1991, weights=weights_1991))
+    calc.increment_year()
+    calc.calc_all()
+    assert np.allclose(output[2014]['diagnostic'].values,
+                       create_diagnostic_table(calc).values)
+    default = server.calculate(year=2014)
+    assert not np.allclose(output[2014]['diagnostic'].values,
+                           default[2014]['diagnostic'].values)
+    assert server.records.current_year == server.start_year
+
+
+def test_server_over_http(server):
+    httpd = server.http_server(port=0)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        client = CalculatorClient(port=httpd.server_address[1])
+        output = client.calculate(REFORM, year=2014)
+        expect = server.calculate(REFORM, year=2014)
+        assert list(output.keys()) == ['2014']
+        assert np.allclose(output['2014']['diagnostic'].values,
+                           expect[2014]['diagnostic'].values)
+        with pytest.raises(ValueError):
+            client.calculate(REFORM, year=2012)
+        # other errors are also answered, with a 500 status
+        calculate = server.calculate
+
+        def failing_calculate(**kwargs):
+            raise KeyError('missing')
+        server.calculate = failing_calculate
+        try:
+            with pytest.raises(ValueError) as err:
+                client.calculate(REFORM, year=2014)
+            assert 'KeyError' in str(err.value)
+        finally:
+            server.calculate = calculate
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
@@ -9,7 +9,7 @@ import pytest
 import numpy.testing as npt
 from pandas import DataFrame, Series
 from pandas.util.testing import assert_series_equal
-from taxcalc import Policy, Records, Behavior, Calculator
+from taxcalc import Policy, Records, Behavior, Calculator, set_num_threads
 from taxcalc.utils import *
 
 data = [[1.0, 2, 'a'],
@@ -629,6 +629,34 @@ def test_multiyear_diagnostic_table(records_2009):
     assert isinstance(adt, DataFrame)
 
 
+def test_multiyear_diagnostic_table_in_parallel(records_2009):
+    calc = Calculator(policy=Policy(), records=records_2009)
+    adt = multiyear_diagnostic_table(calc, 3)
+    padt = multiyear_diagnostic_table(calc, 3, num_workers=2)
+    assert calc.current_year == 2013
+    assert list(padt.columns) == list(adt.columns)
+    assert np.allclose(padt.values, adt.values)
+    with pytest.raises(ValueError):
+        multiyear_results(calc, [2012], create_diagnostic_table)
+    with pytest.raises(ValueError):
+        multiyear_results(calc, [2013], create_diagnostic_table,
+                          num_workers=0)
+
+
+def test_multiyear_results_after_parallel_loops(records_2009):
+    # worker processes are not forked from this process after numba has
+    # run parallel record loops, which could keep it from exiting
+    calc = Calculator(policy=Policy(), records=records_2009)
+    adt = multiyear_diagnostic_table(calc, 2)
+    try:
+        set_num_threads(2)
+        calc.calc_all()
+        padt = multiyear_diagnostic_table(calc, 2, num_workers=2)
+    finally:
+        set_num_threads(1)
+    assert np.allclose(padt.values, adt.values)
+
+
 def test_multiyear_diagnostic_table_wo_behv(records_2009):
     pol = Policy()
     reform = {
@@ -10,16 +10,16 @@ Tax-Calculator utility functions.
 
 import math
 import copy
+import multiprocessing
+import pkgutil
 from collections import defaultdict, OrderedDict
 import json
 import six
 import numpy as np
 import pandas as pd
-try:
-    BOKEH_AVAILABLE = True
-    import bokeh.plotting as bp
-except ImportError:
-    BOKEH_AVAILABLE = False
+from . import decorators
+# the bokeh package is slow to import, so it is imported only when used
+BOKEH_AVAILABLE = pkgutil.find_loader('bokeh') is not None
 
 
 STATS_COLUMNS = ['_expanded_income', 'c00100', '_standard',
@@ -621,7 +621,7 @@ def create_diagnostic_table(calc):
     return pdf
 
 
-def multiyear_diagnostic_table(calc, num_years=0):
+def multiyear_diagnostic_table(calc, num_years=0, num_workers=1):
     """
     Generate multi-year diagnostic table from specified Calculator object.
     This function leaves the specified calc object unchanged.
@@ -632,6 +632,11 @@ def multiyear_diagnostic_table(calc, num_years=0):
 
     num_years : integer (must be between 1 and number of available calc years)
 
+    num_workers : integer
+        number of worker processes used to calculate the years in parallel;
+        when num_workers is one, the years are calculated in sequence in
+        this process (see the multiyear_results function).
+
     Returns
     -------
     Pandas DataFrame object containing the multi-year diagnostic table
@@ -644,6 +649,11 @@ def multiyear_diagnostic_table(calc, num_years=0):
         msg = ('num_year={} is greater '
                'than max_num_years={}').format(num_years, max_num_years)
         raise ValueError(msg)
+    if num_workers > 1:
+        years = range(calc.current_year, calc.current_year + num_years)
+        dtlist = multiyear_results(calc, years, create_diagnostic_table,
+                                   num_workers=num_workers)
+        return pd.concat(dtlist, axis=1)
     cal = copy.deepcopy(calc)
     dtlist = list()
     for iyr in range(1, num_years + 1):
@@ -654,6 +664,107 @@ def multiyear_diagnostic_table(calc, num_years=0):
     return pd.concat(dtlist, axis=1)
 
 
+# Calculator object copied into each multiyear_results worker process
+_WORKER_CALC = None
+
+
+def _init_multiyear_worker(calc):
+    """
+    Saves the Calculator object passed to each multiyear_results worker.
+    """
+    global _WORKER_CALC  # pylint: disable=global-statement
+    _WORKER_CALC = calc
+
+
+def _multiyear_worker(args):
+    """
+    Returns result of calling func for a copy of the worker Calculator
+    object advanced to the specified year and then calculated.
+    """
+    year, func = args
+    cal = copy.deepcopy(_WORKER_CALC)
+    cal.advance_to_year(year)
+    cal.calc_all()
+    return func(cal)
+
+
+def multiyear_results(calc, years, func, num_workers=None):
+    """
+    Return list containing the result of func(cal) for each of the
+    specified years, where cal is a copy of the specified Calculator
+    object that has been advanced to that year and then calculated.
+    Because the calculations for each year depend only on the state of
+    calc, the years are calculated in parallel by a pool of num_workers
+    processes (or as many processes as there are CPUs when num_workers is
+    None), each of which jumps directly to the year it is calculating
+    using the Calculator.advance_to_year method, whose results are
+    identical to those of calling increment_year for each intervening
+    year, so the results equal those of a serial calculation.  This
+    function leaves the specified calc object unchanged.
+
+    The worker processes are started afresh (using the multiprocessing
+    spawn start method) rather than forked, and calc is pickled and sent
+    to each of them, because a process forked after numba has run
+    parallel record loops can keep this process from exiting.  So a
+    script that calls this function with more than one worker must do so
+    under an if __name__ == '__main__': guard.  Python 2 can only fork
+    worker processes, so there this function raises a ValueError when
+    parallel record loops are enabled (see the set_num_threads function).
+
+    Parameters
+    ----------
+    calc : Calculator class object
+
+    years : iterable of calendar years, none of which is before the
+        current year of calc
+
+    func : function that is passed a calculated Calculator object and
+        returns a picklable result (such as a Pandas DataFrame); it must be
+        defined at module level so that it can be sent to worker processes
+
+    num_workers : integer or None
+
+    Returns
+    -------
+    list of func results in the same order as years
+    """
+    years = list(years)
+    for year in years:
+        if year < calc.current_year or year > calc.policy.end_year:
+            msg = 'year {} is not in [{},{}] range'
+            raise ValueError(msg.format(year, calc.current_year,
+                                        calc.policy.end_year))
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    if num_workers < 1:
+        msg = 'num_workers={} is less than one'.format(num_workers)
+        raise ValueError(msg)
+    num_workers = min(num_workers, len(years))
+    if num_workers <= 1:
+        _init_multiyear_worker(calc)
+        try:
+            return [_multiyear_worker((year, func)) for year in years]
+        finally:
+            _init_multiyear_worker(None)
+    if hasattr(multiprocessing, 'get_context'):
+        context = multiprocessing.get_context('spawn')
+    elif decorators.NUM_THREADS > 1:
+        msg = ('num_workers={} cannot be used with num_threads={} '
+               'because Python 2 can only fork worker processes')
+        raise ValueError(msg.format(num_workers, decorators.NUM_THREADS))
+    else:
+        context = multiprocessing
+    pool = context.Pool(processes=num_workers,
+                        initializer=_init_multiyear_worker,
+                        initargs=(calc,))
+    try:
+        return pool.map(_multiyear_worker,
+                        [(year, func) for year in years], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def ascii_output(csv_filename, ascii_filename):
     """
     Converts csv output from Calculator into ascii output with uniform
@@ -1076,6 +1187,7 @@ def xtr_graph_plot(data,
     figure generate a vector graphics file such as an EPS file.
     """
     # pylint: disable=too-many-arguments
+    import bokeh.plotting as bp  # pylint: disable=import-error
     if title == '':
         title = data['title']
     fig = bp.figure(plot_width=width, plot_height=height, title=title)
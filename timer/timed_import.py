@@ -0,0 +1,59 @@
+"""
+Measures the wall time of "import taxcalc" in fresh Python interpreters,
+which is the start-up cost paid by every short-lived Tax-Calculator process.
+
+USAGE: python timer/timed_import.py [--runs N] [--max-seconds S]
+
+When --max-seconds is specified, the script exits with a non-zero status
+if the median import time is larger than S seconds, so that it can be used
+to track regressions in import time.
+"""
+# CODING-STYLE CHECKS:
+# pep8 --ignore=E402 timed_import.py
+# pylint --disable=locally-disabled timed_import.py
+
+from __future__ import print_function
+import argparse
+import subprocess
+import sys
+
+
+IMPORT_CODE = ('from timeit import default_timer as timer\n'
+               'start = timer()\n'
+               'import taxcalc\n'
+               'print(timer() - start)\n')
+
+
+def import_time():
+    """
+    Return seconds taken by "import taxcalc" in a new Python interpreter.
+    """
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_CODE])
+    return float(output.decode().strip().split()[-1])
+
+
+def main():
+    """
+    Contains command-line interface to the import_time function.
+    """
+    parser = argparse.ArgumentParser(
+        prog='python timer/timed_import.py',
+        description='Times "import taxcalc" in fresh Python interpreters.')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='number of interpreters to time (default 5)')
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help='largest acceptable median import time')
+    args = parser.parse_args()
+    times = sorted(import_time() for _ in range(args.runs))
+    median = times[len(times) // 2]
+    msg = ('~~~ import taxcalc takes {:.3f}s (median of {} runs; '
+           'min {:.3f}s, max {:.3f}s)')
+    print(msg.format(median, len(times), times[0], times[-1]))
+    if args.max_seconds is not None and median > args.max_seconds:
+        print('median import time exceeds {}s'.format(args.max_seconds))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())